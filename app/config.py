@@ -0,0 +1,572 @@
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Tuple
+
+# Refresh modes for cached upstream datasets
+REFRESH_MODE_BLOCKING = "blocking"      # the request that finds the cache expired waits for the refresh
+REFRESH_MODE_BACKGROUND = "background"  # stale data is served while a background task refreshes it
+REFRESH_MODES = (REFRESH_MODE_BLOCKING, REFRESH_MODE_BACKGROUND)
+
+
+@dataclass(frozen=True)
+class CacheSettings:
+    """
+    Freshness policy for a cached upstream dataset.
+
+    ttl_seconds: how long a fetched dataset counts as fresh
+    refresh_ahead_seconds: start a background refresh this long before expiry
+    stale_grace_seconds: how long past expiry stale data may still be served,
+        while revalidating or when the upstream returns an error
+    refresh_mode: REFRESH_MODE_BLOCKING or REFRESH_MODE_BACKGROUND
+    shared_path: snapshot file shared by the worker processes of one host;
+        empty keeps a private cache per worker
+    snapshot_path: file each validated dataset is saved to and restored from
+        at startup; a shared_path is already saved this way
+    """
+    ttl_seconds: float = 300.0
+    refresh_ahead_seconds: float = 30.0
+    stale_grace_seconds: float = 600.0
+    refresh_mode: str = REFRESH_MODE_BACKGROUND
+    shared_path: str = ""
+    snapshot_path: str = ""
+
+
+def env_float(name: str, default: float) -> float:
+    """
+    Reads a float from the environment, raising RuntimeError if it is malformed.
+    """
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise RuntimeError(f"{name} must be a number, got {value!r}.")
+
+
+def validate_cache_settings(settings: CacheSettings, prefix: str) -> CacheSettings:
+    """
+    Checks that a CacheSettings instance is internally consistent.
+    Raises RuntimeError naming the offending environment variable.
+    """
+    if settings.ttl_seconds <= 0:
+        raise RuntimeError(f"{prefix}_TTL_SECONDS must be greater than 0.")
+    if not 0 <= settings.refresh_ahead_seconds < settings.ttl_seconds:
+        raise RuntimeError(
+            f"{prefix}_REFRESH_AHEAD_SECONDS must be at least 0 and less than the TTL."
+        )
+    if settings.stale_grace_seconds < 0:
+        raise RuntimeError(f"{prefix}_STALE_GRACE_SECONDS must be at least 0.")
+    if settings.refresh_mode not in REFRESH_MODES:
+        raise RuntimeError(f"{prefix}_REFRESH_MODE must be one of {', '.join(REFRESH_MODES)}.")
+    for name, path in (("SHARED_PATH", settings.shared_path), ("SNAPSHOT_PATH", settings.snapshot_path)):
+        if path and not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            raise RuntimeError(f"{prefix}_{name} must be in an existing directory.")
+    if settings.shared_path and settings.snapshot_path:
+        raise RuntimeError(
+            f"Set only one of {prefix}_SHARED_PATH and {prefix}_SNAPSHOT_PATH; "
+            "the shared snapshot is already persisted."
+        )
+    return settings
+
+
+def read_cache_settings(prefix: str) -> CacheSettings:
+    """
+    Reads and validates CacheSettings from <prefix>_TTL_SECONDS,
+    <prefix>_REFRESH_AHEAD_SECONDS and the other <prefix>_* variables.
+    """
+    defaults = CacheSettings()
+    settings = CacheSettings(
+        ttl_seconds=env_float(f"{prefix}_TTL_SECONDS", defaults.ttl_seconds),
+        refresh_ahead_seconds=env_float(
+            f"{prefix}_REFRESH_AHEAD_SECONDS", defaults.refresh_ahead_seconds
+        ),
+        stale_grace_seconds=env_float(
+            f"{prefix}_STALE_GRACE_SECONDS", defaults.stale_grace_seconds
+        ),
+        refresh_mode=os.environ.get(f"{prefix}_REFRESH_MODE", defaults.refresh_mode),
+        shared_path=os.environ.get(f"{prefix}_SHARED_PATH", defaults.shared_path),
+        snapshot_path=os.environ.get(f"{prefix}_SNAPSHOT_PATH", defaults.snapshot_path),
+    )
+    return validate_cache_settings(settings, prefix)
+
+
+@lru_cache
+def get_meds_cache_settings() -> CacheSettings:
+    """
+    Reads the /meds cache settings from MEDS_CACHE_* environment variables.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    return read_cache_settings("MEDS_CACHE")
+
+
+@dataclass(frozen=True)
+class ChangesSettings:
+    """
+    Row-level change history kept for a dataset.
+
+    key_column: column that identifies a row across versions
+    history_versions: most deltas kept
+    history_rows: most added, changed and removed rows kept across all deltas;
+        the oldest deltas are dropped first
+    """
+    key_column: str = "name"
+    history_versions: int = 50
+    history_rows: int = 100000
+
+
+@lru_cache
+def get_meds_changes_settings() -> ChangesSettings:
+    """
+    Reads the /meds/changes settings from MEDS_CHANGES_* environment variables.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    defaults = ChangesSettings()
+    settings = ChangesSettings(
+        key_column=os.environ.get("MEDS_CHANGES_KEY_COLUMN") or defaults.key_column,
+        history_versions=int(env_float("MEDS_CHANGES_HISTORY_VERSIONS", defaults.history_versions)),
+        history_rows=int(env_float("MEDS_CHANGES_HISTORY_ROWS", defaults.history_rows)),
+    )
+    if settings.history_versions < 0:
+        raise RuntimeError("MEDS_CHANGES_HISTORY_VERSIONS must be at least 0.")
+    if settings.history_rows < 0:
+        raise RuntimeError("MEDS_CHANGES_HISTORY_ROWS must be at least 0.")
+    return settings
+
+
+# Limits applied to every CSV dataset unless configured otherwise
+DEFAULT_ROW_LIMIT = 10000
+DEFAULT_MAX_CSV_BYTES = 10 * 1024 * 1024
+
+_DATASET_NAME = re.compile(r"^[a-z][a-z0-9_]*$")
+
+
+@dataclass(frozen=True)
+class DatasetSource:
+    """
+    A CSV file in a private GitHub repository, served under its own route
+    with its own cache.
+
+    url: GitHub contents API URL of the file
+    route: path the dataset is served at
+    row_limit, byte_limit: parse limits, as for /meds
+    cache: freshness policy and snapshot files for this dataset
+    """
+    name: str
+    url: str
+    route: str
+    row_limit: int = DEFAULT_ROW_LIMIT
+    byte_limit: int = DEFAULT_MAX_CSV_BYTES
+    cache: CacheSettings = CacheSettings()
+
+
+def read_dataset_source(name: str) -> DatasetSource:
+    """
+    Reads one dataset from DATASET_<NAME>_* environment variables:
+    _URL (required), _ROUTE (default /datasets/<name>), _ROW_LIMIT,
+    _MAX_CSV_BYTES and the cache settings (_TTL_SECONDS and so on).
+    Raises RuntimeError if the configuration is invalid.
+    """
+    if not _DATASET_NAME.match(name):
+        raise RuntimeError(
+            f"Invalid dataset name {name!r}: use lowercase letters, digits and underscores."
+        )
+    prefix = f"DATASET_{name.upper()}"
+    url = os.environ.get(f"{prefix}_URL")
+    if not url:
+        raise RuntimeError(f"{prefix}_URL must be set in the environment.")
+    route = os.environ.get(f"{prefix}_ROUTE") or f"/datasets/{name}"
+    if not route.startswith("/"):
+        raise RuntimeError(f"{prefix}_ROUTE must start with '/'.")
+    source = DatasetSource(
+        name=name,
+        url=url,
+        route=route,
+        row_limit=int(env_float(f"{prefix}_ROW_LIMIT", DEFAULT_ROW_LIMIT)),
+        byte_limit=int(env_float(f"{prefix}_MAX_CSV_BYTES", DEFAULT_MAX_CSV_BYTES)),
+        cache=read_cache_settings(prefix),
+    )
+    if source.row_limit < 1:
+        raise RuntimeError(f"{prefix}_ROW_LIMIT must be at least 1.")
+    if source.byte_limit < 1:
+        raise RuntimeError(f"{prefix}_MAX_CSV_BYTES must be at least 1.")
+    return source
+
+
+@lru_cache
+def get_dataset_sources() -> Tuple[DatasetSource, ...]:
+    """
+    Reads the additional CSV datasets named in DATASETS (comma-separated),
+    each configured by its DATASET_<NAME>_* variables. /meds is configured
+    separately and is not listed here.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    sources = []
+    for name in os.environ.get("DATASETS", "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name == "meds" or any(source.name == name for source in sources):
+            raise RuntimeError(f"Dataset {name!r} is configured more than once.")
+        source = read_dataset_source(name)
+        if source.route == "/meds" or any(other.route == source.route for other in sources):
+            raise RuntimeError(f"Route {source.route} is used by more than one dataset.")
+        sources.append(source)
+    return tuple(sources)
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """
+    Token bucket limit for requests whose path starts with path_prefix:
+    rate tokens per second are added, up to burst tokens in total.
+    """
+    path_prefix: str
+    rate: float
+    burst: float
+
+
+# Stricter for /meds (each miss can reach GitHub), looser for type-ahead search
+# (a request per keystroke, answered from the index) and liveness checks
+DEFAULT_RATE_LIMIT_RULES = "/meds/search=10:40,/meds=2:10,/health=50:100,/=20:40"
+
+
+@dataclass(frozen=True)
+class RateLimitSettings:
+    """
+    Per-client rate limiting configuration.
+
+    rules: matched by longest path prefix
+    max_clients: most buckets kept at once; the least recently used are evicted
+    idle_seconds: buckets unused for this long are evicted
+    """
+    enabled: bool = True
+    rules: Tuple[RateLimitRule, ...] = ()
+    max_clients: int = 10000
+    idle_seconds: float = 600.0
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """
+    Reads a boolean flag from the environment ("1", "true", "yes", "on" are true).
+    """
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def parse_rate_limit_rules(value: str) -> Tuple[RateLimitRule, ...]:
+    """
+    Parses rules written as "<path prefix>=<rate per second>:<burst>", comma-separated.
+    Raises RuntimeError if a rule is malformed.
+    """
+    rules = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            path_prefix, _, limits = item.partition("=")
+            rate, _, burst = limits.partition(":")
+            rule = RateLimitRule(path_prefix.strip(), float(rate), float(burst or rate))
+        except ValueError:
+            raise RuntimeError(f"Invalid RATE_LIMIT_RULES entry: {item!r}.")
+        if not rule.path_prefix.startswith("/") or rule.rate <= 0 or rule.burst < 1:
+            raise RuntimeError(f"Invalid RATE_LIMIT_RULES entry: {item!r}.")
+        rules.append(rule)
+    return tuple(rules)
+
+
+@lru_cache
+def get_rate_limit_settings() -> RateLimitSettings:
+    """
+    Reads the rate limiting settings from RATE_LIMIT_* environment variables.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    defaults = RateLimitSettings()
+    settings = RateLimitSettings(
+        enabled=env_bool("RATE_LIMIT_ENABLED", defaults.enabled),
+        rules=parse_rate_limit_rules(os.environ.get("RATE_LIMIT_RULES", DEFAULT_RATE_LIMIT_RULES)),
+        max_clients=int(env_float("RATE_LIMIT_MAX_CLIENTS", defaults.max_clients)),
+        idle_seconds=env_float("RATE_LIMIT_IDLE_SECONDS", defaults.idle_seconds),
+    )
+    if settings.max_clients < 1:
+        raise RuntimeError("RATE_LIMIT_MAX_CLIENTS must be at least 1.")
+    if settings.idle_seconds <= 0:
+        raise RuntimeError("RATE_LIMIT_IDLE_SECONDS must be greater than 0.")
+    return settings
+
+
+@dataclass(frozen=True)
+class CompressionSettings:
+    """
+    Response compression configuration.
+
+    min_bytes: responses smaller than this are sent uncompressed
+    gzip_level, brotli_quality, zstd_level: levels for the variants of cached
+        bodies, which are compressed once per dataset version
+    dynamic_gzip_level: level for responses compressed per request
+    """
+    enabled: bool = True
+    min_bytes: int = 1024
+    gzip_level: int = 9
+    brotli_quality: int = 9
+    zstd_level: int = 12
+    dynamic_gzip_level: int = 6
+
+
+@lru_cache
+def get_compression_settings() -> CompressionSettings:
+    """
+    Reads the compression settings from COMPRESSION_* environment variables.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    defaults = CompressionSettings()
+    settings = CompressionSettings(
+        enabled=env_bool("COMPRESSION_ENABLED", defaults.enabled),
+        min_bytes=int(env_float("COMPRESSION_MIN_BYTES", defaults.min_bytes)),
+        gzip_level=int(env_float("COMPRESSION_GZIP_LEVEL", defaults.gzip_level)),
+        brotli_quality=int(env_float("COMPRESSION_BROTLI_QUALITY", defaults.brotli_quality)),
+        zstd_level=int(env_float("COMPRESSION_ZSTD_LEVEL", defaults.zstd_level)),
+        dynamic_gzip_level=int(env_float("COMPRESSION_DYNAMIC_GZIP_LEVEL", defaults.dynamic_gzip_level)),
+    )
+    if settings.min_bytes < 0:
+        raise RuntimeError("COMPRESSION_MIN_BYTES must be at least 0.")
+    for name, value, top in (
+        ("COMPRESSION_GZIP_LEVEL", settings.gzip_level, 9),
+        ("COMPRESSION_BROTLI_QUALITY", settings.brotli_quality, 11),
+        ("COMPRESSION_ZSTD_LEVEL", settings.zstd_level, 22),
+        ("COMPRESSION_DYNAMIC_GZIP_LEVEL", settings.dynamic_gzip_level, 9),
+    ):
+        if not 1 <= value <= top:
+            raise RuntimeError(f"{name} must be between 1 and {top}.")
+    return settings
+
+
+# When requests are profiled
+PROFILE_MODE_OFF = "off"          # never
+PROFILE_MODE_HEADER = "header"    # when an authenticated request sends X-Profile: 1
+PROFILE_MODE_ALWAYS = "always"    # every request, for debugging only
+PROFILE_MODES = (PROFILE_MODE_OFF, PROFILE_MODE_HEADER, PROFILE_MODE_ALWAYS)
+
+
+@dataclass(frozen=True)
+class DiagnosticsSettings:
+    """
+    Per-request timing and profiling configuration.
+
+    server_timing: add a Server-Timing header with the time spent per phase
+    profile_mode: one of PROFILE_MODES
+    profile_interval_ms: time between stack samples of a profiled request
+    profile_dir: directory profiles are saved to
+    profile_max_files: most profiles kept; the oldest are deleted
+    """
+    server_timing: bool = True
+    profile_mode: str = PROFILE_MODE_HEADER
+    profile_interval_ms: float = 5.0
+    profile_dir: str = os.path.join(tempfile.gettempdir(), "meds-api-profiles")
+    profile_max_files: int = 50
+
+
+@lru_cache
+def get_diagnostics_settings() -> DiagnosticsSettings:
+    """
+    Reads the timing and profiling settings from SERVER_TIMING_ENABLED and
+    PROFILE_* environment variables.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    defaults = DiagnosticsSettings()
+    settings = DiagnosticsSettings(
+        server_timing=env_bool("SERVER_TIMING_ENABLED", defaults.server_timing),
+        profile_mode=os.environ.get("PROFILE_MODE", defaults.profile_mode).strip().lower(),
+        profile_interval_ms=env_float("PROFILE_INTERVAL_MS", defaults.profile_interval_ms),
+        profile_dir=os.environ.get("PROFILE_DIR") or defaults.profile_dir,
+        profile_max_files=int(env_float("PROFILE_MAX_FILES", defaults.profile_max_files)),
+    )
+    if settings.profile_mode not in PROFILE_MODES:
+        raise RuntimeError(f"PROFILE_MODE must be one of {', '.join(PROFILE_MODES)}.")
+    if settings.profile_interval_ms <= 0:
+        raise RuntimeError("PROFILE_INTERVAL_MS must be greater than 0.")
+    if settings.profile_max_files < 1:
+        raise RuntimeError("PROFILE_MAX_FILES must be at least 1.")
+    return settings
+
+
+@dataclass(frozen=True)
+class GitHubSettings:
+    """
+    Timeouts and failure handling for requests to GitHub.
+
+    connect_timeout_seconds: time allowed to open a connection (or get one
+        from the pool)
+    read_timeout_seconds: longest wait for the next piece of a response
+    max_retries: retries of a request that failed with a connection error,
+        a timeout, 429 or a 5xx status; 0 disables retries
+    retry_base_seconds, retry_max_seconds: exponential backoff between
+        retries, with full jitter
+    hedge_enabled: send a second request when the first has not answered
+        within the hedge_percentile latency of recent requests
+    hedge_percentile: latency percentile (0-100) that triggers a hedge
+    hedge_min_samples: latencies observed before hedging starts
+    breaker_failures: consecutive failed requests that open the circuit
+    breaker_reset_seconds: how long an open circuit fails fast before a
+        trial request is let through
+    max_connections, max_keepalive_connections, keepalive_expiry_seconds:
+        connection pool limits of the sync and async clients
+    max_csv_bytes: streamed downloads are aborted once they exceed this
+        many bytes, unless the caller gives its own limit
+    max_concurrent_fetches: most GitHub requests in flight at once, across
+        all datasets and both clients
+    """
+    connect_timeout_seconds: float = 3.0
+    read_timeout_seconds: float = 10.0
+    max_retries: int = 2
+    retry_base_seconds: float = 0.2
+    retry_max_seconds: float = 2.0
+    hedge_enabled: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 30.0
+    max_connections: int = 10
+    max_keepalive_connections: int = 5
+    keepalive_expiry_seconds: float = 30.0
+    max_csv_bytes: int = DEFAULT_MAX_CSV_BYTES
+    max_concurrent_fetches: int = 4
+
+
+@lru_cache
+def get_github_settings() -> GitHubSettings:
+    """
+    Reads the GitHub request policies from GITHUB_* environment variables,
+    and the download size limit from MEDS_MAX_CSV_BYTES.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    defaults = GitHubSettings()
+    settings = GitHubSettings(
+        connect_timeout_seconds=env_float("GITHUB_CONNECT_TIMEOUT_SECONDS", defaults.connect_timeout_seconds),
+        read_timeout_seconds=env_float("GITHUB_READ_TIMEOUT_SECONDS", defaults.read_timeout_seconds),
+        max_retries=int(env_float("GITHUB_MAX_RETRIES", defaults.max_retries)),
+        retry_base_seconds=env_float("GITHUB_RETRY_BASE_SECONDS", defaults.retry_base_seconds),
+        retry_max_seconds=env_float("GITHUB_RETRY_MAX_SECONDS", defaults.retry_max_seconds),
+        hedge_enabled=env_bool("GITHUB_HEDGE_ENABLED", defaults.hedge_enabled),
+        hedge_percentile=env_float("GITHUB_HEDGE_PERCENTILE", defaults.hedge_percentile),
+        hedge_min_samples=int(env_float("GITHUB_HEDGE_MIN_SAMPLES", defaults.hedge_min_samples)),
+        breaker_failures=int(env_float("GITHUB_BREAKER_FAILURES", defaults.breaker_failures)),
+        breaker_reset_seconds=env_float("GITHUB_BREAKER_RESET_SECONDS", defaults.breaker_reset_seconds),
+        max_connections=int(env_float("GITHUB_MAX_CONNECTIONS", defaults.max_connections)),
+        max_keepalive_connections=int(env_float("GITHUB_MAX_KEEPALIVE", defaults.max_keepalive_connections)),
+        keepalive_expiry_seconds=env_float("GITHUB_KEEPALIVE_EXPIRY", defaults.keepalive_expiry_seconds),
+        max_csv_bytes=int(env_float("MEDS_MAX_CSV_BYTES", defaults.max_csv_bytes)),
+        max_concurrent_fetches=int(env_float("GITHUB_MAX_CONCURRENT_FETCHES", defaults.max_concurrent_fetches)),
+    )
+    for name, value in (
+        ("GITHUB_CONNECT_TIMEOUT_SECONDS", settings.connect_timeout_seconds),
+        ("GITHUB_READ_TIMEOUT_SECONDS", settings.read_timeout_seconds),
+        ("GITHUB_BREAKER_RESET_SECONDS", settings.breaker_reset_seconds),
+    ):
+        if value <= 0:
+            raise RuntimeError(f"{name} must be greater than 0.")
+    if settings.max_retries < 0:
+        raise RuntimeError("GITHUB_MAX_RETRIES must be at least 0.")
+    if not 0 <= settings.retry_base_seconds <= settings.retry_max_seconds:
+        raise RuntimeError("GITHUB_RETRY_BASE_SECONDS must be at least 0 and at most GITHUB_RETRY_MAX_SECONDS.")
+    if not 0 < settings.hedge_percentile < 100:
+        raise RuntimeError("GITHUB_HEDGE_PERCENTILE must be between 0 and 100.")
+    if settings.hedge_min_samples < 1:
+        raise RuntimeError("GITHUB_HEDGE_MIN_SAMPLES must be at least 1.")
+    if settings.breaker_failures < 1:
+        raise RuntimeError("GITHUB_BREAKER_FAILURES must be at least 1.")
+    if settings.max_connections < 1:
+        raise RuntimeError("GITHUB_MAX_CONNECTIONS must be at least 1.")
+    if settings.max_keepalive_connections < 0:
+        raise RuntimeError("GITHUB_MAX_KEEPALIVE must be at least 0.")
+    if settings.keepalive_expiry_seconds < 0:
+        raise RuntimeError("GITHUB_KEEPALIVE_EXPIRY must be at least 0.")
+    if settings.max_csv_bytes < 1:
+        raise RuntimeError("MEDS_MAX_CSV_BYTES must be at least 1.")
+    if settings.max_concurrent_fetches < 1:
+        raise RuntimeError("GITHUB_MAX_CONCURRENT_FETCHES must be at least 1.")
+    return settings
+
+
+@dataclass(frozen=True)
+class BulkheadRule:
+    """
+    Concurrency limit for requests whose path starts with path_prefix: at
+    most max_concurrent run at once, up to max_queued more wait in line, and
+    each waits at most queue_timeout_seconds before it is shed.
+    """
+    path_prefix: str
+    max_concurrent: int
+    max_queued: int
+    queue_timeout_seconds: float
+
+
+# Routes that fetch, parse or crunch numbers; cheap routes are left unlimited
+DEFAULT_BULKHEAD_RULES = "/meds=16:32:2,/datasets=16:32:2,/math=8:16:2,/batch=4:8:2"
+
+
+@dataclass(frozen=True)
+class BulkheadSettings:
+    """
+    Per-route concurrency limits and the shared threadpool.
+
+    rules: matched by longest path prefix; each rule is its own bulkhead
+    threadpool_tokens: threads shared by sync handlers and run_in_threadpool
+    """
+    enabled: bool = True
+    rules: Tuple[BulkheadRule, ...] = ()
+    threadpool_tokens: int = 40
+
+
+def parse_bulkhead_rules(value: str) -> Tuple[BulkheadRule, ...]:
+    """
+    Parses rules written as "<path prefix>=<max concurrent>:<max queued>:<queue
+    timeout seconds>", comma-separated.
+    Raises RuntimeError if a rule is malformed.
+    """
+    rules = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            path_prefix, _, limits = item.partition("=")
+            concurrent, queued, timeout = limits.split(":")
+            rule = BulkheadRule(path_prefix.strip(), int(concurrent), int(queued), float(timeout))
+        except ValueError:
+            raise RuntimeError(f"Invalid BULKHEAD_RULES entry: {item!r}.")
+        if (
+            not rule.path_prefix.startswith("/")
+            or rule.max_concurrent < 1
+            or rule.max_queued < 0
+            or rule.queue_timeout_seconds <= 0
+        ):
+            raise RuntimeError(f"Invalid BULKHEAD_RULES entry: {item!r}.")
+        if any(other.path_prefix == rule.path_prefix for other in rules):
+            raise RuntimeError(f"BULKHEAD_RULES has more than one rule for {rule.path_prefix}.")
+        rules.append(rule)
+    return tuple(rules)
+
+
+@lru_cache
+def get_bulkhead_settings() -> BulkheadSettings:
+    """
+    Reads the concurrency limits from BULKHEADS_ENABLED, BULKHEAD_RULES and
+    THREADPOOL_TOKENS.
+    Cached after the first call; tests can reset it with cache_clear().
+    """
+    defaults = BulkheadSettings()
+    settings = BulkheadSettings(
+        enabled=env_bool("BULKHEADS_ENABLED", defaults.enabled),
+        rules=parse_bulkhead_rules(os.environ.get("BULKHEAD_RULES", DEFAULT_BULKHEAD_RULES)),
+        threadpool_tokens=int(env_float("THREADPOOL_TOKENS", defaults.threadpool_tokens)),
+    )
+    if settings.threadpool_tokens < 1:
+        raise RuntimeError("THREADPOOL_TOKENS must be at least 1.")
+    return settings
@@ -1,27 +1,95 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI
 
+from app.config import (
+    get_bulkhead_settings,
+    get_compression_settings,
+    get_diagnostics_settings,
+    get_meds_cache_settings,
+    get_meds_changes_settings,
+    get_rate_limit_settings,
+)
+from app.middleware.bulkhead import BulkheadMiddleware, Bulkheads
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.diagnostics import DiagnosticsMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.rate_limit import RateLimiter, RateLimitMiddleware
+from app.routes.batch import router as batch_router
+from app.routes.datasets import router as datasets_router
 from app.routes.greet import router as greet_router
 from app.routes.health import router as health_router
 from app.routes.math import router as math_router
 from app.routes.meds import router as meds_router
+from app.routes.metrics import router as metrics_router
+from app.routes.profiles import router as profiles_router
 from app.routes.root import router as root_router
 from app.security.auth import validate_auth_config
-from app.services.github_client import validate_github_config
-
-app = FastAPI()
+from app.services.dataset_registry import DATASETS
+from app.services.github_client import (
+    close_async_http_client,
+    open_async_http_client,
+    validate_github_config,
+)
 
-# Validate configuration at startup to fail fast
-@app.on_event("startup")
-def startup_validation():
-    """Validate environment configuration at application startup."""
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Validates environment configuration at startup to fail fast, and owns the
+    shared async GitHub client for the lifetime of the application.
+    Saved dataset snapshots are restored so they can be served straight away,
+    and revalidated against GitHub in the background.
+    """
     validate_auth_config()
     validate_github_config()
+    get_meds_cache_settings()
+    get_meds_changes_settings()
+    # Threads shared by sync handlers and run_in_threadpool (parsing, serializing)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = get_bulkhead_settings().threadpool_tokens
+    await open_async_http_client()
+    DATASETS.restore()
+    try:
+        yield
+    finally:
+        await close_async_http_client()
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-route-group concurrency limits, so a degraded /meds cannot queue cheap
+# routes behind it; innermost, so rate-limited requests never take a slot
+app.state.bulkheads = Bulkheads(get_bulkhead_settings())
+app.add_middleware(BulkheadMiddleware, bulkheads=app.state.bulkheads)
+
+# Per-client token buckets, kept on app.state so they can be inspected and reset
+app.state.rate_limiter = RateLimiter(get_rate_limit_settings())
+app.add_middleware(RateLimitMiddleware, limiter=app.state.rate_limiter)
+
+# Per-request gzip for dynamic responses above the size threshold; cached
+# /meds bodies negotiate their precompressed variants and pass through untouched
+compression_settings = get_compression_settings()
+if compression_settings.enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=compression_settings.min_bytes,
+        compresslevel=compression_settings.dynamic_gzip_level
+    )
+
+# Server-Timing covers everything inside, including rate limiting and compression
+app.add_middleware(DiagnosticsMiddleware, settings=get_diagnostics_settings())
+
+# Added last so it is outermost and also sees requests rejected by the rate limiter
+app.add_middleware(MetricsMiddleware)
 
+app.include_router(batch_router)
+app.include_router(datasets_router)
 app.include_router(greet_router)
 app.include_router(health_router)
 app.include_router(math_router)
 app.include_router(meds_router)
+app.include_router(metrics_router)
+app.include_router(profiles_router)
 app.include_router(root_router)
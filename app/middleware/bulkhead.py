@@ -0,0 +1,161 @@
+import asyncio
+import math
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import BulkheadRule, BulkheadSettings
+from app.middleware.rate_limit import matches_prefix
+from app.services.metrics import register_bulkhead
+
+# Why a request was shed, as reported by http_bulkhead_shed_total
+SHED_QUEUE_FULL = "queue_full"
+SHED_TIMEOUT = "timeout"
+
+# Body of the 503 answered to shed requests
+SHED_DETAIL = "The server is busy; try again shortly."
+
+
+class Bulkhead:
+    """
+    Limits how many requests of one route group run at once, so a slow
+    route cannot take every thread and connection from the others.
+
+    Requests beyond max_concurrent wait in a FIFO queue of at most
+    max_queued, each for at most queue_timeout_seconds; anything more is
+    shed straight away. A finished request hands its slot directly to the
+    oldest waiter. All state is touched from the event loop only, so there
+    are no locks.
+    """
+
+    def __init__(self, rule: BulkheadRule):
+        self.rule = rule
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.shed: Dict[str, int] = {SHED_QUEUE_FULL: 0, SHED_TIMEOUT: 0}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """
+        Waits for a slot. Returns None once the caller holds one (and must
+        release it), or the reason the request is shed.
+        """
+        if self.active < self.rule.max_concurrent and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.rule.max_queued:
+            self.shed[SHED_QUEUE_FULL] += 1
+            return SHED_QUEUE_FULL
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.rule.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.shed[SHED_TIMEOUT] += 1
+            return SHED_TIMEOUT
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        return None
+
+    def _abandon(self, waiter: asyncio.Future):
+        """
+        Takes a waiter that gave up out of the queue. release() may already
+        have popped it, and even handed it a slot just as it timed out or
+        was cancelled; that slot is passed on.
+        """
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        elif waiter.done() and not waiter.cancelled():
+            self.release()
+
+    def release(self):
+        """
+        Frees the caller's slot, or passes it on to the oldest waiter.
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"active": self.active, "queued": self.queued, **self.shed}
+
+    def retry_after(self) -> int:
+        """
+        Seconds a shed client is told to wait: one queue timeout, rounded up.
+        """
+        return max(1, math.ceil(self.rule.queue_timeout_seconds))
+
+
+class Bulkheads:
+    """
+    The bulkheads of every configured route group. Shared by the middleware
+    and by POST /batch, which runs its sub-requests under them too.
+    """
+
+    def __init__(self, settings: BulkheadSettings):
+        self.settings = settings
+        # Longest prefix first, so the most specific rule wins
+        self.bulkheads = [
+            Bulkhead(rule)
+            for rule in sorted(settings.rules, key=lambda rule: len(rule.path_prefix), reverse=True)
+        ]
+        for bulkhead in self.bulkheads:
+            register_bulkhead(bulkhead)
+
+    def bulkhead_for(self, path: str) -> Optional[Bulkhead]:
+        """
+        Returns the bulkhead with the longest prefix matching path, or None
+        if no rule matches or bulkheads are disabled.
+        """
+        if not self.settings.enabled:
+            return None
+        for bulkhead in self.bulkheads:
+            if matches_prefix(bulkhead.rule.path_prefix, path):
+                return bulkhead
+        return None
+
+
+class BulkheadMiddleware:
+    """
+    ASGI middleware that runs each request under the bulkhead of its route
+    group (the rule with the longest matching prefix) until its response has
+    been sent, and answers 503 Service Unavailable, with Retry-After, when
+    the group is full. Paths without a rule are not limited.
+    """
+
+    def __init__(self, app: ASGIApp, bulkheads: Bulkheads):
+        self.app = app
+        self.bulkheads = bulkheads
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        bulkhead = None
+        if scope["type"] == "http":
+            bulkhead = self.bulkheads.bulkhead_for(scope["path"])
+        if bulkhead is None:
+            await self.app(scope, receive, send)
+            return
+
+        if await bulkhead.acquire() is None:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                bulkhead.release()
+            return
+
+        response = JSONResponse(
+            {"detail": SHED_DETAIL},
+            status_code=503,
+            headers={"Retry-After": str(bulkhead.retry_after())}
+        )
+        await response(scope, receive, send)
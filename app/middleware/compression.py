@@ -0,0 +1,71 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+from starlette.types import Message, Receive, Scope, Send
+
+
+def negotiated_encoding(message: Message) -> bool:
+    """
+    Returns True if the response already varies on Accept-Encoding, i.e. the
+    route chose its content coding itself (possibly identity) and the
+    response must be sent as is.
+    """
+    vary = Headers(raw=message["headers"]).get("vary", "")
+    return "accept-encoding" in (field.strip().lower() for field in vary.split(","))
+
+
+class _PassNegotiated:
+    """
+    Responder mixin that forwards responses whose coding was negotiated by
+    the route unchanged.
+    """
+    _passthrough = False
+
+    async def send_with_compression(self, message: Message):
+        if message["type"] == "http.response.start" and negotiated_encoding(message):
+            self._passthrough = True
+        if self._passthrough:
+            await self.send(message)
+        else:
+            await super().send_with_compression(message)
+
+
+class _IdentityResponder(_PassNegotiated, IdentityResponder):
+    pass
+
+
+class _GZipResponder(_PassNegotiated, GZipResponder):
+    """
+    Gzips the response, weakening a strong ETag on the way: the strong
+    validator belongs to the identity body, and a gzipped body only shares
+    its content, not its bytes.
+    """
+    _etag_weakened = False
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if not self._etag_weakened:
+            self._etag_weakened = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+        return super().apply_compression(body, more_body=more_body)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves alone responses which negotiated their own
+    content coding, such as cached /meds bodies served from precompressed
+    variants, so they keep their variant ETag and a single Vary entry.
+    Responses it gzips itself get a weak ETag (see _GZipResponder).
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        else:
+            responder = _IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
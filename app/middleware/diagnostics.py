@@ -0,0 +1,83 @@
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import PROFILE_MODE_ALWAYS, PROFILE_MODE_HEADER, PROFILE_MODE_OFF, DiagnosticsSettings
+from app.security.auth import request_username
+from app.services.profiler import SamplingProfiler, new_profile_id, save_profile
+from app.services.timing import start_request_timings
+
+logger = logging.getLogger(__name__)
+
+# Request header asking for a profile, and response header naming it
+PROFILE_REQUEST_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+class DiagnosticsMiddleware:
+    """
+    ASGI middleware that adds a Server-Timing header with the time each
+    request spent per phase (see app.services.timing), and profiles
+    requests with a SamplingProfiler when asked to (see DiagnosticsSettings).
+
+    A profile covers the request until its last body chunk is sent, is
+    saved under profile_dir and can be downloaded from /profiles/<id>; its
+    id comes back in the X-Profile-Id header. With timing and profiling
+    off, requests pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp, settings: DiagnosticsSettings):
+        self.app = app
+        self.settings = settings
+        self.enabled = settings.server_timing or settings.profile_mode != PROFILE_MODE_OFF
+
+    def _wants_profile(self, scope: Scope) -> bool:
+        mode = self.settings.profile_mode
+        if mode == PROFILE_MODE_ALWAYS:
+            return True
+        if mode != PROFILE_MODE_HEADER:
+            return False
+        headers = Headers(scope=scope)
+        if headers.get(PROFILE_REQUEST_HEADER, "").strip().lower() not in ("1", "true", "yes", "on"):
+            return False
+        # Profiles reveal code paths and cost disk space, so only for valid credentials
+        return request_username(scope) is not None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        timings = start_request_timings() if self.settings.server_timing else None
+        profiler = None
+        if self._wants_profile(scope):
+            profile_id = new_profile_id()
+            profiler = SamplingProfiler(self.settings.profile_interval_ms / 1000)
+            profiler.start()
+
+        async def send_with_diagnostics(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if timings is not None:
+                    headers.append("Server-Timing", timings.header())
+                if profiler is not None:
+                    headers[PROFILE_ID_HEADER] = profile_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_diagnostics)
+        finally:
+            if profiler is not None:
+                # Joining the sampler and writing the file block, keep them off the loop
+                await run_in_threadpool(self._save_profile, profiler, profile_id)
+
+    def _save_profile(self, profiler: SamplingProfiler, profile_id: str):
+        profiler.stop()
+        try:
+            save_profile(
+                self.settings.profile_dir, profile_id, profiler.collapsed(), self.settings.profile_max_files
+            )
+        except OSError:
+            logger.exception("Could not save profile %s.", profile_id)
@@ -0,0 +1,64 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS
+
+# Label for requests that matched no route, so unknown paths cannot grow the label set
+UNMATCHED_ROUTE = "unmatched"
+
+# Methods recorded as they are; any other method name is recorded as OTHER_METHOD
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "DELETE", "CONNECT", "OPTIONS", "TRACE", "PATCH"})
+OTHER_METHOD = "other"
+
+
+def route_label(scope: Scope) -> str:
+    """
+    Returns the path template of the route that handled the request
+    (e.g. "/greet/{name}" rather than "/greet/alice"), which the router
+    leaves in the scope.
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def method_label(scope: Scope) -> str:
+    """
+    Returns the request method, or OTHER_METHOD for non-standard ones, so
+    clients cannot grow the label set with made-up methods.
+    """
+    method = scope["method"]
+    return method if method in HTTP_METHODS else OTHER_METHOD
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that counts requests and records their latency by route
+    template, method and status. Latency runs until the last body chunk has
+    been sent, so streamed responses are measured in full.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = route_label(scope)
+            method = method_label(scope)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, route, method)
+            HTTP_REQUESTS.inc(route, method, str(status_code))
@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import RateLimitRule, RateLimitSettings
+from app.security.auth import request_username
+
+
+def matches_prefix(prefix: str, path: str) -> bool:
+    """
+    Returns whether path is prefix or below it ("/meds" matches
+    "/meds/search" but not "/medsx").
+    """
+    return prefix == "/" or path == prefix or path.startswith(prefix.rstrip("/") + "/")
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class RateLimiter:
+    """
+    Token buckets per (route rule, client), kept in least-recently-used order.
+
+    Every operation is O(1): the rule is found among a handful of prefixes,
+    the bucket is a dict lookup, and eviction only ever looks at the oldest
+    buckets. Memory is bounded by max_clients, and buckets idle for longer
+    than idle_seconds are dropped as requests come in.
+    """
+
+    def __init__(self, settings: RateLimitSettings, clock: Callable[[], float] = time.monotonic):
+        self.settings = settings
+        # Longest prefix first, so the most specific rule wins
+        self._rules = sorted(settings.rules, key=lambda rule: len(rule.path_prefix), reverse=True)
+        self._clock = clock
+        self._buckets: "OrderedDict[Tuple[str, str], _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def rule_for(self, path: str) -> Optional[RateLimitRule]:
+        """
+        Returns the rule with the longest prefix matching path, or None.
+        """
+        for rule in self._rules:
+            if matches_prefix(rule.path_prefix, path):
+                return rule
+        return None
+
+    def _evict_idle(self, now: float):
+        while self._buckets:
+            oldest = next(iter(self._buckets.values()))
+            if now - oldest.updated_at <= self.settings.idle_seconds:
+                break
+            self._buckets.popitem(last=False)
+
+    def acquire(self, client: str, path: str) -> Tuple[bool, float]:
+        """
+        Takes one token from the client's bucket for the route of path.
+
+        Args:
+            client: Key identifying the caller (e.g. "user:alice@10.0.0.1" or "ip:10.0.0.1")
+            path: Request path, used to pick the rule
+
+        Returns:
+            Whether the request is allowed, and if not, the seconds until it would be
+        """
+        rule = self.rule_for(path)
+        if rule is None:
+            return True, 0.0
+
+        now = self._clock()
+        key = (rule.path_prefix, client)
+        with self._lock:
+            self._evict_idle(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = _Bucket(rule.burst, now)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.settings.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(rule.burst, bucket.tokens + (now - bucket.updated_at) * rule.rate)
+                bucket.updated_at = now
+
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True, 0.0
+
+            self.rejected += 1
+            return False, (1 - bucket.tokens) / rule.rate
+
+    def reset(self):
+        """
+        Forgets every bucket.
+        """
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def client_key(scope: Scope) -> str:
+    """
+    Identifies the caller by client IP, together with the username when
+    valid Basic credentials are sent. The app has a single set of
+    credentials, so the IP keeps clients sharing it in separate buckets.
+    Invalid credentials fall back to the IP alone, so a flood of made-up
+    usernames cannot mint fresh buckets.
+    """
+    client = scope.get("client")
+    ip = client[0] if client else "unknown"
+    username = request_username(scope)
+    if username is not None:
+        return f"user:{username}@{ip}"
+    return f"ip:{ip}"
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware that answers 429 Too Many Requests, with Retry-After,
+    once a client has used up its token bucket for a route.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.limiter.settings.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        key = client_key(scope)
+        allowed, retry_after = self.limiter.acquire(key, scope["path"])
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            {"detail": "Too many requests."},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        await response(scope, receive, send)
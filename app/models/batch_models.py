@@ -0,0 +1,41 @@
+from typing import Any, Dict, List, Literal, Optional
+from urllib.parse import unquote
+from pydantic import BaseModel, Field, field_validator
+
+# Most sub-requests in one batch
+MAX_BATCH_REQUESTS = 20
+
+class BatchItem(BaseModel):
+    """
+    One sub-request: an API call as it would be sent on its own, with an
+    optional id that is echoed back in its response.
+    """
+    id: Optional[str] = Field(None, max_length=64)
+    method: Literal["GET", "POST"]
+    path: str = Field(pattern=r"^/", max_length=2048)
+    body: Any = None
+
+    @field_validator("method", mode="before")
+    @classmethod
+    def upper_method(cls, method: Any) -> Any:
+        return method.upper() if isinstance(method, str) else method
+
+    @field_validator("path")
+    @classmethod
+    def not_a_batch(cls, path: str) -> str:
+        # Compared as dispatched: decoded, so /%62atch cannot slip through
+        if unquote(path.split("?", 1)[0]).rstrip("/") == "/batch":
+            raise ValueError("Batches cannot contain /batch requests.")
+        return path
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(min_length=1, max_length=MAX_BATCH_REQUESTS)
+
+class BatchItemResponse(BaseModel):
+    id: Optional[str] = None
+    status: int
+    headers: Dict[str, str]
+    body: Any = None
+
+class BatchResponse(BaseModel):
+    responses: List[BatchItemResponse]
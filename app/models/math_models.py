@@ -1,5 +1,27 @@
-from typing import List
-from pydantic import BaseModel
+from typing import Annotated, List, Literal, Optional
+from pydantic import BaseModel, Field, model_validator
 
 class MathRequest(BaseModel):
-    numbers: List[float] = []
\ No newline at end of file
+    numbers: List[float] = []
+
+Operation = Literal["sum", "product", "min", "max", "mean", "variance", "quantiles"]
+
+class AggregateRequest(BaseModel):
+    """
+    One array (numbers) or several independent ones (arrays), and the
+    statistics to compute for each.
+    """
+    numbers: Optional[List[float]] = None
+    arrays: Optional[List[List[float]]] = None
+    operations: List[Operation] = Field(min_length=1)
+    quantiles: List[Annotated[float, Field(ge=0, le=1)]] = Field([0.5], min_length=1)
+    ddof: int = Field(0, ge=0)
+
+    @model_validator(mode="after")
+    def check(self):
+        if (self.numbers is None) == (self.arrays is None):
+            raise ValueError("Send either numbers or arrays.")
+        return self
+
+    def array_list(self) -> List[List[float]]:
+        return [self.numbers] if self.numbers is not None else self.arrays
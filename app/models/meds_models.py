@@ -0,0 +1,19 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+class MedsResponse(BaseModel):
+    count: int
+    items: List[Dict[str, Optional[str]]]
+    next_offset: Optional[int] = None
+
+class MedsSearchResponse(BaseModel):
+    query: str
+    count: int
+    items: List[Dict[str, Optional[str]]]
+
+class MedsChangesResponse(BaseModel):
+    since: int
+    version: int
+    added: List[Dict[str, Optional[str]]]
+    changed: List[Dict[str, Optional[str]]]
+    removed: List[str]
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import math
+from contextlib import AsyncExitStack
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.types import Message
+
+from app.middleware.bulkhead import SHED_DETAIL
+from app.middleware.rate_limit import client_key
+from app.models.batch_models import BatchItem, BatchRequest, BatchResponse
+from app.security.auth import AUTHENTICATED_USER, request_username
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Largest batch request body
+MAX_BATCH_BYTES = 1024 * 1024
+
+# Largest combined size of the sub-responses; sub-responses past it get 413
+MAX_BATCH_RESPONSE_BYTES = 32 * 1024 * 1024
+
+# Sub-requests of one batch running at once
+BATCH_CONCURRENCY = 4
+
+# Response headers that describe the sub-response's own framing
+_DROPPED_HEADERS = frozenset({"content-length", "transfer-encoding"})
+
+
+class _ResponseTooLarge(Exception):
+    pass
+
+
+class _ResponseBudget:
+    """
+    Bytes of sub-response body the rest of a batch may still produce.
+    """
+
+    def __init__(self, limit: int):
+        self.remaining = limit
+
+    def spend(self, size: int):
+        self.remaining -= size
+        if self.remaining < 0:
+            raise _ResponseTooLarge()
+
+
+async def _read_batch(request: Request) -> BatchRequest:
+    """
+    Reads and validates the batch, failing with 413 past MAX_BATCH_BYTES and
+    with the same 422 as a body parameter would for an invalid batch.
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BATCH_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                detail=f"Batch body exceeds {MAX_BATCH_BYTES} bytes."
+            )
+    if not body:
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    try:
+        return BatchRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+
+def _sub_scope(request: Request, item: BatchItem, body: bytes, username: Optional[str]) -> Dict[str, Any]:
+    """
+    Builds the ASGI scope of a sub-request: the batch's connection details
+    with the item's method, path and body. Credentials are not passed on;
+    the username the batch verified is.
+    """
+    path, _, query = item.path.partition("?")
+    headers: List[Tuple[bytes, bytes]] = [
+        (b"host", request.headers.get("host", "").encode("latin-1")),
+        (b"accept", b"application/json"),
+    ]
+    if body:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": item.method,
+        "scheme": request.url.scheme,
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": unquote(path),
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+        "app": request.app,
+        "state": dict(request.scope.get("state", {})),
+        # Lets the routes' HTTPException and validation handlers answer as usual
+        "starlette.exception_handlers": request.scope["starlette.exception_handlers"],
+    }
+    if username is not None:
+        scope[AUTHENTICATED_USER] = username
+    return scope
+
+
+def _item_response(
+    item: BatchItem,
+    status_code: int,
+    headers: Dict[str, str],
+    body: bytes
+) -> Dict[str, Any]:
+    """
+    Returns one entry of the envelope. JSON bodies are embedded as they are,
+    without being parsed again; other bodies become strings.
+    """
+    if not body:
+        content = None
+    elif headers.get("content-type", "").startswith("application/json"):
+        content = orjson.Fragment(body)
+    else:
+        content = body.decode("utf-8", "replace")
+    return {"id": item.id, "status": status_code, "headers": headers, "body": content}
+
+
+def _error_response(item: BatchItem, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+    return {"id": item.id, "status": status_code, "headers": headers or {}, "body": {"detail": detail}}
+
+
+async def _dispatch(
+    request: Request,
+    item: BatchItem,
+    username: Optional[str],
+    budget: _ResponseBudget
+) -> Dict[str, Any]:
+    """
+    Runs one sub-request through the app's router and collects its response.
+    """
+    body = b"" if item.body is None else orjson.dumps(item.body)
+    finished = asyncio.Event()
+    sent_body = False
+    status_code = 500
+    headers: Dict[str, str] = {}
+    chunks: List[bytes] = []
+
+    async def receive() -> Message:
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Only report a disconnect once the response is complete, or
+        # streaming responses that listen for one would stop early
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            for key, value in message.get("headers", []):
+                name = key.decode("latin-1").lower()
+                if name not in _DROPPED_HEADERS:
+                    headers[name] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            budget.spend(len(chunk))
+            chunks.append(chunk)
+
+    scope = _sub_scope(request, item, body, username)
+    try:
+        # What FastAPI's own middleware provides each request for cleanups
+        async with AsyncExitStack() as stack:
+            scope["fastapi_middleware_astack"] = stack
+            await request.app.router(scope, receive, send)
+    except _ResponseTooLarge:
+        return _error_response(
+            item, status.HTTP_413_CONTENT_TOO_LARGE,
+            f"The batch's responses exceed {MAX_BATCH_RESPONSE_BYTES} bytes."
+        )
+    except StarletteHTTPException as e:
+        # Raised by the router itself for unknown paths and methods
+        return _error_response(item, e.status_code, e.detail, e.headers)
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed.", item.method, item.path)
+        return _error_response(item, status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal Server Error")
+    finally:
+        finished.set()
+    return _item_response(item, status_code, headers, b"".join(chunks))
+
+
+@router.post(
+    "/batch",
+    response_class=Response,
+    responses={200: {"model": BatchResponse}},
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": BatchRequest.model_json_schema()}
+    }}}
+)
+async def batch(request: Request):
+    """
+    Runs up to MAX_BATCH_REQUESTS API calls in one request and returns
+    their responses in one envelope, in request order, each with its own
+    status.
+
+    Credentials sent with the batch are checked once (invalid ones fail the
+    whole batch with 401) and hold for every sub-request; without them,
+    protected sub-requests get their own 401. Sub-requests run through the
+    app's routers, BATCH_CONCURRENCY at a time. Each one is charged to the
+    caller's rate limit and runs under the bulkhead of its path, so a batch
+    costs as much as the calls it contains and gets 503 for calls whose
+    route group is full.
+    """
+    payload = await _read_batch(request)
+
+    username = request_username(request.scope)
+    if request.headers.get("authorization") and username is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials.",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+
+    bulkheads = getattr(request.app.state, "bulkheads", None)
+    limiter = getattr(request.app.state, "rate_limiter", None)
+    if limiter is not None and not limiter.settings.enabled:
+        limiter = None
+    client = client_key(request.scope)
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    budget = _ResponseBudget(MAX_BATCH_RESPONSE_BYTES)
+
+    async def run(item: BatchItem) -> Dict[str, Any]:
+        path = unquote(item.path.partition("?")[0])
+        if limiter is not None:
+            allowed, retry_after = limiter.acquire(client, path)
+            if not allowed:
+                return _error_response(
+                    item, status.HTTP_429_TOO_MANY_REQUESTS, "Too many requests.",
+                    {"retry-after": str(max(1, math.ceil(retry_after)))}
+                )
+        async with slots:
+            # Sub-requests bypass the middleware, so take their route group's
+            # bulkhead slot here; otherwise a batch could exceed its cap
+            bulkhead = bulkheads.bulkhead_for(path) if bulkheads is not None else None
+            if bulkhead is None:
+                return await _dispatch(request, item, username, budget)
+            if await bulkhead.acquire() is not None:
+                return _error_response(
+                    item, status.HTTP_503_SERVICE_UNAVAILABLE, SHED_DETAIL,
+                    {"retry-after": str(bulkhead.retry_after())}
+                )
+            try:
+                return await _dispatch(request, item, username, budget)
+            finally:
+                bulkhead.release()
+
+    responses = await asyncio.gather(*(run(item) for item in payload.requests))
+    return Response(orjson.dumps({"responses": responses}), media_type="application/json")
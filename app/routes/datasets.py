@@ -0,0 +1,57 @@
+from typing import Iterable, Optional
+from fastapi import APIRouter, Depends, Query, Request
+from app.config import DatasetSource, get_dataset_sources
+from app.models.meds_models import MedsResponse
+from app.routes.meds import ALTERNATE_CONTENT, MAX_PAGE_SIZE, dataset_response
+from app.security.auth import verify_credentials
+from app.services.dataset_cache import DatasetCache
+from app.services.dataset_registry import DATASETS, DatasetRegistry, source_dataset_cache
+
+def _dataset_endpoint(source: DatasetSource, cache: DatasetCache):
+    async def get_dataset(
+        request: Request,
+        offset: int = Query(0, ge=0, description="Number of matching rows to skip."),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum rows to return."),
+        fields: Optional[str] = Query(None, description="Comma-separated columns to include."),
+        _: bool = Depends(verify_credentials)
+    ):
+        return await dataset_response(request, await cache.get_async(), offset, limit, fields)
+
+    get_dataset.__doc__ = (
+        f"Protected endpoint that returns the {source.name} dataset from the private "
+        "GitHub repository. Caching, filters, pagination and formats work as for /meds."
+    )
+    return get_dataset
+
+def build_datasets_router(
+    sources: Iterable[DatasetSource],
+    registry: DatasetRegistry = DATASETS
+) -> APIRouter:
+    """
+    Registers a cache for every configured dataset and serves each at its route.
+
+    Args:
+        sources: Datasets to serve, e.g. get_dataset_sources()
+        registry: Registry the caches are added to
+
+    Returns:
+        APIRouter with one GET route per dataset
+    """
+    router = APIRouter()
+    for source in sources:
+        cache = registry.register(source_dataset_cache(source))
+        router.add_api_route(
+            source.route,
+            _dataset_endpoint(source, cache),
+            methods=["GET"],
+            name=f"get_{source.name}",
+            response_model=MedsResponse,
+            responses={
+                200: {"content": ALTERNATE_CONTENT},
+                406: {"description": "None of the supported media types is acceptable."}
+            }
+        )
+    return router
+
+# Datasets configured with DATASETS and DATASET_<NAME>_* (see app.config)
+router = build_datasets_router(get_dataset_sources())
@@ -5,10 +5,10 @@ from app.models.greet_models import GreetRequest
 router = APIRouter()
 
 @router.get("/greet")
-def greet(name: str = "stranger"):
+async def greet(name: str = "stranger"):
     return {"message": f"Hello, {name}!"}
 
 
 @router.post("/greet")
-def greet_post(request: GreetRequest):
+async def greet_post(request: GreetRequest):
     return {"message": f"Hello, {request.name}!"}
\ No newline at end of file
@@ -3,5 +3,5 @@ from fastapi import APIRouter
 router = APIRouter()
 
 @router.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
\ No newline at end of file
@@ -1,9 +1,52 @@
-from fastapi import APIRouter
+import math
+from typing import AsyncIterator, List, Literal, Optional, Type, TypeVar
 
-from app.models.math_models import MathRequest
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from app.models.math_models import AggregateRequest, MathRequest, Operation
+from app.services.number_arrays import (
+    AGGREGATE_OPERATIONS,
+    PRECISION_EXACT,
+    PRECISION_FAST,
+    aggregate,
+    numbers_from_float64,
+    numbers_from_ndjson,
+    product_of,
+    sum_of,
+)
 
 router = APIRouter(prefix="/math")
 
+Model = TypeVar("Model", bound=BaseModel)
+
+# Request body formats accepted by the operations
+MEDIA_JSON = "application/json"
+MEDIA_FLOAT64 = "application/octet-stream"
+MEDIA_NDJSON = "application/x-ndjson"
+
+# Largest request body accepted, in any format
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Inputs with more values than this are reduced in the threadpool, off the event loop
+_INLINE_VALUES = 65536
+
+def _request_body(model: Type[BaseModel]) -> dict:
+    # The body is read by hand to accept several formats, so document them here
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                MEDIA_JSON: {"schema": model.model_json_schema()},
+                MEDIA_FLOAT64: {"schema": {"type": "string", "format": "binary"}},
+                MEDIA_NDJSON: {"schema": {"type": "string"}},
+            },
+        }
+    }
+
 @router.get("/")
 def math_index():
     return {
@@ -18,19 +61,174 @@ def math_index():
                 "method": "POST",
                 "path": "/math/multiply",
                 "description": "Returns the product of a list of numbers."
+            },
+            {
+                "method": "POST",
+                "path": "/math/aggregate",
+                "description": "Returns several statistics of one or more lists of numbers in one pass."
             }
         ]
     }
 
-@router.post("/add")
-def add_numbers(request: MathRequest):
-    total = sum(request.numbers)
-    return {"result": total}
+async def _limited_stream(request: Request) -> AsyncIterator[bytes]:
+    """
+    Yields the request body, raising HTTP 413 once it exceeds MAX_BODY_BYTES.
+    """
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > MAX_BODY_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                detail=f"Request body exceeds {MAX_BODY_BYTES} bytes."
+            )
+        yield chunk
+
+def _media_type(request: Request) -> str:
+    """
+    Returns the body's media type, with JSON and any application/*+json
+    type as MEDIA_JSON, as FastAPI's body parsing treats them. Other media
+    types that are neither float64 nor NDJSON are rejected with 415.
+    """
+    media_type = request.headers.get("content-type", MEDIA_JSON).split(";")[0].strip().lower()
+    if media_type.startswith("application/") and media_type.endswith("+json"):
+        return MEDIA_JSON
+    if media_type not in (MEDIA_JSON, MEDIA_FLOAT64, MEDIA_NDJSON):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Supported media types: {MEDIA_JSON}, {MEDIA_FLOAT64}, {MEDIA_NDJSON}."
+        )
+    return media_type
+
+def _bad_body(e: ValueError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=str(e)
+    )
+
+async def _read_json(request: Request, model: Type[Model]) -> Model:
+    """
+    Reads and validates a JSON body, failing with the same 422 as a body
+    parameter would.
+    """
+    body = b"".join([chunk async for chunk in _limited_stream(request)])
+    if not body:
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    try:
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+async def read_numbers(request: Request) -> np.ndarray:
+    """
+    Reads the numbers of an operation from the request body, by Content-Type:
+
+    - application/json (the default): {"numbers": [...]}, validated by MathRequest
+    - application/octet-stream: raw little-endian float64 values, used in place
+    - application/x-ndjson: one JSON number per line, parsed as it streams in
+
+    Returns:
+        float64 array of the numbers
+    """
+    media_type = _media_type(request)
+    if media_type == MEDIA_JSON:
+        return np.array((await _read_json(request, MathRequest)).numbers, dtype=np.float64)
+    try:
+        if media_type == MEDIA_NDJSON:
+            return await numbers_from_ndjson(_limited_stream(request))
+        return numbers_from_float64(b"".join([chunk async for chunk in _limited_stream(request)]))
+    except ValueError as e:
+        raise _bad_body(e)
+
+def _not_finite() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+        detail="The result is not a finite number."
+    )
+
+async def _reduce(reduce, values: np.ndarray, *args) -> dict:
+    if values.size > _INLINE_VALUES:
+        result = await run_in_threadpool(reduce, values, *args)
+    else:
+        result = reduce(values, *args)
+    if not math.isfinite(result):
+        raise _not_finite()
+    return {"result": result}
+
+@router.post("/add", openapi_extra=_request_body(MathRequest))
+async def add_numbers(
+    request: Request,
+    precision: Literal["fast", "exact"] = Query(
+        PRECISION_FAST,
+        description=f"`{PRECISION_FAST}`: vectorized pairwise summation; "
+                    f"`{PRECISION_EXACT}`: correctly rounded sum (math.fsum)."
+    )
+):
+    """
+    Returns the sum of a list of numbers, sent as JSON, raw float64 or NDJSON
+    (see read_numbers).
+    """
+    return await _reduce(sum_of, await read_numbers(request), precision)
+
+@router.post("/multiply", openapi_extra=_request_body(MathRequest))
+async def multiply_numbers(request: Request):
+    """
+    Returns the product of a list of numbers, sent as JSON, raw float64 or
+    NDJSON (see read_numbers).
+    """
+    return await _reduce(product_of, await read_numbers(request))
+
+@router.post("/aggregate", openapi_extra=_request_body(AggregateRequest))
+async def aggregate_numbers(
+    request: Request,
+    operations: Optional[List[Operation]] = Query(
+        None, description="Statistics to compute, for float64 and NDJSON bodies."
+    ),
+    quantiles: List[float] = Query(
+        [0.5], description="Quantile probabilities, for float64 and NDJSON bodies."
+    ),
+    ddof: int = Query(0, ge=0, description="Variance delta degrees of freedom, for float64 and NDJSON bodies.")
+):
+    """
+    Returns the requested statistics (sum, product, min, max, mean,
+    variance, quantiles) of each array, computed in a single pass (see
+    app.services.number_arrays.aggregate), so one request replaces a call
+    per operation.
+
+    A JSON body (AggregateRequest) holds one array (`numbers`) or several
+    (`arrays`) with the operations. A float64 or NDJSON body holds one
+    array and takes the operations from the query string.
+    """
+    if _media_type(request) == MEDIA_JSON:
+        payload = await _read_json(request, AggregateRequest)
+        arrays = [np.array(numbers, dtype=np.float64) for numbers in payload.array_list()]
+        operations, quantiles, ddof = payload.operations, payload.quantiles, payload.ddof
+    else:
+        if not operations:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail=f"Name the operations to compute: {', '.join(AGGREGATE_OPERATIONS)}."
+            )
+        if any(not 0 <= q <= 1 for q in quantiles):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail="Quantiles must be between 0 and 1."
+            )
+        arrays = [await read_numbers(request)]
+
+    def compute():
+        return [aggregate(values, operations, quantiles, ddof) for values in arrays]
 
-@router.post("/multiply")
-def multiply_numbers(request: MathRequest):
-    total = 1
-    for n in request.numbers:
-        total *= n
+    if sum(values.size for values in arrays) > _INLINE_VALUES:
+        results = await run_in_threadpool(compute)
+    else:
+        results = compute()
 
-    return {"result": total if request.numbers else 0}
+    for result in results:
+        for value in result.values():
+            values = value if isinstance(value, list) else [value]
+            if any(v is not None and not math.isfinite(v) for v in values):
+                raise _not_finite()
+    return {"results": results}
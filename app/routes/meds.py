@@ -1,65 +1,366 @@
-import time
-from functools import lru_cache
-from typing import Dict, List
-from fastapi import APIRouter, Depends
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.config import get_meds_cache_settings, get_meds_changes_settings
+from app.models.meds_models import MedsChangesResponse, MedsResponse, MedsSearchResponse
 from app.security.auth import verify_credentials
-from app.services.github_client import fetch_meds_csv
-from app.services.csv_parser import parse_meds_csv
+from app.services.binary_formats import BINARY_VARIANTS, available_media_types
+from app.services.compression import choose_encoding
+from app.services.http_caching import (
+    add_vary,
+    cached_body_response,
+    choose_media_type,
+    not_modified_response,
+    strong_etag,
+    variant_etag,
+)
+from app.services.dataset_registry import DATASETS, csv_dataset_cache
+from app.services.meds_dataset import MedsDataset
+from app.services.row_streams import iter_bytes_chunks, iter_csv_chunks, iter_ndjson_chunks
+from app.services.timing import PHASE_SERIALIZE, phase
 
 router = APIRouter()
 
-# Cache configuration
-CACHE_TTL_SECONDS = 300  # 5 minutes
-_cache_timestamp = 0
-_cached_data = None
+# Largest page a client may request from /meds
+MAX_PAGE_SIZE = 1000
 
-def get_cached_meds() -> List[Dict[str, str]]:
+# Most results a client may request from /meds/search
+MAX_SEARCH_RESULTS = 100
+
+# Query parameters of /meds that are not column filters
+_RESERVED_PARAMS = {"offset", "limit", "fields"}
+_PREFIX_SUFFIX = "__prefix"
+
+# Representations of /meds, in order of preference when the client has none
+MEDIA_JSON = "application/json"
+MEDIA_NDJSON = "application/x-ndjson"
+MEDIA_CSV = "text/csv"
+# MessagePack and Arrow are offered when their optional packages are installed
+MEDS_MEDIA_TYPES = (MEDIA_JSON, MEDIA_NDJSON, MEDIA_CSV) + available_media_types()
+
+# OpenAPI content of the representations other than JSON
+ALTERNATE_CONTENT = {media_type: {} for media_type in MEDS_MEDIA_TYPES[1:]}
+
+# The representation depends on Accept, so shared caches must key on it
+_VARY = {"Vary": "Accept"}
+
+# Response header carrying the dataset version a response was built from
+VERSION_HEADER = "X-Dataset-Version"
+
+# Cache configuration comes from MEDS_CACHE_* settings (see app.config). With
+# MEDS_CACHE_SHARED_PATH set, worker processes share one fetch and one mapped
+# copy of the serialized dataset (see app.services.shared_snapshot).
+# Row-level changes between versions are kept for /meds/changes
+meds_cache = DATASETS.register(
+    csv_dataset_cache("meds", get_meds_cache_settings, changes=get_meds_changes_settings)
+)
+
+def get_meds_dataset() -> MedsDataset:
+    """
+    Returns the cached medication dataset with its pre-serialized response.
+    Freshness, refresh-ahead and stale serving follow get_meds_cache_settings().
+    Concurrent callers that find the cache due share a single refresh.
+    """
+    return meds_cache.get()
+
+async def get_meds_dataset_async() -> MedsDataset:
+    """
+    Async version of get_meds_dataset used by the /meds route.
+    """
+    return await meds_cache.get_async()
+
+def get_cached_meds() -> Sequence[Mapping[str, Optional[str]]]:
     """
     Fetches and parses medication data with caching.
-    Cache expires after CACHE_TTL_SECONDS.
+    Rows are stored compactly (see ColumnarRows) but behave like dictionaries.
     
     Returns:
-        List of medication dictionaries
+        Sequence of medication mappings
     """
-    global _cache_timestamp, _cached_data
-    
-    current_time = time.time()
-    
-    # Check if cache is valid
-    if _cached_data is not None and (current_time - _cache_timestamp) < CACHE_TTL_SECONDS:
-        return _cached_data
-    
-    # Cache miss or expired - fetch fresh data
-    csv_text = fetch_meds_csv()
+    return get_meds_dataset().rows
+
+async def get_cached_meds_async() -> Sequence[Mapping[str, Optional[str]]]:
+    """
+    Async version of get_cached_meds.
     
+    Returns:
+        Sequence of medication mappings
+    """
+    return (await get_meds_dataset_async()).rows
+
+def _column_filters(request: Request) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Splits the non-reserved query parameters into equality filters (name=...)
+    and prefix filters (name__prefix=...).
+    """
+    equals = {}
+    prefixes = {}
+    for key, value in request.query_params.items():
+        if key in _RESERVED_PARAMS:
+            continue
+        if key.endswith(_PREFIX_SUFFIX):
+            prefixes[key[:-len(_PREFIX_SUFFIX)]] = value
+        else:
+            equals[key] = value
+    return equals, prefixes
+
+def _streaming_response(
+    request: Request,
+    dataset: MedsDataset,
+    media_type: str,
+    filtered: bool,
+    equals: Dict[str, str],
+    prefixes: Dict[str, str],
+    fields: Optional[List[str]],
+    offset: int,
+    limit: Optional[int]
+) -> Response:
+    """
+    Streams the dataset as NDJSON or CSV in bounded-size chunks.
+    Unfiltered CSV passes the upstream bytes through unchanged.
+    """
+    if not filtered:
+        headers = _VARY
+        encoding = None
+        if media_type == MEDIA_CSV:
+            etag = dataset.csv_etag
+            body = dataset.csv_body
+            # Send a precompressed variant as stored, if the client accepts one
+            if dataset.csv_encodings:
+                headers = add_vary(headers, "Accept-Encoding")
+                encoding = choose_encoding(request.headers.get("accept-encoding"), dataset.csv_encodings)
+            if encoding is not None:
+                etag = variant_etag(etag, encoding)
+                body = dataset.csv_encodings[encoding]
+            chunks = iter_bytes_chunks(body)
+        else:
+            etag = variant_etag(dataset.etag, "ndjson")
+            chunks = iter_ndjson_chunks(dataset.rows)
+        not_modified = not_modified_response(request, etag, headers)
+        if not_modified is not None:
+            return not_modified
+        headers = {**headers, "ETag": etag, "X-Total-Count": str(dataset.row_count)}
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+    total, page, next_offset = dataset.select(equals, prefixes, fields, offset, limit)
+    headers = {**_VARY, "X-Total-Count": str(total)}
+    if next_offset is not None:
+        headers["X-Next-Offset"] = str(next_offset)
+    if media_type == MEDIA_CSV:
+        chunks = iter_csv_chunks(page, fields or dataset.columns)
+    else:
+        chunks = iter_ndjson_chunks(page)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+def _binary_response(
+    request: Request,
+    dataset: MedsDataset,
+    media_type: str,
+    filtered: bool,
+    equals: Dict[str, str],
+    prefixes: Dict[str, str],
+    fields: Optional[List[str]],
+    offset: int,
+    limit: Optional[int]
+) -> Response:
+    """
+    Answers with MessagePack or Arrow: the dataset's stored encoding, or an
+    encoded filtered page. The total count is also reported in
+    X-Total-Count, since an Arrow table has no room for it.
+    """
+    if not filtered:
+        body, encodings = dataset.binary_body(media_type)
+        return cached_body_response(
+            request, body, variant_etag(dataset.etag, BINARY_VARIANTS[media_type]),
+            media_type=media_type,
+            headers={**_VARY, "X-Total-Count": str(dataset.row_count)},
+            encodings=encodings
+        )
+
+    body, total, next_offset = dataset.query_binary(media_type, equals, prefixes, fields, offset, limit)
+    headers = {**_VARY, "X-Total-Count": str(total)}
+    if next_offset is not None:
+        headers["X-Next-Offset"] = str(next_offset)
+    return cached_body_response(request, body, strong_etag(body), media_type=media_type, headers=headers)
+
+async def dataset_response(
+    request: Request,
+    dataset: MedsDataset,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None
+) -> Response:
+    """
+    Answers a request for a CSV dataset: the pre-serialized JSON body, a
+    filtered page, a streamed NDJSON/CSV or a MessagePack/Arrow
+    representation, depending on the query and the Accept header (see
+    get_meds). Shared by /meds and the configured datasets. Building the
+    response is timed as the serialize phase; streamed bodies are written
+    after the headers, so the phase only covers setting them up.
+    """
+    with phase(PHASE_SERIALIZE):
+        response = await _dataset_response(request, dataset, offset, limit, fields)
+    response.headers[VERSION_HEADER] = str(dataset.version)
+    return response
+
+async def _dataset_response(
+    request: Request,
+    dataset: MedsDataset,
+    offset: int,
+    limit: Optional[int],
+    fields: Optional[str]
+) -> Response:
+    media_type = choose_media_type(request.headers.get("accept"), MEDS_MEDIA_TYPES)
+    if media_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"Supported media types: {', '.join(MEDS_MEDIA_TYPES)}."
+        )
+
+    equals, prefixes = _column_filters(request)
+    filtered = bool(equals or prefixes or fields is not None or offset or limit is not None)
+
+    if (filtered or media_type == MEDIA_NDJSON) and not dataset.is_loaded:
+        # Rows of a restored or shared snapshot are parsed on first use;
+        # keep that CPU-bound work off the event loop
+        await run_in_threadpool(lambda: dataset.index)
+    elif media_type in BINARY_VARIANTS and not filtered and not dataset.is_encoded(media_type):
+        # Encoding the whole dataset is CPU-bound too, and done once per version
+        await run_in_threadpool(dataset.binary_body, media_type)
+
+    field_list = None
+    if fields is not None:
+        field_list = [field.strip() for field in fields.split(",") if field.strip()]
+
     try:
-        meds_data = parse_meds_csv(csv_text)
+        if media_type in BINARY_VARIANTS:
+            return _binary_response(
+                request, dataset, media_type, filtered,
+                equals, prefixes, field_list, offset, limit
+            )
+
+        if media_type != MEDIA_JSON:
+            return _streaming_response(
+                request, dataset, media_type, filtered,
+                equals, prefixes, field_list, offset, limit
+            )
+
+        # Unfiltered, unpaginated requests get the pre-serialized body
+        if not filtered:
+            return cached_body_response(
+                request, dataset.body, dataset.etag,
+                headers=_VARY, encodings=dataset.body_encodings
+            )
+
+        body = dataset.query_body(equals, prefixes, field_list, offset, limit)
     except ValueError as e:
-        from fastapi import HTTPException, status
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error parsing CSV data: {str(e)}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-    
-    # Update cache
-    _cached_data = meds_data
-    _cache_timestamp = current_time
-    
-    return meds_data
+    return cached_body_response(request, body, strong_etag(body), headers=_VARY)
 
-@router.get("/meds")
-def get_meds(_: bool = Depends(verify_credentials)):
+@router.get(
+    "/meds",
+    response_model=MedsResponse,
+    responses={
+        200: {"content": ALTERNATE_CONTENT},
+        406: {"description": "None of the supported media types is acceptable."}
+    }
+)
+async def get_meds(
+    request: Request,
+    offset: int = Query(0, ge=0, description="Number of matching rows to skip."),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum rows to return."),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to include."),
+    _: bool = Depends(verify_credentials)
+):
     """
     Protected endpoint that fetches, parses, and returns the medication list
     from the private GitHub repository.
     
-    Data is cached for 5 minutes to reduce GitHub API calls and improve performance.
+    Data is cached (5 minutes by default) to reduce GitHub API calls and improve
+    performance, and refreshed in the background before it expires.
+    The JSON body is serialized once per dataset version and carries a strong
+    ETag; clients sending a matching If-None-Match get a 304 with no body.
+
+    Any other query parameter filters rows: `column=value` for an exact match,
+    `column__prefix=value` for a case-insensitive prefix. Filters are answered
+    from per-column indexes built when the dataset is loaded, and `count`
+    always reports the total number of matching rows.
+
+    With `Accept: application/x-ndjson` or `Accept: text/csv` the rows are
+    streamed incrementally instead; the total count is then reported in the
+    `X-Total-Count` header (and the next page in `X-Next-Offset`).
+
+    `Accept: application/msgpack` returns the JSON document encoded as
+    MessagePack, and `Accept: application/vnd.apache.arrow.stream` an Arrow
+    IPC stream with one string column per field. The whole dataset is
+    encoded once per version and then served from memory. JSON remains the
+    default.
+
+    Every response names the dataset version it was built from in
+    `X-Dataset-Version`, to poll `/meds/changes` with.
+    """
+    return await dataset_response(request, await get_meds_dataset_async(), offset, limit, fields)
+
+@router.get("/meds/search", response_model=MedsSearchResponse)
+async def search_meds(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Text to search medication names for."),
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_RESULTS, description="Maximum results to return."),
+    _: bool = Depends(verify_credentials)
+):
     """
+    Protected endpoint for type-ahead search over medication names.
 
-    # Get cached or fresh data
-    meds_data = get_cached_meds()
+    Results are ranked: exact matches first, then names starting with `q`,
+    names with a later word starting with `q`, names containing `q`, and
+    finally names similar to `q`, so small typos still find a match.
+    Matching is case-insensitive.
 
-    return {
-        "count": len(meds_data),
-        "items": meds_data
-    }
\ No newline at end of file
+    Answers come from a search index built with each dataset version during
+    the cache refresh, so a search never scans the rows.
+    """
+    dataset = await get_meds_dataset_async()
+    if not dataset.is_searchable:
+        # Restored or shared snapshots build the index on first use
+        await run_in_threadpool(lambda: dataset.search_index)
+    with phase(PHASE_SERIALIZE):
+        body = dataset.search_body(q, limit)
+    headers = {VERSION_HEADER: str(dataset.version)}
+    return cached_body_response(request, body, strong_etag(body), headers=headers)
+
+@router.get(
+    "/meds/changes",
+    response_model=MedsChangesResponse,
+    responses={410: {"description": "The change history does not reach back to `since`; fetch /meds instead."}}
+)
+async def get_meds_changes(
+    request: Request,
+    since: int = Query(..., ge=0, description="Dataset version the client already has."),
+    _: bool = Depends(verify_credentials)
+):
+    """
+    Protected endpoint that returns the medication rows added, changed and
+    removed since an earlier dataset version, so clients keeping a copy only
+    download what changed. Rows are matched across versions by the
+    MEDS_CHANGES_KEY_COLUMN column; removed rows are listed by that key.
+
+    If the bounded change history no longer reaches back to `since`, the
+    answer is 410 Gone and the client should fetch the whole of /meds again.
+    """
+    dataset = await get_meds_dataset_async()
+    headers = {VERSION_HEADER: str(dataset.version)}
+    with phase(PHASE_SERIALIZE):
+        body = dataset.changes_body(since)
+    if body is None:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=f"Changes since version {since} are not available; fetch /meds for a full copy.",
+            headers=headers
+        )
+    return cached_body_response(request, body, strong_etag(body), headers=headers)
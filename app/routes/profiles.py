@@ -0,0 +1,47 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.config import get_diagnostics_settings
+from app.security.auth import verify_credentials
+from app.services.profiler import list_profiles, read_profile, speedscope_profile
+
+router = APIRouter(prefix="/profiles")
+
+@router.get("")
+def get_profiles(_: bool = Depends(verify_credentials)):
+    """
+    Protected endpoint listing the saved request profiles, newest first.
+    """
+    return {"profiles": list(reversed(list_profiles(get_diagnostics_settings().profile_dir)))}
+
+@router.get("/{profile_id}")
+def get_profile(
+    profile_id: str,
+    format: Literal["collapsed", "speedscope"] = Query(
+        "collapsed", description="`collapsed` stacks for flamegraph.pl, or a `speedscope` JSON file."
+    ),
+    _: bool = Depends(verify_credentials)
+):
+    """
+    Protected endpoint that downloads a saved request profile, as collapsed
+    stacks (one "root;...;leaf count" line per stack) or as a speedscope
+    file that https://www.speedscope.app opens as a flame graph.
+    """
+    settings = get_diagnostics_settings()
+    collapsed = read_profile(settings.profile_dir, profile_id)
+    if collapsed is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No profile {profile_id!r}."
+        )
+    if format == "speedscope":
+        return JSONResponse(
+            speedscope_profile(collapsed, profile_id, settings.profile_interval_ms),
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'}
+        )
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.collapsed"'}
+    )
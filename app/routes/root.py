@@ -1,15 +1,19 @@
 from fastapi import APIRouter
+from app.config import get_dataset_sources
 
 router = APIRouter()
 
 @router.get("/")
-def root():
+async def root():
     return {
         "message": "Welcome to my API. Refer below to the resources available.",
         "resources": {
             "greet": "/greet",
             "math": "/math",
             "meds": "/meds",
-            "health": "/health"
+            "health": "/health",
+            "batch": "/batch",
+            "metrics": "/metrics",
+            **{source.name: source.route for source in get_dataset_sources()}
         }
     }
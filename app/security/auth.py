@@ -1,9 +1,23 @@
+import base64
+import binascii
 import os
 import secrets
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from starlette.datastructures import Headers
+from starlette.types import Scope
 
-security = HTTPBasic()
+from app.services.timing import PHASE_AUTH, phase
+
+# Missing credentials are reported by verify_credentials, which first checks
+# whether a batch has already verified them
+security = HTTPBasic(auto_error=False)
+
+# Scope key holding the username whose credentials were already verified for
+# this request, by middleware (see request_username) or by a batch request for
+# all of its sub-requests (see app.routes.batch); only the server can set it
+AUTHENTICATED_USER = "app.authenticated_user"
 
 def validate_auth_config():
     """
@@ -19,20 +33,30 @@ def validate_auth_config():
             "MEDS_API_USERNAME and MEDS_API_PASSWORD must be set in environment variables."
         )
 
-def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
+def verify_credentials(request: Request, credentials: Optional[HTTPBasicCredentials] = Depends(security)):
     """
     Verifies incoming Basic Auth credentials against environment variables.
-    Returns True if valid; raises HTTP 401 if invalid.
+    Returns True if valid; raises HTTP 401 if missing or invalid.
+    Sub-requests of a batch whose credentials were already verified pass.
     """
+    if request.scope.get(AUTHENTICATED_USER) is not None:
+        return True
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Basic"}
+        )
 
-    # Load expected username/password from environment
-    # These are validated at startup by validate_auth_config()
-    expected_username = os.environ.get("MEDS_API_USERNAME")
-    expected_password = os.environ.get("MEDS_API_PASSWORD")
-    
-    # Constant-time comparison to prevent timing attack
-    username_match = secrets.compare_digest(credentials.username, expected_username)
-    password_match = secrets.compare_digest(credentials.password, expected_password)
+    with phase(PHASE_AUTH):
+        # Load expected username/password from environment
+        # These are validated at startup by validate_auth_config()
+        expected_username = os.environ.get("MEDS_API_USERNAME")
+        expected_password = os.environ.get("MEDS_API_PASSWORD")
+
+        # Constant-time comparison to prevent timing attack
+        username_match = secrets.compare_digest(credentials.username, expected_username)
+        password_match = secrets.compare_digest(credentials.password, expected_password)
 
     if not (username_match and password_match):
         raise HTTPException(
@@ -41,4 +65,51 @@ def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Basic"}
         )
 
-    return True 
\ No newline at end of file
+    return True
+
+def authenticated_username(authorization: Optional[str]) -> Optional[str]:
+    """
+    Returns the username from a Basic Authorization header value if the
+    credentials are valid, otherwise None. Used outside the dependency system
+    (e.g. by middleware) where failing with 401 is not wanted.
+    """
+    if not authorization:
+        return None
+    scheme, _, encoded = authorization.partition(" ")
+    if scheme.lower() != "basic":
+        return None
+    try:
+        username, separator, password = base64.b64decode(encoded).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    if not separator:
+        return None
+
+    expected_username = os.environ.get("MEDS_API_USERNAME")
+    expected_password = os.environ.get("MEDS_API_PASSWORD")
+    if not expected_username or not expected_password:
+        return None
+
+    # Constant-time comparison to prevent timing attack
+    username_match = secrets.compare_digest(username.encode(), expected_username.encode())
+    password_match = secrets.compare_digest(password.encode(), expected_password.encode())
+    return username if username_match and password_match else None
+
+def request_username(scope: Scope) -> Optional[str]:
+    """
+    Returns the username of valid Basic credentials sent with the request,
+    otherwise None. A successful check is stored in the scope under
+    AUTHENTICATED_USER, so later middleware and verify_credentials do not
+    check the same credentials again.
+    """
+    username = scope.get(AUTHENTICATED_USER)
+    if username is not None:
+        return username
+    authorization = Headers(scope=scope).get("authorization")
+    if not authorization:
+        return None
+    with phase(PHASE_AUTH):
+        username = authenticated_username(authorization)
+    if username is not None:
+        scope[AUTHENTICATED_USER] = username
+    return username
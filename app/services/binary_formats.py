@@ -0,0 +1,63 @@
+from typing import Any, Callable, Mapping, Optional, Sequence, Tuple
+
+# msgpack and pyarrow are optional: without them their media type is not offered
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+MEDIA_MSGPACK = "application/msgpack"
+MEDIA_ARROW = "application/vnd.apache.arrow.stream"
+
+# Media type -> the token naming its variant ETag (see variant_etag)
+BINARY_VARIANTS = {MEDIA_MSGPACK: "msgpack", MEDIA_ARROW: "arrow"}
+
+
+def available_media_types() -> Tuple[str, ...]:
+    """
+    Returns the binary media types this process can produce.
+    """
+    media_types = []
+    if msgpack is not None:
+        media_types.append(MEDIA_MSGPACK)
+    if pyarrow is not None:
+        media_types.append(MEDIA_ARROW)
+    return tuple(media_types)
+
+
+def encode_msgpack(document: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Encodes a JSON-shaped document as MessagePack. default converts values
+    msgpack cannot pack itself, as orjson's default does.
+    """
+    return msgpack.packb(document, default=default)
+
+
+def encode_arrow(rows: Sequence[Mapping[str, Optional[str]]], columns: Sequence[str]) -> bytes:
+    """
+    Encodes rows as an Arrow IPC stream holding one record batch with a
+    nullable string column per entry of columns.
+
+    Columnar rows (see ColumnarRows) hand over each column list as is, so
+    the batch is built without visiting the rows one by one.
+    """
+    column_of = getattr(rows, "column", None)
+    arrays = [
+        pyarrow.array(
+            column_of(column) if column_of is not None else [row.get(column) for row in rows],
+            type=pyarrow.string()
+        )
+        for column in columns
+    ]
+    schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+    batch = pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,112 @@
+import gzip
+from typing import Dict, Mapping, Optional, Tuple
+
+from app.config import CompressionSettings, get_compression_settings
+
+# brotli and zstandard are optional: without them only gzip is offered
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """
+    Returns the content codings this process can produce.
+    """
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return tuple(encodings)
+
+
+def compress(body: bytes, encoding: str, settings: CompressionSettings) -> bytes:
+    """
+    Compresses body with one of available_encodings().
+    gzip output has a zero timestamp, so equal bodies give equal bytes.
+    """
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=settings.gzip_level, mtime=0)
+    if encoding == "br":
+        return brotli.compress(bytes(body), quality=settings.brotli_quality)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=settings.zstd_level).compress(body)
+    raise ValueError(f"Unsupported content coding: {encoding}")
+
+
+def precompress(body: bytes, settings: Optional[CompressionSettings] = None) -> Dict[str, bytes]:
+    """
+    Compresses a cached body once with every available coding.
+
+    Args:
+        body: The identity-encoded response body
+        settings: Compression settings (default: get_compression_settings())
+
+    Returns:
+        Content coding to compressed bytes; empty when compression is off or
+        the body is below min_bytes. Codings that do not shrink the body are left out.
+    """
+    settings = settings or get_compression_settings()
+    if not settings.enabled or len(body) < settings.min_bytes:
+        return {}
+    variants = {}
+    for encoding in available_encodings():
+        compressed = compress(body, encoding, settings)
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+    return variants
+
+
+def parse_accept_encoding(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """
+    Parses an Accept-Encoding header into coding -> quality (lowercased).
+    """
+    qualities = {}
+    for entry in (accept_encoding or "").split(","):
+        coding, *params = [part.strip() for part in entry.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: Optional[str], variants: Mapping[str, bytes]) -> Optional[str]:
+    """
+    Picks the stored variant to send: among the codings the client accepts
+    with the highest quality, the one with the smallest body.
+    Returns None to send the identity body.
+    """
+    if not variants or not accept_encoding:
+        return None
+    qualities = parse_accept_encoding(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+
+    best = None
+    best_key = (0.0, 0)
+    for encoding, body in variants.items():
+        quality = qualities.get(encoding, wildcard)
+        if quality <= 0:
+            continue
+        key = (quality, -len(body))
+        if best is None or key > best_key:
+            best, best_key = encoding, key
+
+    # An explicitly preferred identity wins over the compressed variants
+    if best is not None and qualities.get("identity", 0.0) > best_key[0]:
+        return None
+    return best
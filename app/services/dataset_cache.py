@@ -0,0 +1,388 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import REFRESH_MODE_BACKGROUND, CacheSettings
+from app.services.github_client import FetchResult
+from app.services.shared_snapshot import SharedSnapshotStore
+from app.services.single_flight import SingleFlight
+from app.services.timing import PHASE_CACHE, PHASE_PARSE, phase, untimed_context
+
+logger = logging.getLogger(__name__)
+
+# Strong references to fire-and-forget refresh tasks (the event loop only keeps weak ones)
+_background_tasks = set()
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    An immutable parsed dataset and the time it was last confirmed fresh.
+    The cache swaps whole snapshots, so readers never see a half-updated state.
+    etag and last_modified are the upstream validators used for conditional fetches.
+    """
+    data: Any
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class DatasetCache:
+    """
+    Caches a parsed upstream dataset with stale-while-revalidate semantics.
+
+    - Within the TTL the cached snapshot is served as is.
+    - From TTL minus refresh_ahead_seconds, the snapshot is still served and a
+      background refresh is started so it is replaced before it expires.
+    - Past the TTL, background mode keeps serving the snapshot for up to
+      stale_grace_seconds while it revalidates; blocking mode makes the caller
+      wait for the refresh.
+    - If a refresh fails with an HTTPException and the snapshot is still within
+      its grace window, the stale snapshot is served instead of the error.
+
+    Refreshes go through a SingleFlight, so one fetch runs at a time no matter
+    how many callers (threads or coroutines) find the cache due. Refreshes are
+    conditional on the snapshot's validators: a not-modified answer only
+    extends the snapshot's freshness, without re-downloading or re-parsing.
+    Fetches that stream the body into a parser return the parsed data
+    directly, and parse is then skipped.
+
+    An advance function, if given, turns each newly fetched dataset into its
+    next version, given the one it replaces (e.g. to number versions and
+    record what changed). Data adopted from a shared snapshot was already
+    advanced by the worker that published it.
+
+    Given encode/decode functions and a snapshot_path setting, every
+    validated snapshot is also saved to disk, and restore() loads it back
+    at startup so data can be served before the upstream is reached.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fetch: Callable[[Optional[str], Optional[str]], FetchResult],
+        fetch_async: Callable[[Optional[str], Optional[str]], Awaitable[FetchResult]],
+        parse: Callable[[str], Any],
+        settings: Callable[[], CacheSettings],
+        encode: Optional[Callable[[Any], Dict[str, bytes]]] = None,
+        decode: Optional[Callable[[Mapping[str, memoryview]], Any]] = None,
+        advance: Optional[Callable[[Optional[Any], Any], Any]] = None,
+    ):
+        self.name = name
+        self._fetch = fetch
+        self._fetch_async = fetch_async
+        self._parse = parse
+        self._settings = settings
+        self._encode = encode
+        self._decode = decode
+        self._advance = advance
+        self._stores: Dict[str, SharedSnapshotStore] = {}
+        self.snapshot: Optional[Snapshot] = None
+        self.flight = SingleFlight()
+        # Reads served from the snapshot vs reads that had to wait for a refresh
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.refresh_errors = 0
+        self.background_refreshes = 0
+        self.not_modified = 0
+        self.persist_errors = 0
+
+    def clear(self):
+        """
+        Drops the cached snapshot so the next call fetches fresh data.
+        """
+        self.snapshot = None
+
+    def _needs_refresh(self, snapshot: Snapshot, now: float, settings: CacheSettings) -> bool:
+        return now - snapshot.fetched_at >= settings.ttl_seconds - settings.refresh_ahead_seconds
+
+    def _within_grace(self, snapshot: Snapshot, now: float, settings: CacheSettings) -> bool:
+        return now - snapshot.fetched_at < settings.ttl_seconds + settings.stale_grace_seconds
+
+    def _plan(self, now: float) -> Tuple[Optional[Snapshot], bool]:
+        """
+        Decides how to answer a read.
+
+        Returns:
+            The snapshot to serve immediately (None if the caller must wait for
+            a refresh), and whether a background refresh should be started.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None, False
+
+        settings = self._settings()
+        if not self._needs_refresh(snapshot, now, settings):
+            return snapshot, False
+
+        age = now - snapshot.fetched_at
+        if age < settings.ttl_seconds:
+            return snapshot, True
+
+        if settings.refresh_mode == REFRESH_MODE_BACKGROUND and self._within_grace(snapshot, now, settings):
+            self.stale_served += 1
+            return snapshot, True
+
+        return None, False
+
+    def _fallback(self, snapshot: Optional[Snapshot], now: float, error: HTTPException) -> Snapshot:
+        """
+        Serves the previous snapshot if a refresh failed within the grace window,
+        otherwise re-raises the refresh error.
+        """
+        self.refresh_errors += 1
+        if snapshot is not None and self._within_grace(snapshot, now, self._settings()):
+            logger.warning(
+                "Refreshing %s failed (%s: %s); serving stale data from %.0fs ago.",
+                self.name, error.status_code, error.detail, now - snapshot.fetched_at
+            )
+            self.stale_served += 1
+            return snapshot
+        raise error
+
+    def _validators(self, snapshot: Optional[Snapshot]) -> Tuple[Optional[str], Optional[str]]:
+        if snapshot is None:
+            return None, None
+        return snapshot.etag, snapshot.last_modified
+
+    def _revalidated(self, snapshot: Optional[Snapshot], result: FetchResult, now: float) -> Snapshot:
+        """
+        Extends the current snapshot's freshness after a not-modified answer.
+        """
+        if snapshot is None:
+            # We never send validators without a snapshot, so this is an upstream bug
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Upstream returned 304 Not Modified for an unconditional request."
+            )
+        self.not_modified += 1
+        self.snapshot = replace(
+            snapshot,
+            fetched_at=result.fetched_at or now,
+            etag=result.etag,
+            last_modified=result.last_modified
+        )
+        return self.snapshot
+
+    def _store(self, path: str) -> SharedSnapshotStore:
+        store = self._stores.get(path)
+        if store is None:
+            store = self._stores.setdefault(path, SharedSnapshotStore(path))
+        return store
+
+    def _persist(self, snapshot: Snapshot):
+        """
+        Saves a validated snapshot to the snapshot_path, if one is configured.
+        Failures are logged and counted; the in-memory cache is unaffected.
+        """
+        path = self._settings().snapshot_path
+        if not path or self._encode is None:
+            return
+        try:
+            self._store(path).publish(
+                self._encode(snapshot.data),
+                snapshot.fetched_at,
+                snapshot.etag,
+                snapshot.last_modified
+            )
+        except (OSError, ValueError, TypeError) as e:
+            self.persist_errors += 1
+            logger.warning("Saving %s snapshot to %s failed: %s", self.name, path, e)
+
+    def restore(self) -> bool:
+        """
+        Loads the snapshot saved at snapshot_path (or the shared snapshot)
+        into an empty cache. Only the small header is parsed and the data is
+        mapped, so this takes milliseconds regardless of the dataset size.
+
+        A restored snapshot counts as at most just expired, however old the
+        file is: it is served (as stale data) right away, revalidated in the
+        background, and kept through upstream outages for stale_grace_seconds.
+
+        Returns:
+            Whether a snapshot was restored
+        """
+        settings = self._settings()
+        path = settings.snapshot_path or settings.shared_path
+        if not path or self._decode is None or self.snapshot is not None:
+            return False
+
+        saved = self._store(path).read()
+        if saved is None:
+            return False
+        try:
+            data = self._decode(saved.sections)
+        except (ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable %s snapshot in %s: %s", self.name, path, e)
+            return False
+
+        fetched_at = max(saved.fetched_at, time.time() - settings.ttl_seconds)
+        self.snapshot = Snapshot(data, fetched_at, saved.etag, saved.last_modified)
+        logger.info("Restored %s snapshot from %s (version %d).", self.name, path, saved.version)
+        return True
+
+    def _advanced(self, snapshot: Optional[Snapshot], result: FetchResult, data: Any) -> Any:
+        # fetched_at is only set on data taken over from a shared snapshot
+        if self._advance is None or result.fetched_at is not None:
+            return data
+        return self._advance(snapshot.data if snapshot is not None else None, data)
+
+    def _parse_timed(self, text: str) -> Any:
+        with phase(PHASE_PARSE):
+            return self._parse(text)
+
+    def _refresh(self) -> Snapshot:
+        current_time = time.time()
+        snapshot = self.snapshot
+        # Another caller may have refreshed the cache while we waited to lead
+        if snapshot is not None and not self._needs_refresh(snapshot, current_time, self._settings()):
+            return snapshot
+
+        try:
+            result = self._fetch(*self._validators(snapshot))
+            if result.not_modified:
+                snapshot = self._revalidated(snapshot, result, current_time)
+            else:
+                data = result.data if result.data is not None else self._parse_timed(result.text)
+                data = self._advanced(snapshot, result, data)
+                snapshot = self.snapshot = Snapshot(
+                    data, result.fetched_at or current_time, result.etag, result.last_modified
+                )
+        except HTTPException as e:
+            return self._fallback(snapshot, current_time, e)
+
+        self._persist(snapshot)
+        return snapshot
+
+    async def _refresh_async(self) -> Snapshot:
+        current_time = time.time()
+        snapshot = self.snapshot
+        if snapshot is not None and not self._needs_refresh(snapshot, current_time, self._settings()):
+            return snapshot
+
+        try:
+            result = await self._fetch_async(*self._validators(snapshot))
+            if result.not_modified:
+                snapshot = self._revalidated(snapshot, result, current_time)
+            else:
+                data = result.data
+                if data is None:
+                    # Parsing is CPU-bound, keep it off the event loop
+                    data = await run_in_threadpool(self._parse_timed, result.text)
+                if self._advance is not None:
+                    # Diffing against the previous version is CPU-bound too
+                    data = await run_in_threadpool(self._advanced, snapshot, result, data)
+                snapshot = self.snapshot = Snapshot(
+                    data, result.fetched_at or current_time, result.etag, result.last_modified
+                )
+        except HTTPException as e:
+            return self._fallback(snapshot, current_time, e)
+
+        # Writing the file is blocking I/O
+        await run_in_threadpool(self._persist, snapshot)
+        return snapshot
+
+    def refresh(self) -> Snapshot:
+        """
+        Refreshes the dataset now, sharing any refresh already in flight.
+        """
+        return self.flight.do(self.name, self._refresh)
+
+    async def refresh_async(self) -> Snapshot:
+        """
+        Async version of refresh.
+        """
+        return await self.flight.do_async(self.name, self._refresh_async)
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Background refresh of %s failed.", self.name)
+
+    async def _background_refresh_async(self):
+        try:
+            await self.refresh_async()
+        except Exception:
+            logger.exception("Background refresh of %s failed.", self.name)
+
+    def _start_background_refresh(self):
+        if self.flight.in_flight(self.name):
+            return
+        self.background_refreshes += 1
+        threading.Thread(
+            target=self._background_refresh,
+            name=f"{self.name}-refresh",
+            daemon=True
+        ).start()
+
+    def _start_background_refresh_async(self):
+        if self.flight.in_flight(self.name):
+            return
+        self.background_refreshes += 1
+        # Not part of the request that noticed the data was due
+        task = asyncio.get_running_loop().create_task(
+            self._background_refresh_async(), context=untimed_context()
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    def revalidate_in_background(self):
+        """
+        Starts a background refresh on the running event loop, unless one is
+        already in flight (e.g. right after restore()).
+        """
+        self._start_background_refresh_async()
+
+    def get(self) -> Any:
+        """
+        Returns the cached dataset, refreshing it according to the cache
+        settings. Timed as the request's cache phase.
+        """
+        with phase(PHASE_CACHE):
+            snapshot, revalidate = self._plan(time.time())
+            if snapshot is None:
+                self.misses += 1
+                return self.refresh().data
+            self.hits += 1
+            if revalidate:
+                self._start_background_refresh()
+            return snapshot.data
+
+    async def get_async(self) -> Any:
+        """
+        Async version of get. Background refreshes run as tasks on the current loop.
+        """
+        with phase(PHASE_CACHE):
+            snapshot, revalidate = self._plan(time.time())
+            if snapshot is None:
+                self.misses += 1
+                return (await self.refresh_async()).data
+            self.hits += 1
+            if revalidate:
+                self._start_background_refresh_async()
+            return snapshot.data
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns counters and the current snapshot age for monitoring.
+        """
+        snapshot = self.snapshot
+        return {
+            "age_seconds": None if snapshot is None else time.time() - snapshot.fetched_at,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "refresh_errors": self.refresh_errors,
+            "background_refreshes": self.background_refreshes,
+            "not_modified": self.not_modified,
+            "persist_errors": self.persist_errors,
+            **self.flight.stats(),
+        }
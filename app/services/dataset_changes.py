@@ -0,0 +1,173 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import orjson
+
+from app.config import ChangesSettings
+
+Row = Dict[str, Optional[str]]
+
+
+@dataclass(frozen=True)
+class Delta:
+    """
+    Row-level difference between two versions of a dataset.
+
+    base: version the delta applies to
+    version: version it leads to
+    key: column that identifies rows across the two versions
+    added, changed: whole rows, changed rows as they are in the new version
+    removed: key values of the rows that are gone
+    """
+    base: int
+    version: int
+    key: str
+    added: Tuple[Row, ...] = ()
+    changed: Tuple[Row, ...] = ()
+    removed: Tuple[str, ...] = ()
+
+    @property
+    def size(self) -> int:
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+
+def next_version(previous: Optional[int] = None) -> int:
+    """
+    Returns the version number of a newly loaded dataset. Numbers only ever
+    increase and start from the current Unix time, so a process that starts
+    without a saved snapshot never reuses a number handed out before it.
+    """
+    now = int(time.time())
+    return now if not previous else max(previous + 1, now)
+
+
+def _keyed(rows: Iterable[Mapping[str, Optional[str]]], key: str) -> Optional[Dict[str, Mapping[str, Optional[str]]]]:
+    keyed = {}
+    for row in rows:
+        value = row.get(key)
+        if value is None or value in keyed:
+            return None
+        keyed[value] = row
+    return keyed
+
+
+def diff_rows(
+    old_rows: Sequence[Mapping[str, Optional[str]]],
+    new_rows: Sequence[Mapping[str, Optional[str]]],
+    key: str,
+    base: int,
+    version: int
+) -> Optional[Delta]:
+    """
+    Compares two versions of a dataset row by row, matching rows on key.
+
+    Returns:
+        The Delta from base to version, or None if key is missing from a
+        version or does not identify its rows uniquely
+    """
+    old = _keyed(old_rows, key)
+    new = _keyed(new_rows, key)
+    if old is None or new is None:
+        return None
+
+    added = []
+    changed = []
+    for value, row in new.items():
+        previous = old.get(value)
+        if previous is None:
+            added.append(dict(row))
+        elif dict(previous) != dict(row):
+            changed.append(dict(row))
+    removed = tuple(value for value in old if value not in new)
+    return Delta(base, version, key, tuple(added), tuple(changed), removed)
+
+
+def extend_history(
+    history: Tuple[Delta, ...],
+    delta: Optional[Delta],
+    settings: ChangesSettings
+) -> Tuple[Delta, ...]:
+    """
+    Appends delta to the history and drops the oldest deltas beyond the
+    settings' limits. Without a delta (or with a different key column) the
+    chain is broken and the history starts over.
+    """
+    if delta is None:
+        return ()
+    deltas = list(history)
+    if deltas and (deltas[-1].version != delta.base or deltas[-1].key != delta.key):
+        deltas = []
+    deltas.append(delta)
+
+    size = sum(d.size for d in deltas)
+    while deltas and (len(deltas) > settings.history_versions or size > settings.history_rows):
+        size -= deltas.pop(0).size
+    return tuple(deltas)
+
+
+def changes_since(history: Sequence[Delta], version: int, since: int) -> Optional[Dict[str, Any]]:
+    """
+    Merges the deltas from since up to version into one, so a row changed
+    several times appears once, as it is now.
+
+    Returns:
+        {"since", "version", "added", "changed", "removed"}, or None if the
+        history does not reach back to since and the client must resync
+    """
+    start = next((i for i, delta in enumerate(history) if delta.base == since), None)
+    if since != version and start is None:
+        return None
+
+    added: Dict[str, Row] = {}
+    changed: Dict[str, Row] = {}
+    removed: Dict[str, None] = {}
+    for delta in history[start:] if start is not None else ():
+        for row in delta.added:
+            value = row[delta.key]
+            if value in removed:
+                # Removed and added back: a change relative to since
+                del removed[value]
+                changed[value] = row
+            else:
+                added[value] = row
+        for row in delta.changed:
+            value = row[delta.key]
+            if value in added:
+                added[value] = row
+            else:
+                changed[value] = row
+        for value in delta.removed:
+            if value in added:
+                del added[value]
+            else:
+                changed.pop(value, None)
+                removed[value] = None
+
+    return {
+        "since": since,
+        "version": version,
+        "added": list(added.values()),
+        "changed": list(changed.values()),
+        "removed": list(removed),
+    }
+
+
+def encode_history(history: Sequence[Delta]) -> bytes:
+    """
+    Serializes a history for a dataset snapshot.
+    """
+    return orjson.dumps([
+        [delta.base, delta.version, delta.key, delta.added, delta.changed, delta.removed]
+        for delta in history
+    ])
+
+
+def decode_history(data: bytes) -> Tuple[Delta, ...]:
+    """
+    Rebuilds a history serialized by encode_history.
+    """
+    return tuple(
+        Delta(base, version, key, tuple(added), tuple(changed), tuple(removed))
+        for base, version, key, added, changed, removed in orjson.loads(data)
+    )
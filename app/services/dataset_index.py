@@ -0,0 +1,96 @@
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+# Sorts after every real character, used as the upper bound of a prefix range
+_PREFIX_END = chr(0x10FFFF)
+
+
+class ColumnIndex:
+    """
+    Lookup structures for one column of a dataset.
+
+    exact maps each value to the ascending row positions holding it; the
+    casefolded values are also kept sorted so a case-insensitive prefix match
+    is a pair of binary searches instead of a scan.
+    """
+    __slots__ = ("exact", "_sorted_keys", "_sorted_positions")
+
+    def __init__(self, values: Iterable[Optional[str]]):
+        self.exact: Dict[str, List[int]] = {}
+        folded = []
+        for position, value in enumerate(values):
+            value = value or ""
+            self.exact.setdefault(value, []).append(position)
+            folded.append((value.casefold(), position))
+        folded.sort()
+        self._sorted_keys = [key for key, _ in folded]
+        self._sorted_positions = [position for _, position in folded]
+
+    def equal(self, value: str) -> List[int]:
+        """
+        Returns the ascending positions of rows whose value equals value.
+        """
+        return self.exact.get(value, [])
+
+    def prefix(self, value: str) -> List[int]:
+        """
+        Returns the ascending positions of rows whose value starts with value,
+        ignoring case.
+        """
+        key = value.casefold()
+        lo = bisect_left(self._sorted_keys, key)
+        hi = bisect_left(self._sorted_keys, key + _PREFIX_END, lo)
+        return sorted(self._sorted_positions[lo:hi])
+
+
+class TableIndex:
+    """
+    Per-column indexes over a list of row mappings, built once per dataset.
+    """
+
+    def __init__(self, rows: Sequence[Mapping[str, Optional[str]]], columns: Sequence[str]):
+        self.row_count = len(rows)
+        self.columns = list(columns)
+        # Compact row types expose whole columns, which avoids a view per cell
+        column_values = getattr(rows, "column", None)
+        self._indexes = {
+            column: ColumnIndex(
+                column_values(column) if column_values is not None
+                else (row.get(column) for row in rows)
+            )
+            for column in self.columns
+        }
+
+    def column(self, name: str) -> ColumnIndex:
+        """
+        Returns the index for a column, raising ValueError for unknown columns.
+        """
+        try:
+            return self._indexes[name]
+        except KeyError:
+            raise ValueError(f"Unknown column: {name}")
+
+    def select(
+        self,
+        equals: Optional[Mapping[str, str]] = None,
+        prefixes: Optional[Mapping[str, str]] = None
+    ) -> Optional[List[int]]:
+        """
+        Returns the ascending positions of rows matching every filter,
+        or None if no filters were given (i.e. all rows match).
+        Raises ValueError if a filter names an unknown column.
+        """
+        matches = [self.column(name).equal(value) for name, value in (equals or {}).items()]
+        matches += [self.column(name).prefix(value) for name, value in (prefixes or {}).items()]
+        if not matches:
+            return None
+
+        # Intersect starting from the most selective filter
+        matches.sort(key=len)
+        selected = matches[0]
+        for other in matches[1:]:
+            if not selected:
+                break
+            other_set = set(other)
+            selected = [position for position in selected if position in other_set]
+        return selected
@@ -0,0 +1,191 @@
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from fastapi import HTTPException, status
+
+from app.config import DEFAULT_ROW_LIMIT, CacheSettings, ChangesSettings, DatasetSource
+from app.services.csv_parser import parse_meds_csv_columnar, parse_meds_csv_stream
+from app.services.dataset_cache import DatasetCache
+from app.services.github_client import fetch_meds_csv_streaming, fetch_meds_csv_streaming_async
+from app.services.meds_dataset import (
+    MedsDataset,
+    advance_meds_dataset,
+    build_meds_dataset,
+    decode_meds_dataset,
+    encode_meds_dataset,
+)
+from app.services.metrics import register_dataset_cache
+from app.services.shared_snapshot import SharedFetch
+
+
+def _parse_error(e: ValueError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error parsing CSV data: {str(e)}"
+    )
+
+
+def load_csv_dataset(csv_text: str, row_limit: int = DEFAULT_ROW_LIMIT) -> MedsDataset:
+    """
+    Parses the CSV text and pre-serializes its response,
+    converting parser errors into an HTTP 500.
+    """
+    try:
+        rows = parse_meds_csv_columnar(csv_text, row_limit=row_limit)
+    except ValueError as e:
+        raise _parse_error(e)
+    return build_meds_dataset(rows, csv_text)
+
+
+def load_csv_dataset_stream(chunks: Iterable[str], row_limit: int = DEFAULT_ROW_LIMIT) -> MedsDataset:
+    """
+    Parses streamed CSV chunks as they download and pre-serializes the
+    response. Row and byte limit violations abort the download and, like
+    other parser errors, become an HTTP 500.
+    The chunks are also kept so text/csv can be served as the upstream sent it.
+    """
+    raw_chunks = []
+
+    def keep(chunks: Iterable[str]):
+        for chunk in chunks:
+            raw_chunks.append(chunk)
+            yield chunk
+
+    try:
+        rows = parse_meds_csv_stream(keep(chunks), row_limit=row_limit)
+    except ValueError as e:
+        raise _parse_error(e)
+    return build_meds_dataset(rows, "".join(raw_chunks))
+
+
+def csv_dataset_cache(
+    name: str,
+    settings: Callable[[], CacheSettings],
+    url: Optional[str] = None,
+    row_limit: int = DEFAULT_ROW_LIMIT,
+    byte_limit: Optional[int] = None,
+    changes: Optional[Callable[[], ChangesSettings]] = None
+) -> DatasetCache:
+    """
+    Builds the cache of one CSV file in a private GitHub repository.
+    The file is streamed into the parser as it downloads, and with a
+    shared_path setting the worker processes share one fetch and one mapped
+    copy of it (see app.services.shared_snapshot).
+
+    Args:
+        name: Dataset name, used for logs, metrics and refresh coalescing
+        settings: Returns the cache settings of the dataset
+        url: GitHub contents API URL of the file (default: MEDS_FILE_URL)
+        row_limit: Most rows the file may have
+        byte_limit: Largest download in bytes (default: MEDS_MAX_CSV_BYTES)
+        changes: Returns the change history settings; without it datasets
+            are versioned but keep no history
+
+    Returns:
+        DatasetCache of MedsDataset snapshots
+    """
+    load = partial(load_csv_dataset, row_limit=row_limit)
+    load_stream = partial(load_csv_dataset_stream, row_limit=row_limit)
+    decode = partial(decode_meds_dataset, row_limit=row_limit)
+
+    def advance(previous: Optional[MedsDataset], current: MedsDataset) -> MedsDataset:
+        return advance_meds_dataset(previous, current, changes() if changes is not None else None)
+
+    shared = SharedFetch(
+        fetch=partial(fetch_meds_csv_streaming, load_stream, byte_limit=byte_limit, url=url),
+        fetch_async=partial(fetch_meds_csv_streaming_async, load_stream, byte_limit=byte_limit, url=url),
+        parse=load,
+        encode=encode_meds_dataset,
+        decode=decode,
+        settings=settings,
+        advance=advance
+    )
+    return DatasetCache(
+        name,
+        fetch=shared.fetch,
+        fetch_async=shared.fetch_async,
+        parse=load,
+        settings=settings,
+        encode=encode_meds_dataset,
+        decode=decode,
+        advance=advance
+    )
+
+
+def source_dataset_cache(source: DatasetSource) -> DatasetCache:
+    """
+    Builds the cache of a configured dataset (see app.config.get_dataset_sources).
+    """
+    return csv_dataset_cache(
+        source.name,
+        settings=lambda: source.cache,
+        url=source.url,
+        row_limit=source.row_limit,
+        byte_limit=source.byte_limit
+    )
+
+
+class DatasetRegistry:
+    """
+    The named dataset caches served by the app.
+
+    Each dataset has its own cache, freshness policy and refresh: refreshes
+    of different datasets run independently of each other (as background
+    threads or tasks), share the pooled GitHub clients, and together are
+    capped by GITHUB_MAX_CONCURRENT_FETCHES.
+    """
+
+    def __init__(self):
+        self._caches: Dict[str, DatasetCache] = {}
+
+    def register(self, cache: DatasetCache) -> DatasetCache:
+        """
+        Adds a cache and exports its metrics. Raises ValueError if the name is taken.
+        """
+        if cache.name in self._caches:
+            raise ValueError(f"Dataset {cache.name!r} is already registered.")
+        self._caches[cache.name] = cache
+        register_dataset_cache(cache)
+        return cache
+
+    def get(self, name: str) -> DatasetCache:
+        """
+        Returns the cache of the named dataset. Raises KeyError if there is none.
+        """
+        return self._caches[name]
+
+    def __iter__(self) -> Iterator[DatasetCache]:
+        return iter(list(self._caches.values()))
+
+    def __len__(self) -> int:
+        return len(self._caches)
+
+    def names(self) -> List[str]:
+        return list(self._caches)
+
+    def clear(self):
+        """
+        Drops the cached data of every dataset.
+        """
+        for cache in self:
+            cache.clear()
+
+    def restore(self) -> List[str]:
+        """
+        Restores the saved snapshot of every dataset that has one and starts
+        revalidating each in its own background task, so a slow source does
+        not hold up the others. Must be called on the running event loop.
+
+        Returns:
+            Names of the restored datasets
+        """
+        restored = []
+        for cache in self:
+            if cache.restore():
+                cache.revalidate_in_background()
+                restored.append(cache.name)
+        return restored
+
+
+# Every dataset the app serves: /meds and the configured DATASETS
+DATASETS = DatasetRegistry()
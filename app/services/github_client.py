@@ -1,12 +1,104 @@
+import asyncio
+import logging
+import math
 import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+import anyio
 import httpx
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import GitHubSettings, get_github_settings
+from app.services.metrics import (
+    GITHUB_FETCH_DURATION,
+    GITHUB_FETCHES,
+    GITHUB_HEDGES,
+    GITHUB_RETRIES,
+    register_circuit_breaker,
+)
+from app.services.resilience import CIRCUIT_OPEN, CircuitBreaker, ConcurrencyLimit, LatencyWindow, backoff_delay
+from app.services.timing import PHASE_PARSE, PHASE_UPSTREAM, phase, timed_iter
+
+logger = logging.getLogger(__name__)
 
 GITHUB_API_URL = os.environ.get("MEDS_FILE_URL")
 
+# Slots for the GitHub requests in flight (GITHUB_MAX_CONCURRENT_FETCHES),
+# shared by the sync client in the threadpool and the async client, across
+# all datasets. Each dataset refreshes one request at a time, so a slow
+# source holds at most one slot and the others keep refreshing.
+_fetch_slots: Optional[ConcurrencyLimit] = None
+_fetch_slots_lock = threading.Lock()
+
+# Statuses that mean GitHub is overloaded or briefly unavailable, so the
+# request is retried (GETs are idempotent)
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
 # Create a persistent HTTP client for connection reuse
 _http_client = None
 
+# Async client owned by the application lifespan (see app.main)
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+@dataclass(frozen=True)
+class FetchResult:
+    """
+    Outcome of a (possibly conditional) GitHub fetch.
+    not_modified is True when GitHub answered 304 Not Modified, in which case
+    the caller's previously fetched copy is still current and there is no body.
+    A streamed fetch hands the body straight to a parser, so it carries the
+    parsed data instead of the text.
+    fetched_at is set when the data was fetched earlier by someone else (e.g.
+    another worker, see app.services.shared_snapshot), so its age carries over.
+    """
+    text: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+    data: Any = None
+    fetched_at: Optional[float] = None
+
+@dataclass
+class UpstreamPolicy:
+    """
+    Failure handling state shared by every request to one GitHub host: the
+    circuit breaker and the recent latencies that decide when to hedge.
+    """
+    breaker: CircuitBreaker
+    latencies: LatencyWindow
+
+_upstream_policies: Dict[str, UpstreamPolicy] = {}
+_upstream_policies_lock = threading.Lock()
+
+class _Unavailable(Exception):
+    """
+    A request failed in a way a retry may fix: a connection error, a timeout
+    or one of RETRYABLE_STATUSES (status_code is None for the former).
+    """
+
+    def __init__(self, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def label(self) -> str:
+        return "error" if self.status_code is None else str(self.status_code)
+
+    def http_exception(self) -> HTTPException:
+        if self.status_code is None:
+            return _connection_error()
+        return HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"GitHub returned unexpected status: {self.status_code}"
+        )
+
 def validate_github_config():
     """
     Validates that required GitHub configuration environment variables are set.
@@ -15,11 +107,29 @@ def validate_github_config():
     """
     if not GITHUB_API_URL:
         raise RuntimeError("MEDS_FILE_URL must be set in the environment.")
+    get_github_settings()
     
     github_pat = os.environ.get("GITHUB_PAT")
     if not github_pat:
         raise RuntimeError("GITHUB_PAT must be set in the environment.")
 
+def _timeout() -> httpx.Timeout:
+    settings = get_github_settings()
+    return httpx.Timeout(
+        settings.read_timeout_seconds,
+        connect=settings.connect_timeout_seconds,
+        pool=settings.connect_timeout_seconds
+    )
+
+def _pool_limits() -> httpx.Limits:
+    # Shared by the sync and async clients
+    settings = get_github_settings()
+    return httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_keepalive_connections,
+        keepalive_expiry=settings.keepalive_expiry_seconds
+    )
+
 def get_http_client() -> httpx.Client:
     """
     Returns a persistent HTTP client instance for connection reuse.
@@ -27,34 +137,72 @@ def get_http_client() -> httpx.Client:
     """
     global _http_client
     if _http_client is None:
-        _http_client = httpx.Client(timeout=10.0)
+        _http_client = httpx.Client(timeout=_timeout(), limits=_pool_limits())
     return _http_client
 
-def fetch_meds_csv() -> str:
+async def open_async_http_client() -> httpx.AsyncClient:
+    """
+    Opens the shared async HTTP client. Called from the application lifespan
+    so the connection pool lives exactly as long as the app.
+    """
+    return get_async_http_client()
+
+async def close_async_http_client():
+    """
+    Closes the shared async HTTP client and releases its pooled connections.
+    """
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+
+def get_async_http_client() -> httpx.AsyncClient:
     """
-    Fetches the meds.csv file from GitHub as raw CSV text using a PAT token.
-    Returns a CSV string.
+    Returns the shared async HTTP client.
+    Falls back to creating one if the lifespan has not opened it (e.g. in scripts).
     """
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(timeout=_timeout(), limits=_pool_limits())
+    return _async_http_client
 
+def _build_headers(etag: Optional[str] = None, last_modified: Optional[str] = None) -> dict:
+    """
+    Builds the GitHub request headers using the PAT token.
+    Adds conditional request headers when validators from a previous fetch are given.
+    """
     github_pat = os.environ.get("GITHUB_PAT")
     # This is validated at startup by validate_github_config()
-    
+
     headers = {
         "Authorization": f"token {github_pat}",
         "Accept": "application/vnd.github.v3.raw",
         "User-Agent": "meds-api-client"
     }
+    # Conditional requests: GitHub answers 304 when unchanged, which does not
+    # count against the rate limit
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
 
-    try:
-        client = get_http_client()
-        response = client.get(GITHUB_API_URL, headers=headers)
-    except Exception:
-        # Log the full exception internally but don't expose details to client
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail="Error connecting to GitHub."
+def _check_status(
+    response: httpx.Response,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> Optional[FetchResult]:
+    """
+    Maps the GitHub response status to an HTTPException.
+    Returns a not-modified FetchResult for a 304, or None if the body should be read.
+    """
+    if response.status_code == 304:
+        return FetchResult(
+            etag=response.headers.get("ETag") or etag,
+            last_modified=response.headers.get("Last-Modified") or last_modified,
+            not_modified=True
         )
-    
+
     if response.status_code == 404:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -72,5 +220,470 @@ def fetch_meds_csv() -> str:
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail=f"GitHub returned unexpected status: {response.status_code}"
         )
-    
-    return response.text
\ No newline at end of file
+
+    return None
+
+def _handle_response(
+    response: httpx.Response,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> FetchResult:
+    """
+    Maps the GitHub response status to an HTTPException or returns a FetchResult
+    carrying the CSV text and the upstream validators.
+    """
+    not_modified = _check_status(response, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    return FetchResult(
+        text=response.text,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified")
+    )
+
+def _limit_bytes(chunks: Iterator[str], response: httpx.Response, byte_limit: int) -> Iterator[str]:
+    """
+    Passes decoded chunks through, raising ValueError once the download exceeds byte_limit.
+    """
+    for chunk in chunks:
+        if response.num_bytes_downloaded > byte_limit:
+            raise ValueError(f"CSV byte limit of {byte_limit} exceeded.")
+        yield chunk
+
+def _consume_timed(consume: Callable[[Iterator[str]], Any], chunks: Iterator[str]) -> Any:
+    """
+    Runs consume as the parse phase, except for the time spent waiting for
+    the next chunk to download, which stays upstream.
+    """
+    with phase(PHASE_PARSE):
+        return consume(timed_iter(chunks, PHASE_UPSTREAM))
+
+def _connection_error() -> HTTPException:
+    # Log the full exception internally but don't expose details to client
+    return HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail="Error connecting to GitHub."
+    )
+
+@contextmanager
+def _record_fetch() -> Iterator[Callable[[int], None]]:
+    """
+    Records the latency of a GitHub fetch and the status it got, and times
+    it as the request's upstream phase. Call the yielded function with the
+    response status; fetches that never got one are counted as "error".
+    """
+    statuses = []
+    start = time.perf_counter()
+    try:
+        with phase(PHASE_UPSTREAM):
+            yield statuses.append
+    finally:
+        GITHUB_FETCH_DURATION.observe(time.perf_counter() - start)
+        GITHUB_FETCHES.inc(str(statuses[-1]) if statuses else "error")
+
+def fetch_slots() -> ConcurrencyLimit:
+    """
+    Returns the GitHub request slots, created from get_github_settings() on first use.
+    """
+    global _fetch_slots
+    with _fetch_slots_lock:
+        if _fetch_slots is None:
+            _fetch_slots = ConcurrencyLimit(get_github_settings().max_concurrent_fetches)
+        return _fetch_slots
+
+def upstream_policy(url: str) -> UpstreamPolicy:
+    """
+    Returns the failure handling state of the host url points to, creating
+    it (and reporting its circuit in the github_circuit_* metrics) on first use.
+    """
+    host = httpx.URL(url).host
+    with _upstream_policies_lock:
+        policy = _upstream_policies.get(host)
+        if policy is None:
+            settings = get_github_settings()
+            policy = _upstream_policies[host] = UpstreamPolicy(
+                CircuitBreaker(settings.breaker_failures, settings.breaker_reset_seconds),
+                LatencyWindow()
+            )
+            register_circuit_breaker(host, policy.breaker)
+        return policy
+
+def reset_upstream_policies():
+    """
+    Forgets every circuit breaker and latency history, and the request
+    slots, e.g. between tests.
+    """
+    global _fetch_slots
+    with _upstream_policies_lock:
+        _upstream_policies.clear()
+    with _fetch_slots_lock:
+        _fetch_slots = None
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+def _check_available(response: httpx.Response, policy: UpstreamPolicy, started: float):
+    """
+    Raises _Unavailable for a status worth retrying. Otherwise GitHub has
+    answered, and the time it took to answer is recorded for hedging.
+    """
+    if response.status_code in RETRYABLE_STATUSES:
+        raise _Unavailable(response.status_code, _retry_after(response))
+    policy.latencies.observe(time.perf_counter() - started)
+
+def _retry_delay(error: _Unavailable, retry: int, settings: GitHubSettings) -> Optional[float]:
+    """
+    Returns how long to wait before retry number retry, or None to give up.
+    A Retry-After longer than retry_max_seconds is not waited out.
+    """
+    if retry >= settings.max_retries:
+        return None
+    delay = backoff_delay(retry, settings.retry_base_seconds, settings.retry_max_seconds)
+    if error.retry_after is not None:
+        if error.retry_after > settings.retry_max_seconds:
+            return None
+        delay = max(delay, error.retry_after)
+    return delay
+
+def _circuit_open(policy: UpstreamPolicy) -> HTTPException:
+    # Cached datasets serve their stale copy instead (see DatasetCache)
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="GitHub is unavailable after repeated failures; try again later.",
+        headers={"Retry-After": str(max(1, math.ceil(policy.breaker.retry_after())))}
+    )
+
+def _failed(error: _Unavailable, policy: UpstreamPolicy, retry: int) -> float:
+    """
+    Records a failed attempt and returns the wait before retrying, or
+    raises the error as an HTTPException when there is no retry left or
+    the circuit has opened.
+    """
+    policy.breaker.record_failure()
+    delay = _retry_delay(error, retry, get_github_settings())
+    if delay is None or policy.breaker.state == CIRCUIT_OPEN:
+        raise error.http_exception()
+    GITHUB_RETRIES.inc(error.label)
+    return delay
+
+def _with_policies(attempt: Callable[[UpstreamPolicy], FetchResult], url: str) -> FetchResult:
+    """
+    Runs attempt, one GitHub request, under the host's circuit breaker,
+    retrying failures that may be transient with jittered exponential backoff.
+    """
+    policy = upstream_policy(url)
+    retry = 0
+    while True:
+        if not policy.breaker.allow():
+            raise _circuit_open(policy)
+        try:
+            result = attempt(policy)
+        except _Unavailable as e:
+            delay = _failed(e, policy, retry)
+            with phase(PHASE_UPSTREAM):
+                time.sleep(delay)
+            retry += 1
+            continue
+        except (HTTPException, ValueError):
+            # GitHub answered; the request or the file is at fault
+            policy.breaker.record_success()
+            raise
+        except (httpx.HTTPError, OSError) as e:
+            policy.breaker.release()
+            logger.warning("Request to %s failed.", url, exc_info=True)
+            raise _connection_error() from e
+        except BaseException:
+            # Anything else is a bug (or a cancellation), not GitHub's fault
+            policy.breaker.release()
+            raise
+        policy.breaker.record_success()
+        return result
+
+async def _with_policies_async(
+    attempt: Callable[[UpstreamPolicy], Awaitable[FetchResult]],
+    url: str
+) -> FetchResult:
+    """
+    Async version of _with_policies.
+    """
+    policy = upstream_policy(url)
+    retry = 0
+    while True:
+        if not policy.breaker.allow():
+            raise _circuit_open(policy)
+        try:
+            result = await attempt(policy)
+        except _Unavailable as e:
+            delay = _failed(e, policy, retry)
+            with phase(PHASE_UPSTREAM):
+                await asyncio.sleep(delay)
+            retry += 1
+            continue
+        except (HTTPException, ValueError):
+            policy.breaker.record_success()
+            raise
+        except (httpx.HTTPError, OSError) as e:
+            policy.breaker.release()
+            logger.warning("Request to %s failed.", url, exc_info=True)
+            raise _connection_error() from e
+        except BaseException:
+            policy.breaker.release()
+            raise
+        policy.breaker.record_success()
+        return result
+
+async def _discard(request: "asyncio.Future[httpx.Response]"):
+    """
+    Cancels the request that lost a hedge, closing its response if it has one.
+    """
+    request.cancel()
+    try:
+        response = await request
+    except (asyncio.CancelledError, Exception):
+        return
+    await response.aclose()
+
+async def _send_hedged(
+    client: httpx.AsyncClient,
+    build_request: Callable[[], httpx.Request],
+    policy: UpstreamPolicy
+) -> httpx.Response:
+    """
+    Sends a request and returns the response as soon as its headers arrive,
+    with the body still to be streamed.
+
+    With hedging enabled, a second identical request is sent if the first
+    has not answered within the hedge_percentile latency of recent requests
+    to the host. The first response wins and the other request is
+    cancelled, so one slow connection does not set the latency of the
+    fetch. If both fail, the first request's error is raised.
+    """
+    settings = get_github_settings()
+    delay = None
+    if settings.hedge_enabled:
+        delay = policy.latencies.percentile(settings.hedge_percentile, settings.hedge_min_samples)
+    if delay is None:
+        return await client.send(build_request(), stream=True)
+
+    first = asyncio.ensure_future(client.send(build_request(), stream=True))
+    try:
+        await asyncio.wait({first}, timeout=delay)
+    except BaseException:
+        await _discard(first)
+        raise
+    if first.done():
+        return first.result()
+
+    GITHUB_HEDGES.inc("sent")
+    hedge = asyncio.ensure_future(client.send(build_request(), stream=True))
+    winner = None
+    try:
+        pending = {first, hedge}
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for request in (first, hedge):
+                if request in done and winner is None and request.exception() is None:
+                    winner = request
+        if winner is None:
+            return first.result()
+        if winner is hedge:
+            GITHUB_HEDGES.inc("won")
+        return winner.result()
+    finally:
+        for request in (first, hedge):
+            if request is not winner:
+                await _discard(request)
+
+def fetch_meds_csv(
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    url: Optional[str] = None
+) -> FetchResult:
+    """
+    Fetches a CSV file (meds.csv unless url is given) from GitHub as raw text
+    using a PAT token.
+    When etag/last_modified from a previous fetch are given, the request is
+    conditional and an unchanged file comes back as a not-modified result.
+    Connection errors, timeouts, 429 and 5xx answers are retried, and the
+    host's circuit breaker fails fast after repeated failures (see
+    get_github_settings).
+
+    Args:
+        etag: ETag of the copy the caller already has
+        last_modified: Last-Modified of the copy the caller already has
+        url: GitHub contents API URL of the file (default: MEDS_FILE_URL)
+
+    Returns:
+        FetchResult with the CSV text (None if not modified) and validators
+    """
+    headers = _build_headers(etag, last_modified)
+    url = url or GITHUB_API_URL
+
+    def attempt(policy: UpstreamPolicy) -> FetchResult:
+        with fetch_slots(), _record_fetch() as record_status:
+            started = time.perf_counter()
+            try:
+                response = get_http_client().get(url, headers=headers)
+            except (httpx.TransportError, OSError):
+                raise _Unavailable()
+            record_status(response.status_code)
+            _check_available(response, policy, started)
+            return _handle_response(response, etag, last_modified)
+
+    return _with_policies(attempt, url)
+
+async def fetch_meds_csv_async(
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    url: Optional[str] = None
+) -> FetchResult:
+    """
+    Async version of fetch_meds_csv. Uses the lifespan-managed AsyncClient so a
+    slow GitHub response does not hold a threadpool worker, and hedges slow
+    requests when enabled.
+    Returns a FetchResult.
+    """
+    headers = _build_headers(etag, last_modified)
+    url = url or GITHUB_API_URL
+
+    async def attempt(policy: UpstreamPolicy) -> FetchResult:
+        client = get_async_http_client()
+        request = partial(client.build_request, "GET", url, headers=headers)
+        async with fetch_slots():
+            with _record_fetch() as record_status:
+                started = time.perf_counter()
+                try:
+                    response = await _send_hedged(client, request, policy)
+                    try:
+                        record_status(response.status_code)
+                        _check_available(response, policy, started)
+                        await response.aread()
+                    finally:
+                        await response.aclose()
+                except (httpx.TransportError, OSError):
+                    raise _Unavailable()
+                return _handle_response(response, etag, last_modified)
+
+    return await _with_policies_async(attempt, url)
+
+def fetch_meds_csv_streaming(
+    consume: Callable[[Iterator[str]], Any],
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    byte_limit: Optional[int] = None,
+    url: Optional[str] = None
+) -> FetchResult:
+    """
+    Streams a CSV file (meds.csv unless url is given) from GitHub into consume without buffering the
+    whole body. consume receives an iterator of decoded text chunks and returns
+    the parsed data; if it stops early (e.g. by raising ValueError on a row
+    limit), the rest of the download is abandoned. The byte limit is enforced
+    while streaming. A download that fails part way is retried from the
+    start, so consume may be called more than once.
+
+    Args:
+        consume: Parses an iterator of text chunks, e.g. parse_meds_csv_stream
+        etag: ETag of the copy the caller already has
+        last_modified: Last-Modified of the copy the caller already has
+        byte_limit: Maximum body size in bytes (default: MEDS_MAX_CSV_BYTES)
+        url: GitHub contents API URL of the file (default: MEDS_FILE_URL)
+
+    Returns:
+        FetchResult with the parsed data (None if not modified) and validators
+    """
+    headers = _build_headers(etag, last_modified)
+    byte_limit = get_github_settings().max_csv_bytes if byte_limit is None else byte_limit
+    url = url or GITHUB_API_URL
+
+    def attempt(policy: UpstreamPolicy) -> FetchResult:
+        client = get_http_client()
+        with fetch_slots(), _record_fetch() as record_status:
+            started = time.perf_counter()
+            try:
+                with client.stream("GET", url, headers=headers) as response:
+                    record_status(response.status_code)
+                    _check_available(response, policy, started)
+                    not_modified = _check_status(response, etag, last_modified)
+                    if not_modified is not None:
+                        return not_modified
+
+                    data = _consume_timed(consume, _limit_bytes(response.iter_text(), response, byte_limit))
+                    return FetchResult(
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                        data=data
+                    )
+            except (httpx.TransportError, OSError):
+                raise _Unavailable()
+
+    return _with_policies(attempt, url)
+
+async def fetch_meds_csv_streaming_async(
+    consume: Callable[[Iterator[str]], Any],
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    byte_limit: Optional[int] = None,
+    url: Optional[str] = None
+) -> FetchResult:
+    """
+    Async version of fetch_meds_csv_streaming.
+    consume runs in the threadpool (parsing is CPU-bound) and pulls each chunk
+    from the event loop as it needs it, so only one chunk is in memory at a time.
+    Slow requests are hedged when enabled (see _send_hedged).
+    Returns a FetchResult.
+    """
+    headers = _build_headers(etag, last_modified)
+    byte_limit = get_github_settings().max_csv_bytes if byte_limit is None else byte_limit
+    url = url or GITHUB_API_URL
+
+    async def attempt(policy: UpstreamPolicy) -> FetchResult:
+        client = get_async_http_client()
+        request = partial(client.build_request, "GET", url, headers=headers)
+        async with fetch_slots():
+            with _record_fetch() as record_status:
+                started = time.perf_counter()
+                try:
+                    response = await _send_hedged(client, request, policy)
+                    try:
+                        record_status(response.status_code)
+                        _check_available(response, policy, started)
+                        not_modified = _check_status(response, etag, last_modified)
+                        if not_modified is not None:
+                            return not_modified
+
+                        chunks = _iter_from_event_loop(response.aiter_text())
+                        data = await run_in_threadpool(
+                            _consume_timed, consume, _limit_bytes(chunks, response, byte_limit)
+                        )
+                        return FetchResult(
+                            etag=response.headers.get("ETag"),
+                            last_modified=response.headers.get("Last-Modified"),
+                            data=data
+                        )
+                    finally:
+                        await response.aclose()
+                except (httpx.TransportError, OSError):
+                    raise _Unavailable()
+
+    return await _with_policies_async(attempt, url)
+
+def _iter_from_event_loop(chunks: AsyncIterator[str]) -> Iterator[str]:
+    """
+    Turns an async iterator into a blocking one for use from a worker thread
+    started by anyio (e.g. run_in_threadpool); each item is awaited on the loop.
+    """
+    async def next_chunk() -> Optional[str]:
+        try:
+            return await chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    while True:
+        chunk = anyio.from_thread.run(next_chunk)
+        if chunk is None:
+            return
+        yield chunk
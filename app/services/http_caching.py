@@ -0,0 +1,145 @@
+import hashlib
+from typing import Dict, Mapping, Optional, Sequence
+
+from fastapi import Request, Response, status
+
+from app.services.compression import choose_encoding
+
+
+def strong_etag(body: bytes) -> str:
+    """
+    Returns a strong ETag derived from the response body.
+    Content-derived, so every worker and every restart agrees on it.
+    """
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Returns True if an If-None-Match header value matches etag.
+    Handles "*", comma-separated lists and weak validators (W/"...").
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def variant_etag(etag: str, variant: str) -> str:
+    """
+    Derives the ETag of another representation (e.g. "ndjson") of the same
+    content, so each representation has its own strong validator.
+    """
+    return etag[:-1] + "-" + variant + '"'
+
+
+def not_modified_response(
+    request: Request,
+    etag: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Optional[Response]:
+    """
+    Returns a bodyless 304 Not Modified if the client already has this version,
+    otherwise None.
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={**(headers or {}), "ETag": etag}
+        )
+    return None
+
+
+def add_vary(headers: Optional[Dict[str, str]], field: str) -> Dict[str, str]:
+    """
+    Returns a copy of headers with field added to Vary.
+    """
+    headers = dict(headers or {})
+    vary = headers.get("Vary")
+    headers["Vary"] = f"{vary}, {field}" if vary else field
+    return headers
+
+
+def cached_body_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    media_type: str = "application/json",
+    headers: Optional[Dict[str, str]] = None,
+    encodings: Optional[Mapping[str, bytes]] = None
+) -> Response:
+    """
+    Serves a pre-serialized body with its ETag, or a bodyless 304 Not Modified
+    if the client already has this version.
+
+    encodings holds precompressed variants of body by content coding (see
+    app.services.compression.precompress). The smallest one the client
+    accepts is sent as stored, with its own ETag.
+    """
+    encoding = None
+    if encodings:
+        headers = add_vary(headers, "Accept-Encoding")
+        encoding = choose_encoding(request.headers.get("accept-encoding"), encodings)
+        if encoding is not None:
+            body = encodings[encoding]
+            etag = variant_etag(etag, encoding)
+
+    not_modified = not_modified_response(request, etag, headers)
+    if not_modified is not None:
+        return not_modified
+    headers = {**(headers or {}), "ETag": etag}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def choose_media_type(accept: Optional[str], offered: Sequence[str]) -> Optional[str]:
+    """
+    Picks the offered media type the client prefers according to its Accept
+    header. Each offered type takes the quality of the most specific range
+    matching it; ties go to the earlier entry in offered, which is also the
+    default when there is no Accept header. Returns None if nothing offered
+    is acceptable.
+    """
+    if not accept:
+        return offered[0]
+
+    # media type -> (specificity of the matching range, quality)
+    matches: Dict[str, tuple] = {}
+    for entry in accept.split(","):
+        media_range, *params = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        for media_type in offered:
+            if media_range == media_type:
+                specificity = 2
+            elif media_range.endswith("/*") and media_type.startswith(media_range[:-1]):
+                specificity = 1
+            elif media_range == "*/*":
+                specificity = 0
+            else:
+                continue
+            if media_type not in matches or specificity > matches[media_type][0]:
+                matches[media_type] = (specificity, quality)
+
+    best = None
+    best_quality = 0.0
+    for media_type in offered:
+        quality = matches.get(media_type, (0, 0.0))[1]
+        if quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
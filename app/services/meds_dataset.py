@@ -0,0 +1,401 @@
+from collections.abc import Mapping as MappingABC, Sequence as SequenceABC
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import orjson
+
+from app.config import DEFAULT_ROW_LIMIT, ChangesSettings
+from app.services.binary_formats import MEDIA_ARROW, encode_arrow, encode_msgpack
+from app.services.compression import precompress
+from app.services.csv_parser import ColumnarRows, parse_meds_csv_columnar
+from app.services.dataset_changes import (
+    Delta,
+    changes_since,
+    decode_history,
+    diff_rows,
+    encode_history,
+    extend_history,
+    next_version,
+)
+from app.services.dataset_index import TableIndex
+from app.services.http_caching import strong_etag
+from app.services.search_index import SearchIndex
+from app.services.timing import PHASE_SERIALIZE, phase
+
+# Column searched by /meds/search
+SEARCH_COLUMN = "name"
+
+
+@dataclass(frozen=True)
+class MedsDataset:
+    """
+    A parsed medication list together with its pre-serialized /meds response,
+    the upstream CSV body and per-column indexes.
+
+    Built once per dataset version during the cache refresh, so requests only
+    write out stored bytes or look rows up in the index instead of
+    re-encoding or scanning every row.
+
+    The bodies are also compressed once here with every available content
+    coding, so serving a compressed response costs no CPU per request.
+
+    Every newly loaded version gets a higher version number, and history
+    holds the row-level deltas that led up to it (see advance_meds_dataset).
+
+    Binary representations (MessagePack, Arrow) are encoded from the rows
+    the first time one is requested, then kept with their precompressed
+    variants in binary_bodies for as long as this version is served. They
+    are not part of shared snapshots; each worker encodes its own.
+
+    rows, index and search_index are produced by load_rows on first use.
+    build_meds_dataset fills them in straight away; datasets decoded from a shared snapshot
+    defer them until a request filters or streams rows, so workers that only
+    serve the stored bodies never hold a parsed copy.
+    """
+    columns: List[str]
+    body: bytes
+    etag: str
+    csv_body: bytes = b""
+    csv_etag: str = '""'
+    row_count: int = 0
+    # Precompressed variants of body and csv_body, by content coding
+    body_encodings: Mapping[str, bytes] = field(default_factory=dict, repr=False)
+    csv_encodings: Mapping[str, bytes] = field(default_factory=dict, repr=False)
+    version: int = 0
+    history: Tuple[Delta, ...] = field(default=(), repr=False)
+    load_rows: Optional[Callable[[], Sequence[Mapping[str, Optional[str]]]]] = field(
+        default=None, repr=False, compare=False
+    )
+    # Media type -> (body, precompressed variants), filled by binary_body
+    binary_bodies: Dict[str, Tuple[bytes, Mapping[str, bytes]]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+    @cached_property
+    def rows(self) -> Sequence[Mapping[str, Optional[str]]]:
+        return self.load_rows() if self.load_rows is not None else []
+
+    @cached_property
+    def index(self) -> TableIndex:
+        return TableIndex(self.rows, self.columns)
+
+    @cached_property
+    def search_index(self) -> SearchIndex:
+        if SEARCH_COLUMN not in self.columns:
+            return SearchIndex(())
+        return SearchIndex(row.get(SEARCH_COLUMN) for row in self.rows)
+
+    @property
+    def is_loaded(self) -> bool:
+        """
+        Whether rows and indexes are built, i.e. select() will not parse.
+        """
+        return "index" in self.__dict__
+
+    @property
+    def is_searchable(self) -> bool:
+        """
+        Whether the search index is built, i.e. search_body() will not parse.
+        """
+        return "search_index" in self.__dict__
+
+    def is_encoded(self, media_type: str) -> bool:
+        """
+        Whether binary_body(media_type) is stored, i.e. will not encode.
+        """
+        return media_type in self.binary_bodies
+
+    def evolve(self, **changes) -> "MedsDataset":
+        """
+        Returns a copy with changes applied, keeping the rows and indexes
+        already built. changes must not affect the rows.
+        """
+        dataset = replace(self, **changes)
+        for name in ("rows", "index", "search_index"):
+            if name in self.__dict__:
+                dataset.__dict__[name] = self.__dict__[name]
+        return dataset
+
+    def select(
+        self,
+        equals: Optional[Mapping[str, str]] = None,
+        prefixes: Optional[Mapping[str, str]] = None,
+        fields: Optional[Sequence[str]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[int, List[Mapping[str, Optional[str]]], Optional[int]]:
+        """
+        Selects a filtered, projected page of the dataset using the indexes.
+        Raises ValueError for unknown columns.
+
+        Args:
+            equals: Column name to exact value filters
+            prefixes: Column name to case-insensitive prefix filters
+            fields: Columns to include in each row (all if None)
+            offset: Number of matching rows to skip
+            limit: Maximum number of rows to return (all if None)
+
+        Returns:
+            The number of matching rows before pagination, the page of rows,
+            and the offset of the next page (None if this is the last one)
+        """
+        for name in fields or ():
+            self.index.column(name)
+
+        positions = self.index.select(equals, prefixes)
+        total = self.index.row_count if positions is None else len(positions)
+        end = total if limit is None else min(offset + limit, total)
+
+        if positions is None:
+            page = self.rows[offset:end]
+        else:
+            page = [self.rows[position] for position in positions[offset:end]]
+
+        if fields is not None:
+            page = [{name: row.get(name) for name in fields} for row in page]
+
+        return total, page, end if end < total else None
+
+    def query_body(
+        self,
+        equals: Optional[Mapping[str, str]] = None,
+        prefixes: Optional[Mapping[str, str]] = None,
+        fields: Optional[Sequence[str]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> bytes:
+        """
+        Serializes a filtered, projected page of the dataset (see select).
+        count is the number of matching rows before pagination; next_offset
+        is set when more matching rows follow the page.
+        Raises ValueError for unknown columns.
+
+        Returns:
+            The JSON response body
+        """
+        total, page, next_offset = self.select(equals, prefixes, fields, offset, limit)
+        response = {"count": total, "items": page}
+        if next_offset is not None:
+            response["next_offset"] = next_offset
+        return orjson.dumps(response, default=_to_builtin)
+
+    def encode_binary(self, media_type: str) -> bytes:
+        """
+        Encodes the whole dataset in a binary media type (see
+        app.services.binary_formats), without storing the result.
+        """
+        return _encode_binary(media_type, self.rows, self.columns, self.row_count, None)
+
+    def binary_body(self, media_type: str) -> Tuple[bytes, Mapping[str, bytes]]:
+        """
+        Returns encode_binary(media_type) and its precompressed variants,
+        encoding them on first use. Two first requests racing may both
+        encode; either result is kept.
+        """
+        stored = self.binary_bodies.get(media_type)
+        if stored is None:
+            body = self.encode_binary(media_type)
+            stored = self.binary_bodies[media_type] = (body, precompress(body))
+        return stored
+
+    def query_binary(
+        self,
+        media_type: str,
+        equals: Optional[Mapping[str, str]] = None,
+        prefixes: Optional[Mapping[str, str]] = None,
+        fields: Optional[Sequence[str]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[bytes, int, Optional[int]]:
+        """
+        Encodes a filtered, projected page of the dataset (see select) in a
+        binary media type. Raises ValueError for unknown columns.
+
+        Returns:
+            The body, the number of matching rows before pagination and the
+            offset of the next page (None if this is the last one)
+        """
+        total, page, next_offset = self.select(equals, prefixes, fields, offset, limit)
+        body = _encode_binary(media_type, page, fields or self.columns, total, next_offset)
+        return body, total, next_offset
+
+    def search_body(self, query: str, limit: int = 10) -> bytes:
+        """
+        Serializes the rows whose SEARCH_COLUMN value best matches query,
+        best first (see SearchIndex).
+
+        Returns:
+            The JSON response body
+        """
+        items = [self.rows[position] for position in self.search_index.search(query, limit)]
+        return orjson.dumps({"query": query, "count": len(items), "items": items}, default=_to_builtin)
+
+    def changes_body(self, since: int) -> Optional[bytes]:
+        """
+        Serializes the rows added, changed and removed since an earlier
+        version (see changes_since).
+
+        Returns:
+            The JSON response body, or None if the history does not reach
+            back to since
+        """
+        changes = changes_since(self.history, self.version, since)
+        return None if changes is None else orjson.dumps(changes)
+
+
+def _to_builtin(value: Any) -> Any:
+    """
+    orjson fallback for compact row types (ColumnarRows and its row views).
+    """
+    if isinstance(value, MappingABC):
+        return dict(value)
+    if isinstance(value, SequenceABC):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _encode_binary(
+    media_type: str,
+    rows: Sequence[Mapping[str, Optional[str]]],
+    columns: Sequence[str],
+    total: int,
+    next_offset: Optional[int]
+) -> bytes:
+    """
+    Encodes rows as Arrow (a table with one column per entry of columns)
+    or as MessagePack shaped like the JSON body.
+    """
+    if media_type == MEDIA_ARROW:
+        return encode_arrow(rows, columns)
+    # Plain dicts pack natively; row views would each go through _to_builtin
+    items = rows.to_dicts() if isinstance(rows, ColumnarRows) else rows
+    response = {"count": total, "items": items}
+    if next_offset is not None:
+        response["next_offset"] = next_offset
+    return encode_msgpack(response, default=_to_builtin)
+
+
+def _columns_of(rows: Sequence[Mapping[str, Optional[str]]]) -> List[str]:
+    columns = getattr(rows, "columns", None)
+    if columns is not None:
+        return list(columns)
+    # csv.DictReader stores surplus values under the None key; those are not a column
+    if not rows:
+        return []
+    return [column for column in rows[0] if column is not None]
+
+
+def build_meds_dataset(rows: Sequence[Mapping[str, Optional[str]]], csv_text: str = "") -> MedsDataset:
+    """
+    Serializes the /meds response body for rows, derives its strong ETag
+    and builds the per-column and search indexes.
+
+    Args:
+        rows: Parsed medication entries
+        csv_text: The upstream CSV the rows were parsed from, kept for text/csv passthrough
+
+    Returns:
+        MedsDataset holding the rows, the JSON body, its ETag and the indexes
+    """
+    with phase(PHASE_SERIALIZE):
+        body = orjson.dumps({"count": len(rows), "items": rows}, default=_to_builtin)
+        csv_body = csv_text.encode()
+        dataset = MedsDataset(
+            columns=_columns_of(rows),
+            body=body,
+            etag=strong_etag(body),
+            csv_body=csv_body,
+            csv_etag=strong_etag(csv_body),
+            row_count=len(rows),
+            body_encodings=precompress(body),
+            csv_encodings=precompress(csv_body),
+            load_rows=lambda: rows
+        )
+    # Index now, during the refresh, rather than on the first filtered request
+    dataset.index
+    dataset.search_index
+    return dataset
+
+
+def encode_meds_dataset(dataset: MedsDataset) -> Dict[str, bytes]:
+    """
+    Splits a dataset into named byte sections for a shared snapshot.
+    Only the serialized bodies are stored; rows are re-parsed from the CSV
+    by whichever worker needs them.
+    """
+    meta = {
+        "columns": dataset.columns,
+        "etag": dataset.etag,
+        "csv_etag": dataset.csv_etag,
+        "row_count": dataset.row_count,
+        "version": dataset.version,
+    }
+    sections = {
+        "meta": orjson.dumps(meta),
+        "body": dataset.body,
+        "csv": dataset.csv_body,
+        "history": encode_history(dataset.history),
+    }
+    # Compressed variants are shared too, so no worker compresses them again
+    for encoding, data in dataset.body_encodings.items():
+        sections[f"body.{encoding}"] = data
+    for encoding, data in dataset.csv_encodings.items():
+        sections[f"csv.{encoding}"] = data
+    return sections
+
+
+def _encodings_of(sections: Mapping[str, bytes], name: str) -> Dict[str, bytes]:
+    prefix = name + "."
+    return {key[len(prefix):]: data for key, data in sections.items() if key.startswith(prefix)}
+
+
+def decode_meds_dataset(sections: Mapping[str, bytes], row_limit: int = DEFAULT_ROW_LIMIT) -> MedsDataset:
+    """
+    Rebuilds a dataset from encode_meds_dataset sections without copying the
+    bodies, which may be memoryviews over a shared mapping. Rows are parsed
+    from the CSV with row_limit when first needed.
+    """
+    meta = orjson.loads(sections["meta"])
+    csv_body = sections["csv"]
+    return MedsDataset(
+        columns=meta["columns"],
+        body=sections["body"],
+        etag=meta["etag"],
+        csv_body=csv_body,
+        csv_etag=meta["csv_etag"],
+        row_count=meta["row_count"],
+        body_encodings=_encodings_of(sections, "body"),
+        csv_encodings=_encodings_of(sections, "csv"),
+        # Snapshots saved before versioning have neither
+        version=meta.get("version", 0),
+        history=decode_history(sections["history"]) if "history" in sections else (),
+        load_rows=lambda: parse_meds_csv_columnar(str(csv_body, "utf-8"), row_limit=row_limit)
+    )
+
+
+def advance_meds_dataset(
+    previous: Optional[MedsDataset],
+    current: MedsDataset,
+    changes: Optional[ChangesSettings] = None
+) -> MedsDataset:
+    """
+    Gives a newly loaded dataset the next version number. With change
+    tracking, its row-level diff against previous is also appended to the
+    history; a diff that cannot be computed (e.g. duplicate keys) starts the
+    history over, so clients further back are told to resync.
+
+    Args:
+        previous: The version being replaced, if any
+        current: The newly loaded dataset
+        changes: Change history settings (None keeps no history)
+
+    Returns:
+        current with its version and history set
+    """
+    version = next_version(previous.version if previous is not None else None)
+    history = ()
+    if changes is not None and previous is not None and previous.version:
+        delta = diff_rows(previous.rows, current.rows, changes.key_column, previous.version, version)
+        history = extend_history(previous.history, delta, changes)
+    return current.evolve(version=version, history=history)
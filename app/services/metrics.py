@@ -0,0 +1,416 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.services.resilience import CIRCUIT_STATE_VALUES
+
+# Latency buckets in seconds, from sub-millisecond cache hits to GitHub timeouts
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (metric name suffix, label pairs, value) as produced by collect()
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base class for metrics rendered in the Prometheus text exposition format.
+
+    Each metric has its own lock held only for a few additions, so recording
+    from the event loop and from threadpool workers stays cheap and uncontended.
+    """
+    type_name = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: Sequence[str]) -> Tuple[Tuple[str, str], ...]:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(values)}")
+        return tuple(zip(self.labelnames, (str(v) for v in values)))
+
+    def collect(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self.collect():
+            label_text = ""
+            if labels:
+                label_text = "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+            lines.append(f"{self.name}{suffix}{label_text} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, optionally split by labels.
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def collect(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in sorted(items):
+            yield "", self._labels(labelvalues), value
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down, optionally split by labels.
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labelvalues: str):
+        self._values[labelvalues] = value
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def collect(self) -> Iterable[Sample]:
+        for labelvalues, value in sorted(self._values.items()):
+            yield "", self._labels(labelvalues), value
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets, optionally split by labels.
+    """
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labelvalues)
+            if child is None:
+                child = self._children[labelvalues] = _HistogramChild(len(self.buckets))
+            child.counts[index] += 1
+            child.sum += value
+            child.count += 1
+
+    @contextmanager
+    def time(self, *labelvalues: str) -> Iterator[None]:
+        """
+        Observes the wall-clock duration of the with block, even if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        child = self._children.get(labelvalues)
+        return child.count if child else 0
+
+    def collect(self) -> Iterable[Sample]:
+        with self._lock:
+            children = [
+                (labelvalues, list(child.counts), child.sum, child.count)
+                for labelvalues, child in self._children.items()
+            ]
+        for labelvalues, counts, total, count in sorted(children):
+            labels = self._labels(labelvalues)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield "_sum", labels, total
+            yield "_count", labels, count
+
+
+class CollectorMetric(Metric):
+    """
+    Metric whose samples are computed at scrape time by a callback, so
+    values that already exist elsewhere (e.g. cache counters) cost nothing
+    to record.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type_name: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Iterable[Tuple[Sequence[str], Optional[float]]]]
+    ):
+        super().__init__(name, help, labelnames)
+        self.type_name = type_name
+        self._callback = callback
+
+    def collect(self) -> Iterable[Sample]:
+        for labelvalues, value in self._callback():
+            if value is not None:
+                yield "", self._labels(labelvalues), value
+
+
+class Registry:
+    """
+    Ordered set of metrics rendered together by /metrics.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Adds a metric, replacing any metric previously registered under its name.
+        """
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry exposed by GET /metrics
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route template, method and status code.",
+    ("route", "method", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and method.",
+    ("route", "method")
+)
+GITHUB_FETCHES = REGISTRY.counter(
+    "github_fetch_total", "GitHub fetches by response status (\"error\" for connection failures).",
+    ("status",)
+)
+GITHUB_FETCH_DURATION = REGISTRY.histogram(
+    "github_fetch_duration_seconds", "GitHub fetch latency, including the streamed body."
+)
+GITHUB_RETRIES = REGISTRY.counter(
+    "github_retries_total", "GitHub requests retried, by the status that failed (\"error\" for connection failures).",
+    ("status",)
+)
+GITHUB_HEDGES = REGISTRY.counter(
+    "github_hedged_requests_total", "Hedged GitHub requests sent, and those that answered first (won).",
+    ("outcome",)
+)
+CSV_PARSE_DURATION = REGISTRY.histogram(
+    "csv_parse_duration_seconds", "Time spent parsing CSV data."
+)
+CSV_PARSES = REGISTRY.counter(
+    "csv_parse_total", "CSV parses by outcome (ok or error).", ("outcome",)
+)
+CSV_PARSED_ROWS = REGISTRY.counter(
+    "csv_parsed_rows_total", "Rows produced by successful CSV parses."
+)
+CSV_LAST_PARSE_ROWS = REGISTRY.gauge(
+    "csv_last_parse_rows", "Rows produced by the most recent successful CSV parse."
+)
+
+
+@contextmanager
+def record_csv_parse() -> Iterator[Callable[[int], None]]:
+    """
+    Times a CSV parse and counts its outcome. Call the yielded function with
+    the number of rows once the parse succeeds.
+    """
+    start = time.perf_counter()
+    rows = []
+    try:
+        yield rows.append
+    except BaseException:
+        CSV_PARSES.inc("error")
+        raise
+    finally:
+        CSV_PARSE_DURATION.observe(time.perf_counter() - start)
+    CSV_PARSES.inc("ok")
+    if rows:
+        CSV_PARSED_ROWS.inc(amount=rows[-1])
+        CSV_LAST_PARSE_ROWS.set(rows[-1])
+
+
+# Caches reported by the dataset_cache_* metrics, by name (see register_dataset_cache)
+_dataset_caches: Dict[str, Any] = {}
+
+# (metric name, type, help, key in DatasetCache.stats())
+_DATASET_CACHE_METRICS = (
+    ("dataset_cache_hits_total", "counter",
+     "Reads answered from the cached snapshot.", "hits"),
+    ("dataset_cache_misses_total", "counter",
+     "Reads that had to wait for a refresh.", "misses"),
+    ("dataset_cache_stale_served_total", "counter",
+     "Reads answered with a snapshot past its TTL.", "stale_served"),
+    ("dataset_cache_refresh_errors_total", "counter",
+     "Refreshes that failed.", "refresh_errors"),
+    ("dataset_cache_background_refreshes_total", "counter",
+     "Refreshes started in the background.", "background_refreshes"),
+    ("dataset_cache_not_modified_total", "counter",
+     "Refreshes answered 304 Not Modified by the upstream.", "not_modified"),
+    ("dataset_cache_persist_errors_total", "counter",
+     "Snapshots that could not be saved to disk.", "persist_errors"),
+    ("dataset_cache_fetches_total", "counter",
+     "Refreshes actually executed after coalescing.", "executions"),
+    ("dataset_cache_coalesced_total", "counter",
+     "Callers that joined a refresh already in flight.", "coalesced"),
+    ("dataset_cache_age_seconds", "gauge",
+     "Seconds since the cached snapshot was last confirmed fresh.", "age_seconds"),
+)
+
+
+def register_dataset_cache(cache: Any):
+    """
+    Reports a DatasetCache's counters and snapshot age, labelled by its name.
+    The values are read from cache.stats() at scrape time, so serving reads
+    costs nothing extra.
+    """
+    _dataset_caches[cache.name] = cache
+
+
+def _dataset_cache_samples(key: str) -> Callable[[], Iterable[Tuple[Sequence[str], Optional[float]]]]:
+    def samples():
+        for name, cache in sorted(_dataset_caches.items()):
+            yield (name,), cache.stats()[key]
+    return samples
+
+
+for _name, _type, _help, _key in _DATASET_CACHE_METRICS:
+    REGISTRY.register(
+        CollectorMetric(_name, _help, _type, ("dataset",), _dataset_cache_samples(_key))
+    )
+
+
+# Circuit breakers reported by the github_circuit_* metrics, by upstream host
+# (see register_circuit_breaker)
+_circuit_breakers: Dict[str, Any] = {}
+
+
+def register_circuit_breaker(host: str, breaker: Any):
+    """
+    Reports a CircuitBreaker's state and counters, labelled by host. The
+    values are read from breaker.stats() at scrape time.
+    """
+    _circuit_breakers[host] = breaker
+
+
+def _circuit_samples(key: str) -> Callable[[], Iterable[Tuple[Sequence[str], Optional[float]]]]:
+    def samples():
+        for host, breaker in sorted(_circuit_breakers.items()):
+            value = breaker.stats()[key]
+            yield (host,), CIRCUIT_STATE_VALUES[value] if key == "state" else value
+    return samples
+
+
+for _name, _type, _help, _key in (
+    ("github_circuit_state", "gauge",
+     "Circuit breaker state: 0 closed, 1 half-open, 2 open.", "state"),
+    ("github_circuit_consecutive_failures", "gauge",
+     "GitHub requests that failed in a row.", "consecutive_failures"),
+    ("github_circuit_opened_total", "counter",
+     "Times the circuit opened.", "opened"),
+    ("github_circuit_rejected_total", "counter",
+     "Requests refused while the circuit was open.", "rejected"),
+):
+    REGISTRY.register(CollectorMetric(_name, _help, _type, ("host",), _circuit_samples(_key)))
+
+
+# Bulkheads reported by the http_bulkhead_* metrics, by path prefix (see register_bulkhead)
+_bulkheads: Dict[str, Any] = {}
+
+
+def register_bulkhead(bulkhead: Any):
+    """
+    Reports a Bulkhead's running and waiting requests and the requests it
+    shed, labelled by its path prefix. The values are read from
+    bulkhead.stats() at scrape time.
+    """
+    _bulkheads[bulkhead.rule.path_prefix] = bulkhead
+
+
+def _bulkhead_samples(keys: Sequence[str]) -> Callable[[], Iterable[Tuple[Sequence[str], Optional[float]]]]:
+    def samples():
+        for group, bulkhead in sorted(_bulkheads.items()):
+            stats = bulkhead.stats()
+            for key in keys:
+                yield ((group, key) if len(keys) > 1 else (group,)), stats[key]
+    return samples
+
+
+REGISTRY.register(CollectorMetric(
+    "http_bulkhead_active", "Requests running under the bulkhead of a route group.", "gauge",
+    ("group",), _bulkhead_samples(("active",))
+))
+REGISTRY.register(CollectorMetric(
+    "http_bulkhead_queued", "Requests waiting for a slot in the bulkhead of a route group.", "gauge",
+    ("group",), _bulkhead_samples(("queued",))
+))
+REGISTRY.register(CollectorMetric(
+    "http_bulkhead_shed_total", "Requests answered 503 because a route group was full, by reason.", "counter",
+    ("group", "reason"), _bulkhead_samples(("queue_full", "timeout"))
+))
@@ -0,0 +1,207 @@
+import math
+from typing import Any, AsyncIterable, Dict, Sequence
+
+import numpy as np
+import orjson
+
+# Raw request bodies hold little-endian IEEE 754 doubles, whatever the host order
+FLOAT64 = np.dtype("<f8")
+
+# Reduction modes: NumPy's pairwise summation, or a correctly rounded sum
+PRECISION_FAST = "fast"
+PRECISION_EXACT = "exact"
+
+
+def numbers_from_float64(body: bytes) -> np.ndarray:
+    """
+    Reads a body of little-endian float64 values without copying it.
+    Raises ValueError if the body is not a whole number of values.
+
+    Returns:
+        Read-only array viewing body
+    """
+    if len(body) % FLOAT64.itemsize:
+        raise ValueError(f"Body length {len(body)} is not a multiple of {FLOAT64.itemsize} bytes.")
+    return np.frombuffer(body, dtype=FLOAT64)
+
+
+def _parse_line(line: bytes, line_number: int) -> float:
+    try:
+        value = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        value = None
+    # bool is an int, but true is not a number
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError(f"Line {line_number} is not a JSON number.")
+    try:
+        return float(value)
+    except OverflowError:
+        raise ValueError(f"Line {line_number} is out of the float64 range.")
+
+
+def _parse_lines(text: bytes, first_line_number: int) -> np.ndarray:
+    """
+    Parses complete NDJSON lines with a single orjson call, by turning them
+    into one JSON array. If that does not give one number per line (e.g. a
+    blank line, or a string or null that NumPy would convert), the lines are
+    parsed one by one instead, which also finds the first bad line.
+    """
+    try:
+        values = orjson.loads(b"[" + text.replace(b"\n", b",") + b"]")
+        # A line such as "1,2" would add two values; type() also rules out bool
+        if len(values) == text.count(b"\n") + 1 and all(type(value) in (int, float) for value in values):
+            return np.array(values, dtype=np.float64)
+    except (orjson.JSONDecodeError, TypeError, ValueError, OverflowError):
+        pass
+    return np.array(
+        [
+            _parse_line(line, number)
+            for number, line in enumerate(text.split(b"\n"), first_line_number)
+            if line.strip()
+        ],
+        dtype=np.float64
+    )
+
+
+async def numbers_from_ndjson(chunks: AsyncIterable[bytes]) -> np.ndarray:
+    """
+    Parses a streamed NDJSON body holding one JSON number per line as it
+    arrives, a chunk at a time, keeping the values packed rather than as
+    Python floats. Blank lines are skipped; any other line that is not a
+    JSON number raises ValueError.
+
+    Returns:
+        float64 array of the values
+    """
+    parts = []
+    pending = b""
+    line_number = 1
+
+    async for chunk in chunks:
+        text = pending + chunk
+        end = text.rfind(b"\n")
+        if end < 0:
+            pending = text
+            continue
+        parts.append(_parse_lines(text[:end], line_number))
+        line_number += text.count(b"\n", 0, end) + 1
+        pending = text[end + 1:]
+    if pending.strip():
+        parts.append(_parse_lines(pending, line_number))
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.float64)
+
+
+def sum_of(values: np.ndarray, precision: str = PRECISION_FAST) -> float:
+    """
+    Sums values in one vectorized pass. PRECISION_FAST uses pairwise
+    summation, whose error grows with log n; PRECISION_EXACT returns the
+    correctly rounded sum (math.fsum), at a few times the cost. An empty
+    input gives 0, as sum() does.
+    """
+    if not values.size:
+        return 0
+    if precision == PRECISION_EXACT:
+        try:
+            return math.fsum(values.tolist())
+        except OverflowError:
+            return math.inf
+    # Overflow shows up as an infinite result, which callers check for
+    with np.errstate(over="ignore", invalid="ignore"):
+        return float(np.sum(values))
+
+
+def product_of(values: np.ndarray) -> float:
+    """
+    Multiplies values in one vectorized pass. An empty input gives 0.
+    """
+    with np.errstate(over="ignore", invalid="ignore"):
+        return float(np.prod(values)) if values.size else 0
+
+
+# Statistics /math/aggregate can compute, in response order
+AGGREGATE_OPERATIONS = ("sum", "product", "min", "max", "mean", "variance", "quantiles")
+
+# Values per block of an aggregation pass; a block's temporaries stay in cache
+AGGREGATE_BLOCK = 65536
+
+
+def aggregate(
+    values: np.ndarray,
+    operations: Sequence[str],
+    quantiles: Sequence[float] = (0.5,),
+    ddof: int = 0
+) -> Dict[str, Any]:
+    """
+    Computes the requested statistics of values in a single pass over
+    blocks of AGGREGATE_BLOCK values. Each block is reduced with NumPy and
+    merged into running totals; mean and variance are merged with the
+    parallel form of Welford's method (Chan et al.), which stays accurate
+    where the naive sum of squares cancels. Sums add the block sums with
+    math.fsum. Quantiles need the values themselves and use np.quantile
+    (linear interpolation, selection rather than a full sort).
+
+    Args:
+        values: float64 values
+        operations: Names from AGGREGATE_OPERATIONS
+        quantiles: Probabilities in [0, 1] for the quantiles operation
+        ddof: Delta degrees of freedom of the variance (0: population, 1: sample)
+
+    Returns:
+        {"count": ..., <operation>: ...}; statistics undefined for the
+        input (e.g. the mean of nothing) are None, and the product of
+        nothing is 0 as in /math/multiply
+    """
+    wanted = set(operations)
+    moments = bool(wanted & {"mean", "variance"})
+    partial_sums = []
+    product = 1.0
+    minimum = math.inf
+    maximum = -math.inf
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        for start in range(0, values.size, AGGREGATE_BLOCK):
+            block = values[start:start + AGGREGATE_BLOCK]
+            if "sum" in wanted:
+                partial_sums.append(float(np.sum(block)))
+            if "product" in wanted:
+                product *= float(np.prod(block))
+            if "min" in wanted:
+                minimum = min(minimum, float(block.min()))
+            if "max" in wanted:
+                maximum = max(maximum, float(block.max()))
+            if moments:
+                size = block.size
+                block_mean = float(block.mean())
+                block_m2 = float(np.square(block - block_mean).sum())
+                total = count + size
+                delta = block_mean - mean
+                mean += delta * size / total
+                m2 += block_m2 + delta * delta * count * size / total
+                count = total
+
+    empty = values.size == 0
+    results: Dict[str, Any] = {"count": int(values.size)}
+    for operation in AGGREGATE_OPERATIONS:
+        if operation not in wanted:
+            continue
+        if operation == "sum":
+            try:
+                results["sum"] = math.fsum(partial_sums)
+            except OverflowError:
+                results["sum"] = math.inf
+        elif operation == "product":
+            results["product"] = 0 if empty else product
+        elif operation == "min":
+            results["min"] = None if empty else minimum
+        elif operation == "max":
+            results["max"] = None if empty else maximum
+        elif operation == "mean":
+            results["mean"] = None if empty else mean
+        elif operation == "variance":
+            results["variance"] = m2 / (count - ddof) if count > ddof else None
+        elif operation == "quantiles":
+            results["quantiles"] = None if empty else np.quantile(values, quantiles).tolist()
+    return results
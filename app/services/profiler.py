@@ -0,0 +1,175 @@
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Profile ids are generated here; anything else is not a profile file
+_PROFILE_ID = re.compile(r"^[0-9]{14}-[0-9a-f]{12}$")
+COLLAPSED_SUFFIX = ".collapsed"
+
+# Prefix of the sampler threads' names, so samplers skip each other
+_SAMPLER_NAME = "profile-sampler"
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that records the Python stack of every thread at a
+    fixed interval from a background thread, while a request is handled.
+
+    Sampling reads sys._current_frames(), so the profiled code runs
+    unmodified: nothing is traced, and the cost is one stack walk per
+    thread per interval, paid by the sampler thread. Samples cover the whole
+    process, i.e. the event loop and the threadpool workers, with the
+    thread name as the root frame; a request that waits on I/O shows up as
+    the event loop sitting in its selector.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"{_SAMPLER_NAME}-{id(self)}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            threads = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                thread_name = threads.get(ident, str(ident))
+                if thread_name.startswith(_SAMPLER_NAME):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = names.get(code)
+                    if name is None:
+                        name = names[code] = _frame_name(code)
+                    stack.append(name)
+                    frame = frame.f_back
+                stack.append(thread_name.replace(";", ":"))
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """
+        Returns the samples as collapsed stacks ("root;...;leaf count" per
+        line), the input format of flamegraph.pl and most flame graph tools.
+        """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+def new_profile_id() -> str:
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime()) + "-" + secrets.token_hex(6)
+
+
+def _profile_path(directory: str, profile_id: str) -> Optional[str]:
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    return os.path.join(directory, profile_id + COLLAPSED_SUFFIX)
+
+
+def save_profile(directory: str, profile_id: str, collapsed: str, max_files: int):
+    """
+    Writes a profile atomically and deletes the oldest ones beyond max_files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = _profile_path(directory, profile_id)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(collapsed)
+    os.replace(temp_path, path)
+
+    # Ids start with the time, so they sort oldest first
+    for old_id in list_profiles(directory)[:-max_files]:
+        try:
+            os.remove(_profile_path(directory, old_id))
+        except OSError:
+            pass
+
+
+def list_profiles(directory: str) -> List[str]:
+    """
+    Returns the ids of the saved profiles, oldest first.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        name[:-len(COLLAPSED_SUFFIX)] for name in names
+        if name.endswith(COLLAPSED_SUFFIX) and _PROFILE_ID.match(name[:-len(COLLAPSED_SUFFIX)])
+    )
+
+
+def read_profile(directory: str, profile_id: str) -> Optional[str]:
+    """
+    Returns a saved profile as collapsed stacks, or None if there is none.
+    """
+    path = _profile_path(directory, profile_id)
+    if path is None:
+        return None
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _parse_collapsed(collapsed: str) -> List[Tuple[List[str], int]]:
+    stacks = []
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(" ")
+        if stack:
+            stacks.append((stack.split(";"), int(count)))
+    return stacks
+
+
+def speedscope_profile(collapsed: str, name: str, interval_ms: float) -> Dict[str, Any]:
+    """
+    Converts collapsed stacks to the speedscope file format
+    (https://www.speedscope.app), weighting each sample by the interval.
+    """
+    frames: List[Dict[str, str]] = []
+    frame_ids: Dict[str, int] = {}
+    samples = []
+    weights = []
+    for stack, count in _parse_collapsed(collapsed):
+        ids = []
+        for frame in stack:
+            if frame not in frame_ids:
+                frame_ids[frame] = len(frames)
+                frames.append({"name": frame})
+            ids.append(frame_ids[frame])
+        samples.append(ids)
+        weights.append(count * interval_ms)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "meds-api",
+    }
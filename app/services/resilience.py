@@ -0,0 +1,265 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+# Circuit breaker states, with the value reported by the github_circuit_state metric
+CIRCUIT_CLOSED = "closed"          # requests flow, failures are counted
+CIRCUIT_HALF_OPEN = "half_open"    # one trial request decides whether to close again
+CIRCUIT_OPEN = "open"              # requests fail fast until the reset time has passed
+CIRCUIT_STATE_VALUES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing, so callers fail fast (or
+    fall back to cached data) instead of each waiting out its timeouts.
+
+    After failure_threshold consecutive failures the circuit opens and
+    allow() refuses calls for reset_seconds. Then one trial call is let
+    through (half-open): its success closes the circuit, its failure opens
+    it again. Thread-safe; the state is only changed under a lock.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_seconds: float,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == CIRCUIT_OPEN and self._clock() - self._opened_at >= self.reset_seconds:
+                return CIRCUIT_HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Returns whether a call may go ahead. A call that is allowed must be
+        followed by record_success, record_failure or release.
+        """
+        with self._lock:
+            if self._state == CIRCUIT_OPEN:
+                if self._clock() - self._opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    return False
+                self._state = CIRCUIT_HALF_OPEN
+            if self._state == CIRCUIT_HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def retry_after(self) -> float:
+        """
+        Returns the seconds until an open circuit lets a trial call through.
+        """
+        with self._lock:
+            if self._state != CIRCUIT_OPEN:
+                return 0.0
+            return max(0.0, self.reset_seconds - (self._clock() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != CIRCUIT_OPEN:
+                    self.opened += 1
+                self._state = CIRCUIT_OPEN
+                self._opened_at = self._clock()
+            self._trial_in_flight = False
+
+    def release(self):
+        """
+        Ends an allowed call that neither succeeded nor failed (e.g. it was
+        cancelled), so a half-open circuit can try again.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns the state and counters, e.g. for metrics.
+        """
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+def backoff_delay(
+    attempt: int,
+    base: float,
+    cap: float,
+    random: Callable[[], float] = random.random
+) -> float:
+    """
+    Returns the wait before retry number attempt (0 for the first retry):
+    exponential backoff with full jitter, i.e. uniform between 0 and
+    min(cap, base * 2**attempt), so clients that failed together do not
+    retry together.
+    """
+    return random() * min(cap, base * 2 ** attempt)
+
+
+class LatencyWindow:
+    """
+    The most recent latencies of an upstream, for percentile estimates.
+    """
+
+    def __init__(self, size: int = 100):
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Returns the given percentile (0-100) of the recent latencies, or None
+        with fewer than min_samples of them.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+
+class ConcurrencyLimit:
+    """
+    Counting semaphore shared by threads and event loops: at most limit
+    holders at once, whether they block a thread (with) or wait on an event
+    loop (async with), so sync code in the threadpool and async code draw
+    on the same cap. Freed slots go to waiters first come, first served.
+
+    A freed slot is handed to the next waiter directly: a thread through an
+    Event, a coroutine through a future on its own loop, resolved with
+    call_soon_threadsafe.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active = 0
+        # Each hands a freed slot to one waiter, returning False if it cannot take it
+        self._waiters: Deque[Callable[[], bool]] = deque()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def _take(self) -> bool:
+        # Called with the lock held; waiters in line come first
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return True
+        return False
+
+    def acquire(self):
+        """
+        Takes a slot, blocking the calling thread until one is free.
+        """
+        with self._lock:
+            if self._take():
+                return
+            granted = threading.Event()
+
+            def hand_over() -> bool:
+                granted.set()
+                return True
+
+            self._waiters.append(hand_over)
+        granted.wait()
+
+    async def acquire_async(self):
+        """
+        Takes a slot, waiting on the running loop until one is free.
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            # A waiter cancelled after the hand-over passes the slot on
+            if granted.cancelled():
+                self.release()
+            else:
+                granted.set_result(None)
+
+        def hand_over() -> bool:
+            try:
+                loop.call_soon_threadsafe(grant)
+            except RuntimeError:
+                # The waiter's loop is closed
+                return False
+            return True
+
+        with self._lock:
+            if self._take():
+                return
+            self._waiters.append(hand_over)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = hand_over in self._waiters
+                if queued:
+                    self._waiters.remove(hand_over)
+            # The slot arrived just before the cancellation did
+            if not queued and granted.done() and not granted.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """
+        Frees a slot, handing it to the longest waiting caller if there is one.
+        """
+        with self._lock:
+            while self._waiters:
+                if self._waiters.popleft()():
+                    return
+            self._active -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
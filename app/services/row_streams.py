@@ -0,0 +1,58 @@
+import csv
+from io import StringIO
+from typing import AsyncIterator, Iterable, Mapping, Optional, Sequence
+
+import orjson
+
+# Target size of each chunk written to a streaming response
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+async def iter_bytes_chunks(body: bytes, chunk_size: int = STREAM_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """
+    Streams an already encoded body in chunk_size slices.
+    """
+    view = memoryview(body)
+    for start in range(0, len(body), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+async def iter_ndjson_chunks(
+    rows: Iterable[Mapping[str, Optional[str]]],
+    chunk_size: int = STREAM_CHUNK_BYTES
+) -> AsyncIterator[bytes]:
+    """
+    Encodes rows as newline-delimited JSON, yielding roughly chunk_size bytes
+    at a time so neither side has to hold the whole document.
+    """
+    buffer = bytearray()
+    for row in rows:
+        buffer += orjson.dumps(dict(row))
+        buffer += b"\n"
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def iter_csv_chunks(
+    rows: Iterable[Mapping[str, Optional[str]]],
+    columns: Sequence[str],
+    chunk_size: int = STREAM_CHUNK_BYTES
+) -> AsyncIterator[bytes]:
+    """
+    Encodes rows as CSV with a header line, yielding roughly chunk_size bytes
+    at a time.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row.get(column) for column in columns])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
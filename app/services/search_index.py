@@ -0,0 +1,159 @@
+import re
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+# Sorts after every real character, used as the upper bound of a prefix range
+_PREFIX_END = chr(0x10FFFF)
+
+_WORD = re.compile(r"\w+")
+
+# Trigrams of a query that a similar value may lack: a mistyped letter
+# changes up to three, two swapped letters up to four
+MAX_TYPO_TRIGRAMS = 4
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Returns the three-character substrings of text padded with two leading
+    spaces and one trailing space, so the start and end of a value weigh in.
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Ranked type-ahead search over the values of one column, built once per
+    dataset version.
+
+    Values are casefolded and matched as follows, best first:
+
+    1. the whole value equals the query
+    2. the value starts with the query
+    3. a later word of the value starts with the query
+    4. the query appears anywhere in the value (queries of 3+ characters)
+    5. the value is similar to the query, to tolerate typos (queries of 4+
+       characters): candidates are looked up in the postings of the query's
+       rarest trigrams, then each is verified to lack at most
+       MAX_TYPO_TRIGRAMS (and at most half) of the query's trigrams; more
+       shared trigrams rank higher, then shorter values
+
+    Values are sorted, so ranks 1 to 3 are binary searches over sorted lists
+    and rank 4 checks the candidates of the query's rarest trigram. Each rank
+    only runs if the better ones found fewer than the requested results, and
+    stops as soon as it has enough, so the work done follows the size of the
+    answer rather than the number of rows.
+    """
+
+    def __init__(self, values: Iterable[Optional[str]]):
+        positions: Dict[str, List[int]] = {}
+        for position, value in enumerate(values):
+            if value:
+                positions.setdefault(value.casefold(), []).append(position)
+
+        # Term ids follow the sorted order, so ascending ids are alphabetical
+        self._terms = sorted(positions)
+        self._positions = [positions[term] for term in self._terms]
+
+        words = []
+        grams: Dict[str, List[int]] = {}
+        for term_id, term in enumerate(self._terms):
+            for match in _WORD.finditer(term):
+                if match.start() > 0:
+                    words.append((match.group(), term_id))
+            for gram in trigrams(term):
+                grams.setdefault(gram, []).append(term_id)
+        words.sort()
+        self._words = [word for word, _ in words]
+        self._word_terms = [term_id for _, term_id in words]
+        self._grams = grams
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def search(self, query: str, limit: int = 10) -> List[int]:
+        """
+        Finds the rows whose value best matches query (see the class docstring).
+
+        Args:
+            query: Text typed so far
+            limit: Most row positions to return
+
+        Returns:
+            Row positions, best match first
+        """
+        query = " ".join(query.split()).casefold()
+        if not query or limit < 1:
+            return []
+
+        found: List[int] = []
+        seen: Set[int] = set()
+        rows = 0
+
+        def take(term_ids: Iterable[int]) -> bool:
+            # Adds terms in order; True once limit rows are covered
+            nonlocal rows
+            if rows >= limit:
+                return True
+            for term_id in term_ids:
+                if term_id in seen:
+                    continue
+                seen.add(term_id)
+                found.append(term_id)
+                rows += len(self._positions[term_id])
+                if rows >= limit:
+                    return True
+            return False
+
+        lo = bisect_left(self._terms, query)
+        hi = bisect_left(self._terms, query + _PREFIX_END, lo)
+        # The exact match, if any, sorts first in the prefix range
+        done = take(range(lo, hi))
+
+        if not done:
+            word_lo = bisect_left(self._words, query)
+            word_hi = bisect_left(self._words, query + _PREFIX_END, word_lo)
+            done = take(self._word_terms[word_lo:word_hi])
+
+        if not done and len(query) >= 3:
+            done = take(self._substring(query))
+
+        if not done and len(query) >= 4:
+            take(self._similar(query))
+
+        positions = [position for term_id in found for position in self._positions[term_id]]
+        return positions[:limit]
+
+    def _substring(self, query: str) -> Iterable[int]:
+        inner = [query[i:i + 3] for i in range(len(query) - 2)]
+        postings = [self._grams.get(gram, ()) for gram in inner]
+        rarest = min(postings, key=len)
+        return (term_id for term_id in rarest if query in self._terms[term_id])
+
+    def _similar(self, query: str) -> List[int]:
+        # Only the start is padded: the query is usually the start of a value
+        padded = "  " + query
+        grams = sorted(
+            {padded[i:i + 3] for i in range(len(padded) - 2)},
+            key=lambda gram: len(self._grams.get(gram, ()))
+        )
+        needed = max((len(grams) + 1) // 2, len(grams) - MAX_TYPO_TRIGRAMS)
+        # A term sharing `needed` trigrams is in one of the len - needed + 1
+        # rarest postings, so the common trigrams are only checked per candidate
+        cut = len(grams) - needed + 1
+        candidates = Counter()
+        for gram in grams[:cut]:
+            candidates.update(self._grams.get(gram, ()))
+
+        rest = grams[cut:]
+        scored = []
+        for term_id, count in candidates.items():
+            if count + len(rest) < needed:
+                continue
+            term = "  " + self._terms[term_id]
+            shared = count + sum(gram in term for gram in rest)
+            if shared >= needed:
+                scored.append((-shared, len(term), term_id))
+        scored.sort()
+        return [term_id for _, _, term_id in scored]
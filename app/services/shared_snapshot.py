@@ -0,0 +1,307 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, Mapping, Optional, Tuple
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import CacheSettings
+from app.services.github_client import FetchResult
+
+logger = logging.getLogger(__name__)
+
+# File layout: magic, header length (u32, little endian), JSON header, sections
+_MAGIC = b"DSNAP001"
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+@dataclass(frozen=True)
+class SharedSnapshot:
+    """
+    A published dataset version mapped read-only into this process.
+
+    sections are memoryviews over the mapping, so every worker reading the
+    same version shares one copy of the bytes through the page cache.
+    """
+    version: int
+    fetched_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+    sections: Mapping[str, memoryview]
+
+
+class SharedSnapshotStore:
+    """
+    A versioned snapshot file that worker processes on one host publish to
+    and map from.
+
+    Publishing writes a new file next to the old one and renames it into
+    place, so readers see either the previous version or the next one, never
+    a partial write. A reader that already mapped the old file keeps using it
+    until it next reads. Checking for a new version is a single stat call.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_path = path + ".lock"
+        self._mapped: Optional[Tuple[Tuple[int, int, int], SharedSnapshot]] = None
+        self._mapped_lock = threading.Lock()
+
+    def read(self) -> Optional[SharedSnapshot]:
+        """
+        Returns the latest published snapshot, or None if there is none (or
+        it cannot be read). The mapping is reused until the file changes.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        mapped = self._mapped
+        if mapped is not None and mapped[0] == key:
+            return mapped[1]
+
+        with self._mapped_lock:
+            try:
+                snapshot = self._map()
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                logger.warning("Ignoring unreadable shared snapshot %s: %s", self.path, e)
+                return None
+            self._mapped = (key, snapshot)
+            return snapshot
+
+    def _map(self) -> SharedSnapshot:
+        with open(self.path, "rb") as f:
+            # The mapping stays valid after the file is closed or replaced
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        if view[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("not a shared snapshot file")
+        start = len(_MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack(view[len(_MAGIC):start])
+        header = orjson.loads(view[start:start + header_length])
+
+        data_start = start + header_length
+        sections = {
+            name: view[data_start + offset:data_start + offset + length]
+            for name, (offset, length) in header["sections"].items()
+        }
+        return SharedSnapshot(
+            version=header["version"],
+            fetched_at=header["fetched_at"],
+            etag=header["etag"],
+            last_modified=header["last_modified"],
+            sections=sections
+        )
+
+    def publish(
+        self,
+        sections: Mapping[str, bytes],
+        fetched_at: float,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> SharedSnapshot:
+        """
+        Atomically replaces the snapshot with a new version.
+
+        Args:
+            sections: Named byte strings (or buffers) making up the dataset
+            fetched_at: When the data was last confirmed fresh upstream
+            etag: Upstream ETag of the data
+            last_modified: Upstream Last-Modified of the data
+
+        Returns:
+            The published snapshot, mapped from the new file
+        """
+        current = self.read()
+        layout = {}
+        offset = 0
+        for name, data in sections.items():
+            length = memoryview(data).nbytes
+            layout[name] = (offset, length)
+            offset += length
+        header = orjson.dumps({
+            "version": current.version + 1 if current is not None else 1,
+            "fetched_at": fetched_at,
+            "etag": etag,
+            "last_modified": last_modified,
+            "sections": layout,
+        })
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_MAGIC)
+                f.write(_HEADER_LENGTH.pack(len(header)))
+                f.write(header)
+                for data in sections.values():
+                    f.write(data)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        snapshot = self.read()
+        if snapshot is None:
+            raise OSError(f"Shared snapshot {self.path} could not be read back.")
+        return snapshot
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """
+        Holds the host-wide refresh lock (an flock on a side file), blocking
+        until any other process holding it is done.
+        """
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SharedFetch:
+    """
+    Fetch functions for a DatasetCache that share one upstream fetch per TTL
+    among all worker processes of a host.
+
+    A worker whose cache is due first looks at the shared snapshot. If it is
+    still fresh, the worker adopts it (or just revalidates, if it already has
+    that version) without calling the upstream. Otherwise the worker takes the
+    host-wide lock, checks again in case another worker refreshed meanwhile,
+    and only then fetches (conditionally on the shared validators), parses
+    and publishes. Upstream calls therefore stay constant as workers are added.
+
+    With no shared_path in the settings, calls go straight to the upstream.
+
+    advance, if given, turns newly fetched data into its next version given
+    the published one (see DatasetCache), before it is published.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[Optional[str], Optional[str]], FetchResult],
+        fetch_async: Callable[[Optional[str], Optional[str]], Awaitable[FetchResult]],
+        parse: Callable[[str], Any],
+        encode: Callable[[Any], Dict[str, bytes]],
+        decode: Callable[[Mapping[str, memoryview]], Any],
+        settings: Callable[[], CacheSettings],
+        advance: Optional[Callable[[Optional[Any], Any], Any]] = None,
+    ):
+        self._fetch = fetch
+        self._fetch_async = fetch_async
+        self._parse = parse
+        self._encode = encode
+        self._decode = decode
+        self._settings = settings
+        self._advance = advance
+        self._stores: Dict[str, SharedSnapshotStore] = {}
+        self.upstream_fetches = 0
+        self.shared_reads = 0
+
+    def store(self) -> Optional[SharedSnapshotStore]:
+        """
+        Returns the store for the configured shared_path, or None if sharing is off.
+        """
+        path = self._settings().shared_path
+        if not path:
+            return None
+        store = self._stores.get(path)
+        if store is None:
+            store = self._stores.setdefault(path, SharedSnapshotStore(path))
+        return store
+
+    def _is_fresh(self, snapshot: Optional[SharedSnapshot]) -> bool:
+        if snapshot is None:
+            return False
+        settings = self._settings()
+        age = time.time() - snapshot.fetched_at
+        return age < settings.ttl_seconds - settings.refresh_ahead_seconds
+
+    def _adopt(self, snapshot: SharedSnapshot, etag: Optional[str]) -> FetchResult:
+        """
+        Hands a shared snapshot to the cache: a not-modified result if the
+        caller already holds this version, otherwise the decoded data.
+        """
+        self.shared_reads += 1
+        if etag is not None and etag == snapshot.etag:
+            return FetchResult(
+                etag=snapshot.etag,
+                last_modified=snapshot.last_modified,
+                not_modified=True,
+                fetched_at=snapshot.fetched_at
+            )
+        return FetchResult(
+            etag=snapshot.etag,
+            last_modified=snapshot.last_modified,
+            data=self._decode(snapshot.sections),
+            fetched_at=snapshot.fetched_at
+        )
+
+    def _fetch_and_publish(self, store: SharedSnapshotStore, etag: Optional[str]) -> FetchResult:
+        shared = store.read()
+        if self._is_fresh(shared):
+            return self._adopt(shared, etag)
+
+        now = time.time()
+        self.upstream_fetches += 1
+        if shared is None:
+            result = self._fetch(None, None)
+        else:
+            result = self._fetch(shared.etag, shared.last_modified)
+
+        if result.not_modified:
+            if shared is None:
+                # Without a shared snapshot we sent no validators, so pass it on as is
+                return result
+            # Renew the published version; the sections are copied from the old mapping
+            shared = store.publish(shared.sections, now, result.etag, result.last_modified)
+            return self._adopt(shared, etag)
+
+        data = result.data if result.data is not None else self._parse(result.text)
+        if self._advance is not None:
+            data = self._advance(self._decode(shared.sections) if shared is not None else None, data)
+        store.publish(self._encode(data), now, result.etag, result.last_modified)
+        return FetchResult(
+            etag=result.etag,
+            last_modified=result.last_modified,
+            data=data,
+            fetched_at=now
+        )
+
+    def fetch(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        """
+        Fetch function for DatasetCache (see the class docstring).
+        """
+        store = self.store()
+        if store is None:
+            return self._fetch(etag, last_modified)
+
+        shared = store.read()
+        if self._is_fresh(shared):
+            return self._adopt(shared, etag)
+        with store.lock():
+            return self._fetch_and_publish(store, etag)
+
+    async def fetch_async(
+        self,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> FetchResult:
+        """
+        Async version of fetch. In shared mode the work, including waiting for
+        the host-wide lock, runs in the threadpool.
+        """
+        if self.store() is None:
+            return await self._fetch_async(etag, last_modified)
+        return await run_in_threadpool(self.fetch, etag, last_modified)
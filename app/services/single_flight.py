@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+
+class _Call:
+    """
+    A single in-flight execution and everyone waiting on it.
+    """
+    __slots__ = ("done", "result", "error", "futures")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        # (event loop, future) pairs for asyncio waiters, resolved thread-safely
+        self.futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def outcome(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single execution.
+
+    The first caller for a key runs the function; every caller that arrives
+    while it is in flight waits for and receives the same result, or the same
+    exception. Works for thread-based callers (do) and asyncio callers
+    (do_async), including a mix of the two sharing one execution.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        """
+        Returns the in-flight call for key and whether this caller leads it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.executions += 1
+            return call, True
+
+    def _finish(self, key: Hashable, call: _Call, result: Any = None, error: BaseException = None):
+        """
+        Publishes the outcome of call and wakes every waiter.
+        """
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.result = result
+            call.error = error
+            call.done.set()
+            futures, call.futures = call.futures, []
+
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve_future, future, call)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Runs fn once per key for all concurrent thread-based callers.
+
+        Args:
+            key: Identifies which calls may be shared
+            fn: Zero-argument callable producing the result
+
+        Returns:
+            The result of the shared execution
+        """
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            return call.outcome()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs the coroutine function fn once per key for all concurrent callers.
+
+        The execution runs as its own task, so cancelling the caller that
+        started it (e.g. a client disconnect) does not fail the other waiters.
+
+        Args:
+            key: Identifies which calls may be shared
+            fn: Zero-argument coroutine function producing the result
+
+        Returns:
+            The result of the shared execution
+        """
+        call, leader = self._join(key)
+        loop = asyncio.get_running_loop()
+
+        if leader:
+            async def run():
+                try:
+                    result = await fn()
+                except BaseException as e:
+                    self._finish(key, call, error=e)
+                else:
+                    self._finish(key, call, result=result)
+
+            task = loop.create_task(run())
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+        future = loop.create_future()
+        with self._lock:
+            if not call.done.is_set():
+                call.futures.append((loop, future))
+            else:
+                _resolve_future(future, call)
+
+        return await future
+
+    def in_flight(self, key: Hashable) -> bool:
+        """
+        Returns True if an execution for key is currently running.
+        """
+        return key in self._calls
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns counters describing how much work was coalesced.
+        """
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+# Strong references to running leader tasks (the event loop only keeps weak ones)
+_background_tasks = set()
+
+
+def _resolve_future(future: asyncio.Future, call: _Call):
+    if future.done():
+        return
+    if isinstance(call.error, asyncio.CancelledError):
+        future.cancel()
+    elif call.error is not None:
+        future.set_exception(call.error)
+    else:
+        future.set_result(call.result)
@@ -0,0 +1,117 @@
+import contextvars
+import time
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Phases reported in Server-Timing, in header order
+PHASE_AUTH = "auth"
+PHASE_CACHE = "cache"
+PHASE_UPSTREAM = "upstream"
+PHASE_PARSE = "parse"
+PHASE_SERIALIZE = "serialize"
+
+
+class RequestTimings:
+    """
+    Time spent per named phase while handling one request.
+
+    Phases nest (a cache lookup may wait for an upstream fetch, which feeds
+    the parser), and each phase is only charged its own time: time spent in
+    a nested phase is charged to that phase instead, so the phases add up to
+    no more than the request.
+    """
+
+    __slots__ = ("start", "phases")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        """
+        Returns the Server-Timing header value, with durations in milliseconds
+        and the time so far as "total".
+        """
+        entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.3f}")
+        return ", ".join(entries)
+
+
+# Timings of the request being handled; None when timing is off or outside
+# a request. Copied into threadpool calls and tasks the request starts.
+_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("timings", default=None)
+_parent: contextvars.ContextVar[Optional["phase"]] = contextvars.ContextVar("timing_phase", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    """
+    Starts timing the request handled in the current context.
+    """
+    timings = RequestTimings()
+    _timings.set(timings)
+    return timings
+
+
+def untimed_context() -> contextvars.Context:
+    """
+    Returns a copy of the current context without request timings, for work
+    that outlives the request (e.g. background refreshes).
+    """
+    context = contextvars.copy_context()
+    context.run(_timings.set, None)
+    context.run(_parent.set, None)
+    return context
+
+
+class phase:
+    """
+    Context manager charging the time spent in its block to a named phase
+    of the current request. Outside a timed request it does nothing beyond
+    one context variable lookup.
+    """
+
+    __slots__ = ("name", "timings", "nested", "start", "parent", "token")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _timings.get()
+        if self.timings is not None:
+            self.nested = 0.0
+            self.parent = _parent.get()
+            self.token = _parent.set(self)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is None:
+            return
+        elapsed = time.perf_counter() - self.start
+        _parent.reset(self.token)
+        # Nested phases running concurrently can add up to more than elapsed
+        self.timings.add(self.name, max(0.0, elapsed - self.nested))
+        if self.parent is not None:
+            self.parent.nested += elapsed
+
+
+def timed_iter(items: Iterable[T], name: str) -> Iterator[T]:
+    """
+    Passes items through, charging the time spent waiting for each one to a
+    phase, e.g. waiting for download chunks while parsing them.
+    """
+    if _timings.get() is None:
+        yield from items
+        return
+    iterator = iter(items)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -0,0 +1,88 @@
+"""
+Helpers shared by the benchmarks: synthetic data, timing statistics and
+JSON result files.
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+DOSAGES = ["5mg", "10mg", "20mg", "50mg", "100mg", "200mg", "250mg", "500mg"]
+FREQUENCIES = ["daily", "twice daily", "three times daily", "as needed", "weekly"]
+ROUTES = ["oral", "topical", "intravenous", "inhaled"]
+
+
+def make_csv(rows: int, seed: int = 0) -> str:
+    """
+    Builds a synthetic meds CSV with unique names and repetitive other columns.
+    """
+    rng = random.Random(seed)
+    lines = ["name,dosage,frequency,route"]
+    for i in range(rows):
+        lines.append(
+            f"Medication-{i:06d},{rng.choice(DOSAGES)},{rng.choice(FREQUENCIES)},{rng.choice(ROUTES)}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of already sorted values (None if there are none).
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """
+    Summarizes request latencies (in seconds) as requests/s and p50/p95/p99 in milliseconds.
+    """
+    latencies = sorted(latencies)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """
+    Describes where the benchmark ran, so results can be compared fairly.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def write_results(path: str, results: Dict[str, Any]):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
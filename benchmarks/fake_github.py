@@ -0,0 +1,110 @@
+"""
+Local stand-in for the GitHub contents API, for benchmarking without network access.
+
+Serves a synthetic meds CSV on any path with a content-derived ETag, answers
+304 Not Modified to a matching If-None-Match, and can add latency and
+random 502 errors.
+
+Usage:
+    python -m benchmarks.fake_github [--port 8001] [--rows 10000] [--latency-ms 50] [--error-rate 0.01]
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import make_csv
+
+
+class FakeGitHubServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the payload, the simulated latency and error
+    rate, and counters of what it answered.
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, rows: int = 10000, latency_ms: float = 0.0, error_rate: float = 0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.set_rows(rows)
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self.reset_counters()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/repos/bench/bench/contents/meds.csv"
+
+    def set_rows(self, rows: int):
+        self.body = make_csv(rows).encode()
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+    def reset_counters(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def counters(self) -> dict:
+        return {"requests": self.requests, "not_modified": self.not_modified, "errors": self.errors}
+
+    def start(self) -> "FakeGitHubServer":
+        threading.Thread(target=self.serve_forever, name="fake-github", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server: FakeGitHubServer = self.server
+        with server._lock:
+            server.requests += 1
+            fail = server._random.random() < server.error_rate
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000)
+
+        if fail:
+            with server._lock:
+                server.errors += 1
+            self._send(502, b"Bad Gateway")
+        elif self.headers.get("If-None-Match") == server.etag:
+            with server._lock:
+                server.not_modified += 1
+            self._send(304, b"", {"ETag": server.etag})
+        else:
+            self._send(200, server.body, {"ETag": server.etag, "Content-Type": "text/plain; charset=utf-8"})
+
+    def _send(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeGitHubServer(args.port, args.rows, args.latency_ms, args.error_rate)
+    print(f"Serving {args.rows} rows at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Size and decode-time benchmark for the /meds representations.
+
+Encodes synthetic datasets as JSON, NDJSON, CSV, MessagePack and Arrow
+with the app's own encoders, then reports per format the encoded and
+gzip-compressed size, the time the server spends encoding, and the time a
+client spends decoding (best and median of several repeats).
+
+Clients decode to what they would work with: JSON, NDJSON, CSV and
+MessagePack to a list of row dicts, Arrow to a columnar pyarrow Table.
+MessagePack and Arrow are skipped when msgpack or pyarrow is missing.
+
+Usage:
+    python -m benchmarks.formats [--rows 10000 100000] [--repeat 5] [--output formats.json]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import statistics
+import time
+from typing import AsyncIterator, Callable, Dict
+
+import orjson
+
+from app.config import CompressionSettings
+from app.services.binary_formats import MEDIA_ARROW, MEDIA_MSGPACK, available_media_types, msgpack, pyarrow
+from app.services.compression import compress
+from app.services.csv_parser import parse_meds_csv_columnar
+from app.services.meds_dataset import MedsDataset, build_meds_dataset
+from app.services.row_streams import iter_csv_chunks, iter_ndjson_chunks
+from benchmarks.common import environment, make_csv, write_results
+
+
+def _join(chunks: AsyncIterator[bytes]) -> bytes:
+    async def collect() -> bytes:
+        return b"".join([chunk async for chunk in chunks])
+    return asyncio.run(collect())
+
+
+def _read_arrow(body: bytes):
+    return pyarrow.ipc.open_stream(body).read_all()
+
+
+# Format -> (encode the whole dataset, decode on the client)
+FORMATS: Dict[str, tuple] = {
+    "json": (
+        lambda dataset: dataset.query_body(),
+        orjson.loads,
+    ),
+    "ndjson": (
+        lambda dataset: _join(iter_ndjson_chunks(dataset.rows)),
+        lambda body: [orjson.loads(line) for line in body.splitlines()],
+    ),
+    "csv": (
+        lambda dataset: _join(iter_csv_chunks(dataset.rows, dataset.columns)),
+        lambda body: list(csv.DictReader(io.StringIO(body.decode()))),
+    ),
+}
+if MEDIA_MSGPACK in available_media_types():
+    FORMATS["msgpack"] = (
+        lambda dataset: dataset.encode_binary(MEDIA_MSGPACK),
+        lambda body: msgpack.unpackb(body),
+    )
+if MEDIA_ARROW in available_media_types():
+    FORMATS["arrow"] = (
+        lambda dataset: dataset.encode_binary(MEDIA_ARROW),
+        _read_arrow,
+    )
+
+
+def best_and_median(run: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """
+    Runs run repeat times and returns the best and median wall time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {
+        "best_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+    }
+
+
+def measure(dataset: MedsDataset, repeat: int) -> Dict[str, Dict[str, object]]:
+    """
+    Encodes the dataset in every available format and measures sizes and timings.
+    """
+    gzip_settings = CompressionSettings()
+    results = {}
+    for name, (encode, decode) in FORMATS.items():
+        body = encode(dataset)
+        results[name] = {
+            "bytes": len(body),
+            "gzip_bytes": len(compress(body, "gzip", gzip_settings)),
+            "encode": best_and_median(lambda: encode(dataset), repeat),
+            "decode": best_and_median(lambda: decode(body), repeat),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "repeat": args.repeat, "formats": {}}
+    print(f"{'format':<8} {'rows':>8} {'size':>12} {'gzip':>12} {'encode':>10} {'decode':>10}")
+    for rows in args.rows:
+        text = make_csv(rows)
+        dataset = build_meds_dataset(parse_meds_csv_columnar(text, row_limit=rows), text)
+        for name, result in measure(dataset, args.repeat).items():
+            results["formats"].setdefault(name, {})[str(rows)] = result
+            print(
+                f"{name:<8} {rows:>8} {result['bytes']:>12,} {result['gzip_bytes']:>12,}"
+                f" {result['encode']['best_ms']:>7.2f} ms {result['decode']['best_ms']:>7.2f} ms"
+            )
+
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
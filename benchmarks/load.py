@@ -0,0 +1,276 @@
+"""
+Load and latency benchmark for the running application.
+
+Starts the real app under uvicorn, pointed at a local fake GitHub
+(benchmarks.fake_github), drives it with concurrent clients and reports
+requests/s and p50/p95/p99 latency per route for three scenarios:
+
+    cold      the app is restarted before each burst, so /meds pays for the
+              GitHub fetch and parse (repeated --cold-runs times)
+    warm      the /meds cache is primed and does not expire during the run
+    expiring  the /meds cache expires every --expiring-ttl seconds while loaded
+
+The client runs on the same machine, so absolute numbers include its
+overhead; compare runs made on the same host against a saved baseline.
+
+Usage:
+    python -m benchmarks.load [--scenarios cold warm expiring] [--requests 2000]
+        [--concurrency 32] [--workers 1] [--rows 10000] [--latency-ms 50]
+        [--error-rate 0] [--output results.json] [--baseline baseline.json]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.common import environment, load_results, summarize, write_results
+from benchmarks.fake_github import FakeGitHubServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+USERNAME = PASSWORD = "bench"
+
+# Route label -> (method, path, request options)
+ROUTES: Dict[str, Tuple[str, str, Dict[str, Any]]] = {
+    "/meds": ("GET", "/meds", {"auth": (USERNAME, PASSWORD)}),
+    "/math/add": ("POST", "/math/add", {"json": {"numbers": list(range(100))}}),
+    "/greet": ("GET", "/greet", {"params": {"name": "bench"}}),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """
+    The application running under uvicorn in a child process.
+    """
+
+    def __init__(self, github_url: str, workers: int, env: Dict[str, str]):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._workers = workers
+        self._env = {
+            **os.environ,
+            "MEDS_API_USERNAME": USERNAME,
+            "MEDS_API_PASSWORD": PASSWORD,
+            "GITHUB_PAT": "bench",
+            "MEDS_FILE_URL": github_url,
+            "RATE_LIMIT_ENABLED": "false",
+            "MEDS_CACHE_SNAPSHOT_PATH": "",
+            "MEDS_CACHE_SHARED_PATH": "",
+            **env,
+        }
+        self._process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "AppServer":
+        self._process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", "127.0.0.1", "--port", str(self.port),
+                "--workers", str(self._workers), "--log-level", "warning",
+            ],
+            cwd=ROOT,
+            env=self._env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError("The app exited during startup.")
+            try:
+                if httpx.get(self.url + "/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError("The app did not become healthy within 30 seconds.")
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        try:
+            self._process.wait(10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+
+async def drive(base_url: str, route: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Sends requests to one route from concurrency clients and summarizes the latencies.
+    Non-2xx/304 responses are counted as errors.
+    """
+    method, path, options = ROUTES[route]
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **options)
+                    ok = response.status_code < 300 or response.status_code == 304
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                if not ok:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+        elapsed = time.perf_counter() - start
+
+    return summarize(latencies, elapsed, errors)
+
+
+async def _burst(base_url: str, route: str, concurrency: int) -> Tuple[int, List[float]]:
+    """
+    Sends concurrency simultaneous requests on fresh connections.
+    Returns the error count and the latencies.
+    """
+    method, path, options = ROUTES[route]
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async def one() -> Tuple[bool, float]:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **options)
+                ok = response.status_code < 300
+            except httpx.HTTPError:
+                ok = False
+            return ok, time.perf_counter() - start
+
+        results = await asyncio.gather(*(one() for _ in range(concurrency)))
+    return sum(not ok for ok, _ in results), [latency for _, latency in results]
+
+
+def run_cold(github: FakeGitHubServer, args) -> Dict[str, Any]:
+    """
+    Restarts the app for every run and sends one burst of concurrent requests per route.
+    """
+    latencies: Dict[str, List[float]] = {route: [] for route in args.routes}
+    errors: Dict[str, int] = {route: 0 for route in args.routes}
+    elapsed: Dict[str, float] = {route: 0.0 for route in args.routes}
+
+    for _ in range(args.cold_runs):
+        with AppServer(github.url, args.workers, {}) as app:
+            for route in args.routes:
+                start = time.perf_counter()
+                burst_errors, samples = asyncio.run(_burst(app.url, route, args.concurrency))
+                elapsed[route] += time.perf_counter() - start
+                latencies[route].extend(samples)
+                errors[route] += burst_errors
+
+    return {route: summarize(latencies[route], elapsed[route], errors[route]) for route in args.routes}
+
+
+def run_loaded(github: FakeGitHubServer, args, env: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Starts the app once, primes /meds, then drives each route in turn.
+    """
+    with AppServer(github.url, args.workers, env) as app:
+        httpx.get(app.url + "/meds", auth=(USERNAME, PASSWORD), timeout=30)
+        return {
+            route: asyncio.run(drive(app.url, route, args.requests, args.concurrency))
+            for route in args.routes
+        }
+
+
+def run(args) -> Dict[str, Any]:
+    github = FakeGitHubServer(rows=args.rows, latency_ms=args.latency_ms, error_rate=args.error_rate).start()
+    scenarios = {}
+    try:
+        for scenario in args.scenarios:
+            github.reset_counters()
+            if scenario == "cold":
+                routes = run_cold(github, args)
+            elif scenario == "warm":
+                routes = run_loaded(github, args, {"MEDS_CACHE_TTL_SECONDS": "3600"})
+            else:
+                routes = run_loaded(github, args, {
+                    "MEDS_CACHE_TTL_SECONDS": str(args.expiring_ttl),
+                    "MEDS_CACHE_REFRESH_AHEAD_SECONDS": str(args.expiring_ttl / 4),
+                })
+            scenarios[scenario] = {"routes": routes, "github": github.counters()}
+    finally:
+        github.shutdown()
+
+    return {
+        "environment": environment(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("requests", "concurrency", "workers", "rows", "latency_ms",
+                        "error_rate", "cold_runs", "expiring_ttl")
+        },
+        "scenarios": scenarios,
+    }
+
+
+def _change(current: Optional[float], baseline: Optional[float]) -> str:
+    if current is None or not baseline:
+        return ""
+    return f"{(current - baseline) / baseline:+.0%}"
+
+
+def report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """
+    Prints one line per scenario and route, with changes relative to baseline if given.
+    """
+    header = f"{'scenario':<9} {'route':<10} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'github':>7}"
+    if baseline:
+        header += f" {'Δreq/s':>7} {'Δp50':>6} {'Δp99':>6}"
+    print(header)
+    for scenario, result in results["scenarios"].items():
+        for route, summary in result["routes"].items():
+            line = (
+                f"{scenario:<9} {route:<10} {summary['requests_per_second'] or 0:>9.1f} "
+                f"{summary['p50_ms'] or 0:>8.2f} {summary['p95_ms'] or 0:>8.2f} {summary['p99_ms'] or 0:>8.2f} "
+                f"{summary['errors']:>7} {result['github']['requests']:>7}"
+            )
+            old = (baseline or {}).get("scenarios", {}).get(scenario, {}).get("routes", {}).get(route)
+            if old:
+                line += (
+                    f" {_change(summary['requests_per_second'], old['requests_per_second']):>7}"
+                    f" {_change(summary['p50_ms'], old['p50_ms']):>6}"
+                    f" {_change(summary['p99_ms'], old['p99_ms']):>6}"
+                )
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=["cold", "warm", "expiring"],
+                        default=["cold", "warm", "expiring"])
+    parser.add_argument("--routes", nargs="+", choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per route (warm, expiring)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows in the fake GitHub CSV")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake GitHub response latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake GitHub 502s")
+    parser.add_argument("--cold-runs", type=int, default=5, help="App restarts in the cold scenario")
+    parser.add_argument("--expiring-ttl", type=float, default=1.0, help="Cache TTL in the expiring scenario")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved by an earlier --output")
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results, load_results(args.baseline) if args.baseline else None)
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Memory benchmark for the parsed meds dataset representations.
+
+Compares the retained size of parse_meds_csv (a list of dicts) against
+parse_meds_csv_columnar (ColumnarRows) for synthetic CSVs.
+
+Usage:
+    python -m benchmarks.memory_rows [--rows 10000 100000]
+"""
+import argparse
+import gc
+import tracemalloc
+
+from app.services.csv_parser import parse_meds_csv, parse_meds_csv_columnar
+from benchmarks.common import make_csv
+
+def retained_bytes(parse, csv_text: str, rows: int) -> int:
+    """
+    Returns the bytes still allocated after parsing, i.e. what the cache would hold.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    data = parse(csv_text, row_limit=rows)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'list of dicts':>15} {'columnar':>12} {'ratio':>7}")
+    for rows in args.rows:
+        csv_text = make_csv(rows)
+        dicts = retained_bytes(parse_meds_csv, csv_text, rows)
+        columnar = retained_bytes(parse_meds_csv_columnar, csv_text, rows)
+        print(f"{rows:>8} {dicts / 1e6:>12.2f} MB {columnar / 1e6:>9.2f} MB {dicts / columnar:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
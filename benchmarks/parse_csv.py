@@ -0,0 +1,70 @@
+"""
+Parse-time microbenchmarks for the meds CSV parsers.
+
+Times parse_meds_csv, parse_meds_csv_columnar and parse_meds_csv_stream
+(fed 64 KiB chunks, as a download would be) on synthetic CSVs, reporting
+the best and median of several repeats.
+
+Usage:
+    python -m benchmarks.parse_csv [--rows 1000 10000 100000] [--repeat 5] [--output parse.json]
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from app.services.csv_parser import parse_meds_csv, parse_meds_csv_columnar, parse_meds_csv_stream
+from benchmarks.common import environment, make_csv, write_results
+
+CHUNK_CHARS = 64 * 1024
+
+
+def _chunks(text: str) -> List[str]:
+    return [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+
+
+PARSERS: Dict[str, Callable[[str, int], object]] = {
+    "parse_meds_csv": lambda text, rows: parse_meds_csv(text, row_limit=rows),
+    "parse_meds_csv_columnar": lambda text, rows: parse_meds_csv_columnar(text, row_limit=rows),
+    "parse_meds_csv_stream": lambda text, rows: parse_meds_csv_stream(_chunks(text), row_limit=rows),
+}
+
+
+def time_parser(parse: Callable[[str, int], object], text: str, rows: int, repeat: int) -> Dict[str, float]:
+    """
+    Runs parse repeat times and returns the best and median wall time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(text, rows)
+        timings.append(time.perf_counter() - start)
+    return {
+        "best_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "repeat": args.repeat, "parsers": {}}
+    print(f"{'parser':<26} {'rows':>8} {'best':>10} {'median':>10} {'rows/s':>12}")
+    for rows in args.rows:
+        text = make_csv(rows)
+        for name, parse in PARSERS.items():
+            timing = time_parser(parse, text, rows, args.repeat)
+            results["parsers"].setdefault(name, {})[str(rows)] = timing
+            rate = rows / (timing["best_ms"] / 1000)
+            print(f"{name:<26} {rows:>8} {timing['best_ms']:>7.1f} ms {timing['median_ms']:>7.1f} ms {rate:>12,.0f}")
+
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Latency microbenchmarks for the /meds/search index.
+
+Builds a SearchIndex over synthetic medication names (made of common drug
+name syllables, so many names share prefixes and trigrams) and times
+queries that hit each ranking tier: prefixes, later words, substrings,
+typos and queries with no match. Reports the build time and the median
+and worst time per query.
+
+Usage:
+    python -m benchmarks.search [--rows 10000 100000] [--repeat 200] [--output search.json]
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from app.services.search_index import SearchIndex
+from benchmarks.common import environment, write_results
+
+SYLLABLES = [
+    "ace", "ami", "bu", "car", "cef", "cla", "dex", "di", "flu", "ga", "hy", "ibu", "ke", "lan",
+    "lo", "met", "mi", "na", "ol", "pam", "pra", "pro", "quin", "ra", "sal", "ser", "ta", "tra",
+    "va", "zo", "fen", "xin", "mab", "pril", "sartan", "statin", "zole", "mycin", "cillin",
+]
+SUFFIXES = ["", " hydrochloride", " sodium", " acid", " sulfate", " extended release", " tablets"]
+
+QUERIES = {
+    "prefix": ["i", "ibu", "ibupro", "hydro"],
+    "word": ["sodium", "acid", "extended"],
+    "substring": ["statin", "mycin", "profen"],
+    "typo": ["ibuprofin", "metfromin", "carlanzo"],
+    "no match": ["zzz", "xyzqw"],
+}
+
+
+def make_names(rows: int, seed: int = 0) -> List[str]:
+    """
+    Builds synthetic medication names from drug name syllables and suffixes.
+    """
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize() + rng.choice(SUFFIXES)
+        for _ in range(rows)
+    ]
+
+
+def time_query(index: SearchIndex, query: str, repeat: int) -> Dict[str, float]:
+    """
+    Runs a search repeat times and returns the median and worst time in microseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index.search(query, 10)
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_us": round(statistics.median(timings) * 1e6, 1),
+        "max_us": round(max(timings) * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "repeat": args.repeat, "rows": {}}
+    for rows in args.rows:
+        names = make_names(rows)
+        start = time.perf_counter()
+        index = SearchIndex(names)
+        build_ms = round((time.perf_counter() - start) * 1000, 1)
+        result = results["rows"][str(rows)] = {"build_ms": build_ms, "queries": {}}
+        print(f"{rows} rows, {len(index)} distinct names, index built in {build_ms} ms")
+        print(f"  {'tier':<10} {'query':<12} {'median':>12} {'max':>12}")
+        for tier, queries in QUERIES.items():
+            for query in queries:
+                timing = time_query(index, query, args.repeat)
+                result["queries"][query] = {"tier": tier, **timing}
+                print(f"  {tier:<10} {query:<12} {timing['median_us']:>9.1f} us {timing['max_us']:>9.1f} us")
+
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
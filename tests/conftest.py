@@ -33,9 +33,116 @@ def client():
     }, clear=False):
         from app.main import app
         
-        # Clear the meds cache before each test
+        # Clear the meds cache, cached settings and circuit breakers before each test
+        from app.config import get_meds_cache_settings
         from app.routes import meds
-        meds._cached_data = None
-        meds._cache_timestamp = 0
+        from app.services.github_client import reset_upstream_policies
+        get_meds_cache_settings.cache_clear()
+        meds.meds_cache.clear()
+        app.state.rate_limiter.reset()
+        reset_upstream_policies()
         
-        return TestClient(app)
\ No newline at end of file
+        return TestClient(app)
+
+class FakeGitHub:
+    """
+    In-process stand-in for the GitHub contents API.
+
+    Serves `csv_text` with a content-derived ETag and honours If-None-Match by
+    answering 304 Not Modified. Set `status_code` to simulate upstream errors,
+    `error` to an exception to simulate a connection failure, and `delay` to
+    slow responses down. With `chunk_size` set the body is streamed in chunks
+    and `chunks_sent` counts how many the client actually pulled.
+    `script` lists outcomes for the next requests, one each, before the
+    settings above apply again: a status code, an httpx.Response or an
+    exception to raise. `requests` records what the clients sent.
+    """
+
+    def __init__(self, csv_text="name,dosage\nAspirin,100mg"):
+        self.csv_text = csv_text
+        self.status_code = 200
+        self.error = None
+        self.delay = 0.0
+        self.chunk_size = None
+        self.chunks_sent = 0
+        self.requests = []
+        self.script = []
+        self.sync_requests = 0
+
+    @property
+    def etag(self):
+        import hashlib
+        return '"' + hashlib.sha1(self.csv_text.encode()).hexdigest() + '"'
+
+    def _chunks(self):
+        body = self.csv_text.encode()
+        for start in range(0, len(body), self.chunk_size):
+            self.chunks_sent += 1
+            yield body[start:start + self.chunk_size]
+
+    async def _async_chunks(self):
+        for chunk in self._chunks():
+            yield chunk
+
+    def respond(self, request, streaming=None):
+        import httpx
+
+        self.requests.append(request)
+        if self.script:
+            outcome = self.script.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome if isinstance(outcome, httpx.Response) else httpx.Response(outcome)
+        if self.error is not None:
+            raise self.error
+        if self.status_code != 200:
+            return httpx.Response(self.status_code)
+        if request.headers.get("If-None-Match") == self.etag:
+            return httpx.Response(304, headers={"ETag": self.etag})
+        if self.chunk_size and streaming is not None:
+            return httpx.Response(200, content=streaming(), headers={"ETag": self.etag})
+        return httpx.Response(200, text=self.csv_text, headers={"ETag": self.etag})
+
+    def handler(self, request):
+        import time
+
+        self.sync_requests += 1
+        time.sleep(self.delay)
+        return self.respond(request, self._chunks)
+
+    async def async_handler(self, request):
+        import asyncio
+
+        await asyncio.sleep(self.delay)
+        return self.respond(request, self._async_chunks)
+
+
+@pytest.fixture
+def fake_github():
+    """
+    Fixture that routes the sync and async GitHub clients to a FakeGitHub.
+    Retries keep their default count but back off for at most 10ms, and
+    circuit breakers start closed.
+
+    Returns:
+        FakeGitHub: The fake upstream, for configuring responses and inspecting requests.
+    """
+    import httpx
+    from app.config import get_github_settings
+    from app.services.github_client import reset_upstream_policies
+
+    fake = FakeGitHub()
+    sync_client = httpx.Client(transport=httpx.MockTransport(fake.handler))
+    async_client = httpx.AsyncClient(transport=httpx.MockTransport(fake.async_handler))
+
+    get_github_settings.cache_clear()
+    reset_upstream_policies()
+    with patch("app.services.github_client.GITHUB_API_URL", "https://api.github.com/test"), \
+            patch("app.services.github_client.get_http_client", return_value=sync_client), \
+            patch("app.services.github_client.get_async_http_client", return_value=async_client), \
+            patch.dict(os.environ, {"GITHUB_RETRY_BASE_SECONDS": "0.001", "GITHUB_RETRY_MAX_SECONDS": "0.01"}):
+        yield fake
+    get_github_settings.cache_clear()
+    reset_upstream_policies()
+
+    sync_client.close()
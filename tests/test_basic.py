@@ -49,7 +49,7 @@ def test_math_index(client):
     assert "resource" in data
     assert data["resource"] == "math"
     assert "operations" in data
-    assert len(data["operations"]) == 2
+    assert len(data["operations"]) == 3
 
 def test_math_add(client):
     """Test POST /math/add sums a list of numbers correctly."""
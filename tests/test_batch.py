@@ -0,0 +1,154 @@
+"""
+Tests for the POST /batch endpoint.
+
+This module tests running several API calls in one request: per-item
+statuses in request order, authenticating the batch once, charging each
+item to the rate limit, and the limits on batch size, nesting, response
+size and concurrency.
+"""
+import asyncio
+import os
+from unittest.mock import patch
+
+from app.config import BulkheadRule, BulkheadSettings, RateLimitRule
+from app.middleware.bulkhead import Bulkheads
+from app.routes import batch as batch_route
+
+AUTH = ("testuser", "testpass")
+TEST_ENV = {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+    "GITHUB_PAT": "fake_token",
+    "MEDS_CACHE_REFRESH_MODE": "blocking",
+}
+
+
+def run_batch(client, *items, **kwargs):
+    return client.post("/batch", json={"requests": list(items)}, **kwargs)
+
+
+def test_items_answer_in_order_with_their_own_status(client):
+    """Test that each item gets its own status and body, in request order, with its id echoed."""
+    response = run_batch(
+        client,
+        {"id": "hello", "method": "get", "path": "/greet?name=Ann"},
+        {"method": "POST", "path": "/math/add", "body": {"numbers": [1, 2.5]}},
+        {"method": "POST", "path": "/math/add", "body": {"numbers": ["x"]}},
+        {"method": "GET", "path": "/missing"},
+        {"method": "POST", "path": "/health"},
+    )
+    assert response.status_code == 200
+    items = response.json()["responses"]
+    assert [item["status"] for item in items] == [200, 200, 422, 404, 405]
+    assert items[0] == {
+        "id": "hello",
+        "status": 200,
+        "headers": {"content-type": "application/json"},
+        "body": {"message": "Hello, Ann!"},
+    }
+    assert items[1]["id"] is None
+    assert items[1]["body"] == {"result": 3.5}
+    assert items[2]["body"]["detail"][0]["loc"] == ["body", "numbers", 0]
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_batch_credentials_cover_every_item(client, fake_github):
+    """Test that credentials sent with the batch hold for every protected item."""
+    response = run_batch(client, *[{"method": "GET", "path": "/meds"}] * 3, auth=AUTH)
+    items = response.json()["responses"]
+    assert [item["status"] for item in items] == [200, 200, 200]
+    assert items[0]["body"]["count"] == 1
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_invalid_credentials_fail_the_whole_batch(client, fake_github):
+    """Test that wrong credentials answer 401 without running any item."""
+    response = run_batch(client, {"method": "GET", "path": "/meds"}, auth=("testuser", "wrong"))
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Basic"
+    assert fake_github.requests == []
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_protected_items_need_credentials(client, fake_github):
+    """Test that without credentials protected items get their own 401 and the rest still run."""
+    response = run_batch(client, {"method": "GET", "path": "/meds"}, {"method": "GET", "path": "/health"})
+    assert response.status_code == 200
+    meds, health = response.json()["responses"]
+    assert meds["status"] == 401
+    assert meds["headers"]["www-authenticate"] == "Basic"
+    assert health["status"] == 200
+    assert fake_github.requests == []
+
+
+def test_items_are_charged_to_the_rate_limit(client):
+    """Test that every item spends a token of its route's limit, and items over it get 429."""
+    rules = [RateLimitRule("/health", rate=0.001, burst=3), RateLimitRule("/", rate=10, burst=10)]
+    with patch.object(client.app.state.rate_limiter, "_rules", rules):
+        response = run_batch(client, *[{"method": "GET", "path": "/health"}] * 5)
+    items = response.json()["responses"]
+    assert [item["status"] for item in items] == [200, 200, 200, 429, 429]
+    assert int(items[3]["headers"]["retry-after"]) >= 1
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_items_run_under_their_route_bulkhead(client, fake_github):
+    """Test that a batch cannot run more /meds items at once than the /meds bulkhead allows."""
+    fake_github.delay = 0.05
+    bulkheads = Bulkheads(BulkheadSettings(rules=(BulkheadRule("/meds", 1, 1, 5),)))
+    with patch.object(client.app.state, "bulkheads", bulkheads):
+        response = run_batch(client, *[{"method": "GET", "path": "/meds"}] * 4, auth=AUTH)
+    items = response.json()["responses"]
+    assert [item["status"] for item in items] == [200, 200, 503, 503]
+    assert items[2]["headers"]["retry-after"] == "5"
+    assert bulkheads.bulkhead_for("/meds").stats() == {"active": 0, "queued": 0, "queue_full": 2, "timeout": 0}
+
+
+def test_batch_limits(client):
+    """Test that oversized, empty and nested batches are rejected before anything runs."""
+    item = {"method": "GET", "path": "/health"}
+    assert run_batch(client, *[item] * 21).status_code == 422
+    assert run_batch(client).status_code == 422
+    assert run_batch(client, {"method": "DELETE", "path": "/health"}).status_code == 422
+
+    nested = run_batch(client, {"method": "POST", "path": "/batch/?x=1"})
+    assert nested.status_code == 422
+    assert nested.json()["detail"][0]["loc"] == ["body", "requests", 0, "path"]
+
+    for path in ("/%62atch", "/batch%2F", "/%62atch/?x=1"):
+        assert run_batch(client, {"method": "POST", "path": path}).status_code == 422
+
+    too_large = run_batch(client, {**item, "id": "x", "body": "a" * (1024 * 1024)})
+    assert too_large.status_code == 413
+
+
+def test_response_budget(client):
+    """Test that items whose responses would exceed the batch's response budget get 413."""
+    item = {"method": "GET", "path": "/greet?name=Ann"}
+    with patch.object(batch_route, "BATCH_CONCURRENCY", 1), patch.object(batch_route, "MAX_BATCH_RESPONSE_BYTES", 60):
+        response = run_batch(client, item, item, item)
+    assert [item["status"] for item in response.json()["responses"]] == [200, 200, 413]
+
+
+def test_items_run_with_bounded_concurrency(client):
+    """Test that no more than BATCH_CONCURRENCY items of one batch run at once."""
+    dispatch = batch_route._dispatch
+    running = []
+    peak = 0
+
+    async def counting_dispatch(*args):
+        nonlocal peak
+        running.append(None)
+        peak = max(peak, len(running))
+        await asyncio.sleep(0.01)
+        try:
+            return await dispatch(*args)
+        finally:
+            running.pop()
+
+    with patch.object(batch_route, "_dispatch", counting_dispatch):
+        response = run_batch(client, *[{"method": "GET", "path": f"/greet?name={n}"} for n in range(10)])
+    assert [item["body"]["message"] for item in response.json()["responses"]] == [
+        f"Hello, {n}!" for n in range(10)
+    ]
+    assert peak == batch_route.BATCH_CONCURRENCY
@@ -0,0 +1,177 @@
+"""
+Tests for the per-route concurrency bulkheads.
+
+This module tests the bulkhead queue on its own, shedding through the
+middleware while unlimited routes keep answering, the rule parsing and the
+configurable threadpool size.
+"""
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+import anyio.to_thread
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import BulkheadRule, BulkheadSettings, get_bulkhead_settings, parse_bulkhead_rules
+from app.middleware.bulkhead import SHED_QUEUE_FULL, SHED_TIMEOUT, Bulkhead, BulkheadMiddleware, Bulkheads
+from app.services.metrics import REGISTRY
+
+
+def test_bulkhead_queues_in_order_and_sheds_the_rest():
+    """Test that waiters get freed slots first come, first served, and a full queue sheds."""
+    async def scenario():
+        bulkhead = Bulkhead(BulkheadRule("/slow", max_concurrent=1, max_queued=2, queue_timeout_seconds=1))
+        order = []
+
+        async def request(name):
+            if await bulkhead.acquire() is None:
+                order.append(name)
+                await asyncio.sleep(0.01)
+                bulkhead.release()
+            else:
+                order.append(f"{name} shed")
+
+        await asyncio.gather(*(request(name) for name in "abcd"))
+        return order, bulkhead.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["a", "d shed", "b", "c"]
+    assert stats == {"active": 0, "queued": 0, SHED_QUEUE_FULL: 1, SHED_TIMEOUT: 0}
+
+
+def test_bulkhead_queue_timeout_and_cancelled_waiters():
+    """Test that waiters give up after the queue timeout, and cancelled ones leave the queue."""
+    async def scenario():
+        bulkhead = Bulkhead(BulkheadRule("/slow", max_concurrent=1, max_queued=5, queue_timeout_seconds=0.02))
+        assert await bulkhead.acquire() is None
+        assert await bulkhead.acquire() == SHED_TIMEOUT
+
+        waiter = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+        assert bulkhead.queued == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert bulkhead.queued == 0
+
+        bulkhead.release()
+        return bulkhead.stats()
+
+    assert asyncio.run(scenario()) == {"active": 0, "queued": 0, SHED_QUEUE_FULL: 0, SHED_TIMEOUT: 1}
+
+
+@pytest.mark.parametrize("granted", [True, False])
+def test_release_racing_the_queue_timeout(granted):
+    """Test that a waiter released just as it times out neither fails nor keeps the slot."""
+    async def scenario():
+        bulkhead = Bulkhead(BulkheadRule("/slow", max_concurrent=1, max_queued=1, queue_timeout_seconds=1))
+        assert await bulkhead.acquire() is None
+
+        async def timed_out(waiter, timeout):
+            # release() runs inside the timeout's cancellation window: either
+            # before the waiter is cancelled (granting it the slot) or after
+            if not granted:
+                waiter.cancel()
+            bulkhead.release()
+            raise asyncio.TimeoutError()
+
+        with patch("asyncio.wait_for", timed_out):
+            assert await bulkhead.acquire() == SHED_TIMEOUT
+        return bulkhead.stats()
+
+    assert asyncio.run(scenario()) == {"active": 0, "queued": 0, SHED_QUEUE_FULL: 0, SHED_TIMEOUT: 1}
+
+
+def make_app(settings):
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    app.add_middleware(BulkheadMiddleware, bulkheads=Bulkheads(settings))
+    return app
+
+
+def test_full_route_group_is_shed_while_others_answer():
+    """Test that a saturated group answers 503 quickly and unlimited routes are not delayed."""
+    rule = BulkheadRule("/slow", max_concurrent=2, max_queued=1, queue_timeout_seconds=5)
+    app = make_app(BulkheadSettings(rules=(rule,)))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = [asyncio.ensure_future(client.get("/slow")) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            shed = await client.get("/slow")
+            health = await client.get("/health")
+            elapsed = time.perf_counter() - start
+            return [r.status_code for r in await asyncio.gather(*slow)], shed, health, elapsed
+
+    statuses, shed, health, elapsed = asyncio.run(scenario())
+    assert statuses == [200, 200, 200]
+    assert shed.status_code == 503
+    assert shed.headers["Retry-After"] == "5"
+    assert health.status_code == 200
+    assert elapsed < 0.1
+    assert 'http_bulkhead_shed_total{group="/slow",reason="queue_full"} 1' in REGISTRY.render()
+
+
+def test_bulkheads_can_be_disabled():
+    """Test that disabled bulkheads let every request through."""
+    rule = BulkheadRule("/", max_concurrent=1, max_queued=0, queue_timeout_seconds=1)
+    app = make_app(BulkheadSettings(enabled=False, rules=(rule,)))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.get("/slow") for _ in range(3)))
+
+    assert [response.status_code for response in asyncio.run(scenario())] == [200, 200, 200]
+
+
+def test_longest_prefix_wins():
+    """Test that each path is limited by its most specific rule."""
+    rules = parse_bulkhead_rules("/meds=4:8:1, /meds/search=2:4:0.5")
+    bulkheads = Bulkheads(BulkheadSettings(rules=rules))
+    assert bulkheads.bulkhead_for("/meds/search").rule.max_concurrent == 2
+    assert bulkheads.bulkhead_for("/meds").rule.max_concurrent == 4
+    assert bulkheads.bulkhead_for("/medsx") is None
+
+
+@pytest.mark.parametrize("value", ["/meds=4:8", "meds=4:8:1", "/meds=0:8:1", "/meds=4:8:0", "/a=1:1:1,/a=2:2:2"])
+def test_invalid_bulkhead_rules(value):
+    """Test that malformed rules fail fast with RuntimeError."""
+    with pytest.raises(RuntimeError):
+        parse_bulkhead_rules(value)
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "test",
+    "MEDS_API_PASSWORD": "test",
+    "GITHUB_PAT": "test_token",
+    "MEDS_FILE_URL": "https://api.github.com/test",
+    "THREADPOOL_TOKENS": "7",
+})
+@patch("app.services.github_client.GITHUB_API_URL", "https://api.github.com/test")
+def test_threadpool_size_is_configurable():
+    """Test that the lifespan sizes the threadpool from THREADPOOL_TOKENS."""
+    from app.main import app
+
+    get_bulkhead_settings.cache_clear()
+    try:
+        with TestClient(app) as client:
+            async def tokens():
+                return anyio.to_thread.current_default_thread_limiter().total_tokens
+            assert client.portal.call(tokens) == 7
+    finally:
+        get_bulkhead_settings.cache_clear()
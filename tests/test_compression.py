@@ -0,0 +1,176 @@
+"""
+Tests for response compression.
+
+This module tests content coding negotiation, precompressed /meds variants
+and the size threshold for dynamically compressed responses.
+"""
+import gzip
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app.config import CompressionSettings, get_compression_settings
+from app.services import compression
+from app.services.compression import available_encodings, choose_encoding, precompress
+from app.services.meds_dataset import decode_meds_dataset, encode_meds_dataset
+
+AUTH = ("testuser", "testpass")
+LARGE_CSV = "name,dosage\n" + "".join(f"Medication {i},{i % 7 * 50}mg\n" for i in range(500))
+
+pytestmark = pytest.mark.usefixtures("meds_env")
+
+
+@pytest.fixture
+def meds_env():
+    with patch.dict(os.environ, {"MEDS_API_USERNAME": "testuser", "MEDS_API_PASSWORD": "testpass"}):
+        yield
+
+
+VARIANTS = {"gzip": b"x" * 30, "br": b"x" * 20, "zstd": b"x" * 25}
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br, zstd", "br"),
+    ("gzip;q=1.0, br;q=0.5", "gzip"),
+    ("br;q=0", None),
+    ("*", "br"),
+    ("*, br;q=0", "zstd"),
+    ("identity", None),
+    ("identity;q=1, gzip;q=0.5", None),
+    ("deflate", None),
+    ("GZIP", "gzip"),
+])
+def test_choose_encoding(accept_encoding, expected):
+    """Test that the smallest variant among the best-quality codings is chosen."""
+    assert choose_encoding(accept_encoding, VARIANTS) == expected
+
+
+def test_precompress_round_trip():
+    """Test that every available coding is produced and decodes to the body."""
+    body = b'{"name": "Aspirin"}' * 200
+    variants = precompress(body, CompressionSettings())
+    assert set(variants) == set(available_encodings())
+    assert gzip.decompress(variants["gzip"]) == body
+    assert all(len(data) < len(body) for data in variants.values())
+
+
+def test_precompress_skips_small_bodies():
+    """Test that bodies below the threshold or with compression off get no variants."""
+    assert precompress(b"{}" * 10, CompressionSettings(min_bytes=1024)) == {}
+    assert precompress(b"{}" * 1000, CompressionSettings(enabled=False)) == {}
+
+
+def test_meds_serves_precompressed_variant(client, fake_github):
+    """Test that /meds sends the stored variant with its own ETag and 304s on it."""
+    fake_github.csv_text = LARGE_CSV
+    identity = client.get("/meds", auth=AUTH, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["vary"] == "Accept, Accept-Encoding"
+
+    for encoding in available_encodings():
+        response = client.get("/meds", auth=AUTH, headers={"Accept-Encoding": encoding})
+        assert response.headers["content-encoding"] == encoding
+        assert response.content == identity.content
+        assert response.headers["etag"] == identity.headers["etag"][:-1] + f'-{encoding}"'
+
+        cached = client.get("/meds", auth=AUTH, headers={
+            "Accept-Encoding": encoding,
+            "If-None-Match": response.headers["etag"]
+        })
+        assert cached.status_code == 304
+        assert "content-encoding" not in cached.headers
+
+
+def test_meds_compresses_once_per_dataset_version(client, fake_github):
+    """Test that repeated requests reuse the stored variants instead of compressing."""
+    fake_github.csv_text = LARGE_CSV
+    client.get("/meds", auth=AUTH)
+
+    with patch.object(compression, "compress", wraps=compression.compress) as spy:
+        for _ in range(5):
+            response = client.get("/meds", auth=AUTH, headers={"Accept-Encoding": "gzip, br"})
+            assert response.status_code == 200
+    assert spy.call_count == 0
+
+
+def test_meds_csv_serves_precompressed_variant(client, fake_github):
+    """Test that unfiltered text/csv streams the stored compressed upstream file."""
+    fake_github.csv_text = LARGE_CSV
+    response = client.get("/meds", auth=AUTH, headers={"Accept": "text/csv", "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == LARGE_CSV
+    assert response.headers["etag"].endswith('-gzip"')
+
+
+def test_small_responses_are_not_compressed(client):
+    """Test that responses below the threshold are sent uncompressed."""
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_large_dynamic_responses_are_gzipped(client, fake_github):
+    """Test that large per-request bodies, like filtered pages, are gzipped."""
+    fake_github.csv_text = LARGE_CSV
+    response = client.get("/meds?dosage=0mg", auth=AUTH, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["count"] == 72
+
+
+def test_gzipped_stream_gets_a_weak_etag(client, fake_github):
+    """Test that the gzipped NDJSON stream does not reuse the identity body's strong ETag."""
+    fake_github.csv_text = LARGE_CSV
+    ndjson = {"Accept": "application/x-ndjson"}
+    identity = client.get("/meds", auth=AUTH, headers={**ndjson, "Accept-Encoding": "identity"})
+    response = client.get("/meds", auth=AUTH, headers={**ndjson, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == identity.content
+    assert response.headers["etag"] == "W/" + identity.headers["etag"]
+
+    cached = client.get("/meds", auth=AUTH, headers={
+        **ndjson,
+        "Accept-Encoding": "gzip",
+        "If-None-Match": response.headers["etag"]
+    })
+    assert cached.status_code == 304
+
+
+def test_negotiated_identity_is_not_gzipped(client, fake_github):
+    """Test that a cached body sent as identity by choice is not gzipped on the way out."""
+    fake_github.csv_text = LARGE_CSV
+    response = client.get("/meds", auth=AUTH, headers={"Accept-Encoding": "identity;q=1, gzip;q=0.5"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept, Accept-Encoding"
+
+
+def test_shared_snapshot_keeps_variants(client, fake_github):
+    """Test that compressed variants survive encoding for a shared snapshot."""
+    from app.routes.meds import get_meds_dataset
+
+    fake_github.csv_text = LARGE_CSV
+    dataset = get_meds_dataset()
+    decoded = decode_meds_dataset(encode_meds_dataset(dataset))
+    assert decoded.body_encodings == dataset.body_encodings
+    assert decoded.csv_encodings == dataset.csv_encodings
+    assert decoded.row_count == 500
+
+
+@pytest.mark.parametrize("env", [
+    {"COMPRESSION_MIN_BYTES": "-1"},
+    {"COMPRESSION_GZIP_LEVEL": "10"},
+    {"COMPRESSION_BROTLI_QUALITY": "0"},
+    {"COMPRESSION_ZSTD_LEVEL": "23"},
+])
+def test_invalid_compression_settings(env):
+    """Test that invalid compression settings fail fast with RuntimeError."""
+    get_compression_settings.cache_clear()
+    try:
+        with patch.dict(os.environ, env):
+            with pytest.raises(RuntimeError):
+                get_compression_settings()
+    finally:
+        get_compression_settings.cache_clear()
@@ -0,0 +1,96 @@
+"""
+Tests for the CSV parsers.
+
+This module tests that the compact columnar parser validates like
+parse_meds_csv and that its rows behave like dictionaries.
+"""
+import pytest
+
+from app.services.csv_parser import (
+    ColumnarRows,
+    parse_meds_csv,
+    parse_meds_csv_columnar,
+    parse_meds_csv_stream,
+)
+
+CSV_TEXT = (
+    "name,dosage,frequency\n"
+    "Aspirin,100mg,daily\n"
+    "Ibuprofen,200mg,daily\n"
+    "\n"
+    "Naproxen,250mg\n"
+)
+
+
+def test_columnar_matches_list_of_dicts():
+    """Test that the columnar table compares equal to the list-of-dicts parse."""
+    rows = parse_meds_csv_columnar(CSV_TEXT)
+    assert isinstance(rows, ColumnarRows)
+    assert rows == parse_meds_csv(CSV_TEXT)
+    assert rows.to_dicts() == parse_meds_csv(CSV_TEXT)
+    assert rows.columns == ["name", "dosage", "frequency"]
+
+
+def test_columnar_rows_behave_like_mappings():
+    """Test indexing, slicing and mapping access on the row views."""
+    rows = parse_meds_csv_columnar(CSV_TEXT)
+    assert len(rows) == 3
+    assert rows[0]["name"] == "Aspirin"
+    assert rows[-1].get("frequency") is None
+    assert dict(rows[1]) == {"name": "Ibuprofen", "dosage": "200mg", "frequency": "daily"}
+    assert [row["name"] for row in rows[1:]] == ["Ibuprofen", "Naproxen"]
+    assert "dosage" in rows[0]
+    with pytest.raises(KeyError):
+        rows[0]["color"]
+    with pytest.raises(IndexError):
+        rows[3]
+
+
+def test_columnar_interns_repeated_values():
+    """Test that repeated cell values share one string object."""
+    rows = parse_meds_csv_columnar(CSV_TEXT)
+    frequencies = rows.column("frequency")
+    assert frequencies[0] is frequencies[1]
+
+
+def test_columnar_validation():
+    """Test that the columnar parser enforces the same limits as parse_meds_csv."""
+    with pytest.raises(ValueError):
+        parse_meds_csv_columnar("   ")
+    with pytest.raises(ValueError):
+        parse_meds_csv_columnar(CSV_TEXT, row_limit=2)
+    assert len(parse_meds_csv_columnar(CSV_TEXT, row_limit=3)) == 3
+    assert len(parse_meds_csv_columnar("name,dosage\n")) == 0
+
+
+def test_stream_parser_handles_chunk_boundaries():
+    """Test that lines and quoted newlines split across chunks parse correctly."""
+    chunks = ["name,do", "sage\r", "\nAspirin,\"100", "\nmg\"\n", "\nIbuprofen,200mg"]
+    rows = parse_meds_csv_stream(chunks)
+    assert rows.to_dicts() == [
+        {"name": "Aspirin", "dosage": "100\nmg"},
+        {"name": "Ibuprofen", "dosage": "200mg"},
+    ]
+
+
+def test_stream_parser_stops_pulling_at_row_limit():
+    """Test that the streaming parser stops consuming chunks once over the row limit."""
+    pulled = []
+
+    def chunks():
+        yield "name\n"
+        for i in range(1000):
+            pulled.append(i)
+            yield f"Med-{i}\n"
+
+    with pytest.raises(ValueError):
+        parse_meds_csv_stream(chunks(), row_limit=10)
+    assert len(pulled) == 11
+
+
+def test_stream_parser_rejects_empty_input():
+    """Test that an empty or whitespace-only stream raises ValueError."""
+    with pytest.raises(ValueError):
+        parse_meds_csv_stream([])
+    with pytest.raises(ValueError):
+        parse_meds_csv_stream(["  ", "\n"])
@@ -0,0 +1,272 @@
+"""
+Tests for the stale-while-revalidate dataset cache.
+
+This module tests freshness, refresh-ahead, background and blocking refresh
+modes, and serving stale data when the upstream fails.
+"""
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+from app.config import (
+    REFRESH_MODE_BACKGROUND,
+    REFRESH_MODE_BLOCKING,
+    CacheSettings,
+    get_meds_cache_settings,
+)
+from app.services.dataset_cache import DatasetCache, Snapshot
+from app.services.github_client import FetchResult
+
+
+class FakeUpstream:
+    """Upstream stand-in that returns queued values or raises queued errors."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def fetch(self, etag=None, last_modified=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, FetchResult):
+            return response
+        return FetchResult(text=response)
+
+    async def fetch_async(self, etag=None, last_modified=None):
+        return self.fetch(etag, last_modified)
+
+
+def make_cache(upstream, **settings):
+    settings = CacheSettings(**{
+        "ttl_seconds": 300,
+        "refresh_ahead_seconds": 30,
+        "stale_grace_seconds": 600,
+        "refresh_mode": REFRESH_MODE_BACKGROUND,
+        **settings
+    })
+    return DatasetCache(
+        "test",
+        fetch=upstream.fetch,
+        fetch_async=upstream.fetch_async,
+        parse=lambda text: text.upper(),
+        settings=lambda: settings
+    )
+
+
+def age_snapshot(cache, data, age):
+    cache.snapshot = Snapshot(data, time.time() - age)
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_first_read_fetches_and_parses():
+    """Test that an empty cache blocks on the first fetch."""
+    upstream = FakeUpstream("v1")
+    cache = make_cache(upstream)
+    assert cache.get() == "V1"
+    assert cache.get() == "V1"
+    assert upstream.calls == 1
+
+
+def test_fresh_snapshot_is_served_without_refresh():
+    """Test that a snapshot younger than TTL minus refresh-ahead is served as is."""
+    upstream = FakeUpstream()
+    cache = make_cache(upstream)
+    age_snapshot(cache, "OLD", 100)
+    assert cache.get() == "OLD"
+    assert upstream.calls == 0
+    assert cache.stats()["background_refreshes"] == 0
+
+
+def test_refresh_ahead_serves_current_and_refreshes_in_background():
+    """Test that a snapshot near expiry is served while a refresh runs in the background."""
+    upstream = FakeUpstream("v2")
+    cache = make_cache(upstream)
+    age_snapshot(cache, "OLD", 280)
+    assert cache.get() == "OLD"
+    assert wait_for(lambda: cache.snapshot.data == "V2")
+    assert upstream.calls == 1
+
+
+def test_background_mode_serves_stale_while_revalidating():
+    """Test that background mode answers immediately with expired data."""
+    upstream = FakeUpstream("v2")
+    cache = make_cache(upstream)
+    age_snapshot(cache, "OLD", 400)
+    assert cache.get() == "OLD"
+    assert wait_for(lambda: cache.snapshot.data == "V2")
+    assert cache.stats()["stale_served"] == 1
+
+
+def test_blocking_mode_waits_for_refresh():
+    """Test that blocking mode refreshes an expired snapshot before answering."""
+    upstream = FakeUpstream("v2")
+    cache = make_cache(upstream, refresh_mode=REFRESH_MODE_BLOCKING)
+    age_snapshot(cache, "OLD", 400)
+    assert cache.get() == "V2"
+
+
+def test_snapshot_past_grace_is_not_served():
+    """Test that data older than TTL plus the grace window forces a blocking refresh."""
+    upstream = FakeUpstream("v2")
+    cache = make_cache(upstream)
+    age_snapshot(cache, "OLD", 1000)
+    assert cache.get() == "V2"
+
+
+def test_upstream_error_serves_stale_within_grace():
+    """Test that a GitHub error within the grace window falls back to stale data."""
+    upstream = FakeUpstream(HTTPException(status_code=502, detail="down"))
+    cache = make_cache(upstream, refresh_mode=REFRESH_MODE_BLOCKING)
+    age_snapshot(cache, "OLD", 400)
+    assert cache.get() == "OLD"
+    assert cache.stats()["refresh_errors"] == 1
+
+
+def test_upstream_error_past_grace_is_raised():
+    """Test that a GitHub error is raised once stale data is past the grace window."""
+    upstream = FakeUpstream(HTTPException(status_code=404, detail="missing"))
+    cache = make_cache(upstream)
+    age_snapshot(cache, "OLD", 1000)
+    with pytest.raises(HTTPException) as exc:
+        cache.get()
+    assert exc.value.status_code == 404
+
+
+def test_async_background_refresh():
+    """Test that async reads start the background refresh as a task."""
+    upstream = FakeUpstream("v2")
+    cache = make_cache(upstream)
+    age_snapshot(cache, "OLD", 400)
+
+    async def main():
+        first = await cache.get_async()
+        # Let the background refresh task run to completion
+        for _ in range(100):
+            if cache.snapshot.data == "V2":
+                break
+            await asyncio.sleep(0.01)
+        return first
+
+    assert asyncio.run(main()) == "OLD"
+    assert cache.snapshot.data == "V2"
+    assert upstream.calls == 1
+
+
+def make_persistent_cache(upstream, path, **settings):
+    settings = CacheSettings(**{"ttl_seconds": 300, "snapshot_path": str(path), **settings})
+    return DatasetCache(
+        "test",
+        fetch=upstream.fetch,
+        fetch_async=upstream.fetch_async,
+        parse=lambda text: text.upper(),
+        settings=lambda: settings,
+        encode=lambda data: {"data": data.encode()},
+        decode=lambda sections: str(sections["data"], "utf-8")
+    )
+
+
+def test_snapshot_is_saved_and_restored(tmp_path):
+    """Test that a refreshed snapshot is saved and restored by a new cache."""
+    path = tmp_path / "test.snapshot"
+    cache = make_persistent_cache(FakeUpstream(FetchResult(text="v1", etag='"e1"')), path)
+    assert cache.get() == "V1"
+    assert path.exists()
+
+    upstream = FakeUpstream()
+    restarted = make_persistent_cache(upstream, path)
+    assert restarted.restore()
+    assert restarted.get() == "V1"
+    assert restarted.snapshot.etag == '"e1"'
+    assert restarted.snapshot.fetched_at == cache.snapshot.fetched_at
+    assert restarted.restore() is False
+    assert upstream.calls == 0
+
+
+def test_restored_snapshot_survives_upstream_outage(tmp_path):
+    """Test that an old restored snapshot is served stale while the upstream fails."""
+    path = tmp_path / "test.snapshot"
+    cache = make_persistent_cache(FakeUpstream("v1"), path)
+    with patch("app.services.dataset_cache.time.time", return_value=time.time() - 86400):
+        cache.get()
+
+    upstream = FakeUpstream(HTTPException(status_code=502, detail="down"))
+    restarted = make_persistent_cache(upstream, path, refresh_mode=REFRESH_MODE_BLOCKING)
+    assert restarted.restore()
+    # Past the TTL, so even blocking mode revalidates, and falls back to the snapshot
+    assert restarted.get() == "V1"
+    assert upstream.calls == 1
+    assert restarted.stale_served == 1
+
+
+def test_not_modified_refresh_renews_saved_snapshot(tmp_path):
+    """Test that a 304 revalidation also refreshes the saved timestamp."""
+    path = tmp_path / "test.snapshot"
+    upstream = FakeUpstream(
+        FetchResult(text="v1", etag='"e1"'),
+        FetchResult(etag='"e1"', not_modified=True)
+    )
+    cache = make_persistent_cache(upstream, path, refresh_mode=REFRESH_MODE_BLOCKING)
+    cache.get()
+    first = cache._store(str(path)).read()
+
+    cache.snapshot = Snapshot(cache.snapshot.data, time.time() - 1000, '"e1"')
+    cache.get()
+    renewed = cache._store(str(path)).read()
+    assert renewed.version == first.version + 1
+    assert renewed.fetched_at > first.fetched_at
+
+
+def test_restore_without_snapshot_file(tmp_path):
+    """Test that restore is a no-op when nothing was saved."""
+    cache = make_persistent_cache(FakeUpstream(), tmp_path / "missing.snapshot")
+    assert cache.restore() is False
+    assert cache.snapshot is None
+
+
+@patch.dict(os.environ, {
+    "MEDS_CACHE_TTL_SECONDS": "60",
+    "MEDS_CACHE_REFRESH_AHEAD_SECONDS": "5",
+    "MEDS_CACHE_STALE_GRACE_SECONDS": "120",
+    "MEDS_CACHE_REFRESH_MODE": "blocking"
+})
+def test_meds_cache_settings_from_environment():
+    """Test that MEDS_CACHE_* environment variables configure the meds cache."""
+    get_meds_cache_settings.cache_clear()
+    try:
+        assert get_meds_cache_settings() == CacheSettings(60, 5, 120, REFRESH_MODE_BLOCKING)
+    finally:
+        get_meds_cache_settings.cache_clear()
+
+
+@pytest.mark.parametrize("env", [
+    {"MEDS_CACHE_TTL_SECONDS": "0"},
+    {"MEDS_CACHE_TTL_SECONDS": "abc"},
+    {"MEDS_CACHE_TTL_SECONDS": "60", "MEDS_CACHE_REFRESH_AHEAD_SECONDS": "60"},
+    {"MEDS_CACHE_STALE_GRACE_SECONDS": "-1"},
+    {"MEDS_CACHE_REFRESH_MODE": "sometimes"},
+    {"MEDS_CACHE_SNAPSHOT_PATH": "/no/such/dir/meds.snapshot"},
+    {"MEDS_CACHE_SNAPSHOT_PATH": "meds.snapshot", "MEDS_CACHE_SHARED_PATH": "meds.shared"},
+])
+def test_invalid_meds_cache_settings(env):
+    """Test that invalid cache settings fail fast with RuntimeError."""
+    get_meds_cache_settings.cache_clear()
+    try:
+        with patch.dict(os.environ, env):
+            with pytest.raises(RuntimeError):
+                get_meds_cache_settings()
+    finally:
+        get_meds_cache_settings.cache_clear()
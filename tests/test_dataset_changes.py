@@ -0,0 +1,251 @@
+"""
+Tests for dataset versions and row-level change history.
+
+This module tests diffing dataset versions, merging and trimming the
+history of deltas, carrying it through snapshots, and the /meds/changes
+endpoint.
+"""
+import os
+import time
+from dataclasses import replace
+from unittest.mock import patch
+
+import pytest
+
+from app.config import ChangesSettings, get_meds_changes_settings
+from app.services.csv_parser import parse_meds_csv_columnar
+from app.services.dataset_changes import (
+    Delta,
+    changes_since,
+    decode_history,
+    diff_rows,
+    encode_history,
+    extend_history,
+    next_version,
+)
+from app.services.meds_dataset import (
+    advance_meds_dataset,
+    build_meds_dataset,
+    decode_meds_dataset,
+    encode_meds_dataset,
+)
+
+AUTH = ("testuser", "testpass")
+ENV = {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+    "MEDS_CACHE_REFRESH_MODE": "blocking",
+}
+
+V1 = "name,dosage\nAspirin,100mg\nIbuprofen,200mg\nParacetamol,500mg"
+V2 = "name,dosage\nAspirin,100mg\nIbuprofen,400mg\nNaproxen,250mg"
+V3 = "name,dosage\nAspirin,100mg\nIbuprofen,400mg\nParacetamol,1g"
+
+
+def expire_meds_cache():
+    """Ages the cached meds snapshot past its TTL so the next read refreshes it."""
+    from app.routes import meds
+
+    snapshot = meds.meds_cache.snapshot
+    meds.meds_cache.snapshot = replace(snapshot, fetched_at=snapshot.fetched_at - 10_000)
+
+
+def rows(csv_text):
+    return parse_meds_csv_columnar(csv_text)
+
+
+def dataset(csv_text):
+    return build_meds_dataset(rows(csv_text), csv_text)
+
+
+def test_diff_rows():
+    """Test that added, changed and removed rows are found by key."""
+    delta = diff_rows(rows(V1), rows(V2), "name", 1, 2)
+    assert (delta.base, delta.version, delta.key) == (1, 2, "name")
+    assert delta.added == ({"name": "Naproxen", "dosage": "250mg"},)
+    assert delta.changed == ({"name": "Ibuprofen", "dosage": "400mg"},)
+    assert delta.removed == ("Paracetamol",)
+
+
+@pytest.mark.parametrize("key, csv_text", [
+    ("code", V2),
+    ("name", "name,dosage\nAspirin,100mg\nAspirin,200mg"),
+])
+def test_diff_rows_without_unique_key(key, csv_text):
+    """Test that no delta is produced when the key column is missing or repeated."""
+    assert diff_rows(rows(V1), rows(csv_text), key, 1, 2) is None
+
+
+def test_next_version_only_increases():
+    """Test that versions start at the current time and always increase."""
+    first = next_version()
+    assert next_version(first) > first
+    assert next_version(first + 1000) == first + 1001
+
+
+def test_changes_since_merges_deltas():
+    """Test that several deltas merge into the net change since a version."""
+    history = (
+        diff_rows(rows(V1), rows(V2), "name", 1, 2),
+        diff_rows(rows(V2), rows(V3), "name", 2, 3),
+    )
+    assert changes_since(history, 3, 1) == {
+        "since": 1,
+        "version": 3,
+        "added": [],
+        "changed": [{"name": "Ibuprofen", "dosage": "400mg"}, {"name": "Paracetamol", "dosage": "1g"}],
+        "removed": [],
+    }
+    assert changes_since(history, 3, 2)["removed"] == ["Naproxen"]
+    assert changes_since(history, 3, 3)["added"] == []
+
+
+@pytest.mark.parametrize("since", [0, 4, 100])
+def test_changes_since_outside_history(since):
+    """Test that versions the history does not cover require a resync."""
+    history = (diff_rows(rows(V1), rows(V2), "name", 1, 2), diff_rows(rows(V2), rows(V3), "name", 2, 3))
+    assert changes_since(history, 3, since) is None
+
+
+def test_extend_history_is_bounded():
+    """Test that the oldest deltas are dropped beyond the version and row limits."""
+    def delta(base, size=1):
+        return Delta(base, base + 1, "name", removed=tuple(str(i) for i in range(size)))
+
+    history = ()
+    for base in range(5):
+        history = extend_history(history, delta(base), ChangesSettings(history_versions=3))
+    assert [d.base for d in history] == [2, 3, 4]
+
+    history = extend_history(history, delta(5, size=10), ChangesSettings(history_rows=11))
+    assert [d.base for d in history] == [4, 5]
+    assert extend_history(history, None, ChangesSettings()) == ()
+    # A delta that does not continue the chain starts it over
+    assert extend_history(history, delta(9), ChangesSettings()) == (delta(9),)
+
+
+def test_advance_numbers_versions_and_records_history():
+    """Test that each new dataset version gets a higher number and its delta."""
+    settings = ChangesSettings()
+    first = advance_meds_dataset(None, dataset(V1), settings)
+    second = advance_meds_dataset(first, dataset(V2), settings)
+    third = advance_meds_dataset(second, dataset(V3), settings)
+
+    assert first.version < second.version < third.version
+    assert first.history == ()
+    assert [(d.base, d.version) for d in third.history] == [
+        (first.version, second.version), (second.version, third.version)
+    ]
+    assert third.is_loaded
+    # Without settings the versions still advance but no history is kept
+    assert advance_meds_dataset(third, dataset(V1)).history == ()
+
+
+def test_history_survives_snapshot_encoding():
+    """Test that the version and history are carried through a snapshot."""
+    settings = ChangesSettings()
+    current = advance_meds_dataset(advance_meds_dataset(None, dataset(V1), settings), dataset(V2), settings)
+    decoded = decode_meds_dataset(encode_meds_dataset(current))
+    assert decoded.version == current.version
+    assert decoded.history == current.history
+    assert decode_history(encode_history(current.history)) == current.history
+
+
+@patch.dict(os.environ, ENV)
+def test_meds_changes_endpoint(client, fake_github):
+    """Test that /meds/changes returns only what changed since a version."""
+    fake_github.csv_text = V1
+    first = client.get("/meds", auth=AUTH)
+    v1 = int(first.headers["x-dataset-version"])
+
+    unchanged = client.get(f"/meds/changes?since={v1}", auth=AUTH)
+    assert unchanged.json() == {"since": v1, "version": v1, "added": [], "changed": [], "removed": []}
+
+    fake_github.csv_text = V2
+    expire_meds_cache()
+    response = client.get(f"/meds/changes?since={v1}", auth=AUTH)
+    assert response.status_code == 200
+    v2 = int(response.headers["x-dataset-version"])
+    assert v2 > v1
+    assert response.json() == {
+        "since": v1,
+        "version": v2,
+        "added": [{"name": "Naproxen", "dosage": "250mg"}],
+        "changed": [{"name": "Ibuprofen", "dosage": "400mg"}],
+        "removed": ["Paracetamol"],
+    }
+
+    # The answer is stable, so it can be revalidated
+    cached = client.get(f"/meds/changes?since={v1}", auth=AUTH,
+                        headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert client.get("/meds", auth=AUTH).headers["x-dataset-version"] == str(v2)
+
+
+@patch.dict(os.environ, ENV)
+def test_meds_changes_requires_resync(client, fake_github):
+    """Test that versions older than the history get 410 Gone."""
+    fake_github.csv_text = V1
+    version = int(client.get("/meds", auth=AUTH).headers["x-dataset-version"])
+
+    response = client.get(f"/meds/changes?since={version - 1}", auth=AUTH)
+    assert response.status_code == 410
+    assert response.headers["x-dataset-version"] == str(version)
+    assert client.get("/meds/changes", auth=AUTH).status_code == 422
+    assert client.get("/meds/changes?since=1").status_code == 401
+
+
+@patch.dict(os.environ, {**ENV, "MEDS_CHANGES_HISTORY_VERSIONS": "0"})
+def test_meds_changes_without_history(client, fake_github):
+    """Test that a zero-length history always asks clients to resync."""
+    get_meds_changes_settings.cache_clear()
+    try:
+        fake_github.csv_text = V1
+        v1 = int(client.get("/meds", auth=AUTH).headers["x-dataset-version"])
+        fake_github.csv_text = V2
+        expire_meds_cache()
+        assert client.get(f"/meds/changes?since={v1}", auth=AUTH).status_code == 410
+    finally:
+        get_meds_changes_settings.cache_clear()
+
+
+def test_workers_share_versions(client, fake_github, tmp_path):
+    """Test that workers adopting a shared snapshot report the same version and history."""
+    from app.config import get_meds_cache_settings
+    from app.routes import meds
+
+    fake_github.csv_text = V1
+    with patch.dict(os.environ, {**ENV, "MEDS_CACHE_SHARED_PATH": str(tmp_path / "meds.snapshot")}):
+        get_meds_cache_settings.cache_clear()
+        try:
+            v1 = client.get("/meds", auth=AUTH).headers["x-dataset-version"]
+            fake_github.csv_text = V2
+            expire_meds_cache()
+            # The shared snapshot has to be due as well
+            with patch("app.services.shared_snapshot.time.time", return_value=time.time() + 10_000):
+                v2 = client.get("/meds", auth=AUTH).headers["x-dataset-version"]
+
+            # Another worker starts with an empty cache and maps the snapshot
+            meds.meds_cache.clear()
+            response = client.get(f"/meds/changes?since={v1}", auth=AUTH)
+        finally:
+            get_meds_cache_settings.cache_clear()
+
+    assert v2 != v1
+    assert response.headers["x-dataset-version"] == v2
+    assert response.json()["removed"] == ["Paracetamol"]
+
+
+@pytest.mark.parametrize("env", [
+    {"MEDS_CHANGES_HISTORY_VERSIONS": "-1"},
+    {"MEDS_CHANGES_HISTORY_ROWS": "-5"},
+])
+def test_invalid_changes_settings(env):
+    """Test that invalid change history settings fail fast with RuntimeError."""
+    get_meds_changes_settings.cache_clear()
+    try:
+        with patch.dict(os.environ, env):
+            with pytest.raises(RuntimeError):
+                get_meds_changes_settings()
+    finally:
+        get_meds_changes_settings.cache_clear()
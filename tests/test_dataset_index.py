@@ -0,0 +1,42 @@
+"""
+Tests for the per-column dataset indexes.
+
+This module tests exact and prefix lookups and multi-filter selection.
+"""
+import pytest
+
+from app.services.dataset_index import ColumnIndex, TableIndex
+
+ROWS = [
+    {"name": "Aspirin", "form": "tablet"},
+    {"name": "Amoxicillin", "form": "capsule"},
+    {"name": "aspirin", "form": "tablet"},
+    {"name": "Ibuprofen", "form": None},
+]
+
+
+def test_column_index_exact_and_prefix():
+    """Test exact lookups are case-sensitive and prefix lookups are not."""
+    index = ColumnIndex(row["name"] for row in ROWS)
+    assert index.equal("Aspirin") == [0]
+    assert index.equal("Missing") == []
+    assert index.prefix("AS") == [0, 2]
+    assert index.prefix("a") == [0, 1, 2]
+    assert index.prefix("") == [0, 1, 2, 3]
+    assert index.prefix("z") == []
+
+
+def test_table_index_select_intersects_filters():
+    """Test that several filters are intersected in row order."""
+    index = TableIndex(ROWS, ["name", "form"])
+    assert index.select() is None
+    assert index.select(equals={"form": "tablet"}) == [0, 2]
+    assert index.select(equals={"form": "tablet"}, prefixes={"name": "am"}) == []
+    assert index.select(equals={"form": ""}) == [3]
+
+
+def test_table_index_unknown_column():
+    """Test that filtering on an unknown column raises ValueError."""
+    index = TableIndex(ROWS, ["name", "form"])
+    with pytest.raises(ValueError):
+        index.select(equals={"color": "red"})
@@ -0,0 +1,253 @@
+"""
+Tests for the registry of CSV datasets.
+
+This module tests reading dataset sources from the environment, serving each
+dataset under its own route and cache, and refreshing several sources
+concurrently under the cap on in-flight GitHub requests.
+"""
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import CacheSettings, DatasetSource, get_dataset_sources, get_github_settings
+from app.routes.datasets import build_datasets_router
+from app.services.dataset_registry import DatasetRegistry, source_dataset_cache
+from app.services.github_client import reset_upstream_policies
+
+AUTH = ("testuser", "testpass")
+BASE_URL = "https://api.github.com/repos/org/data/contents"
+
+
+class FakeRepo:
+    """
+    GitHub stand-in serving a different CSV per file path, with a per-file
+    delay, that records how many requests were in flight at once.
+    """
+
+    def __init__(self, files, delays=None):
+        self.files = files
+        self.delays = delays or {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _respond(self, request):
+        name = request.url.path.rsplit("/", 1)[-1]
+        self.requests.append(name)
+        etag = f'"{name}-{len(self.files[name])}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, text=self.files[name], headers={"ETag": etag})
+
+    def handler(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delays.get(request.url.path.rsplit("/", 1)[-1], 0))
+            return self._respond(request)
+        finally:
+            self.in_flight -= 1
+
+    async def async_handler(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(request.url.path.rsplit("/", 1)[-1], 0))
+            return self._respond(request)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def repo():
+    """A FakeRepo with formulary and interactions files behind the GitHub clients."""
+    fake = FakeRepo({
+        "formulary.csv": "name,tier\nAspirin,1\nIbuprofen,2",
+        "interactions.csv": "drug,interacts_with\nWarfarin,Aspirin",
+    })
+    sync_client = httpx.Client(transport=httpx.MockTransport(fake.handler))
+    with patch.dict(os.environ, {"GITHUB_PAT": "test", "MEDS_API_USERNAME": "testuser",
+                                 "MEDS_API_PASSWORD": "testpass"}), \
+            patch("app.services.github_client.get_http_client", return_value=sync_client), \
+            patch("app.services.github_client.get_async_http_client",
+                  side_effect=lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake.async_handler))):
+        yield fake
+    sync_client.close()
+
+
+def make_source(name, **options):
+    return DatasetSource(name=name, url=f"{BASE_URL}/{name}.csv", route=f"/datasets/{name}", **options)
+
+
+def make_client(*sources):
+    registry = DatasetRegistry()
+    app = FastAPI()
+    app.include_router(build_datasets_router(sources, registry))
+    return TestClient(app), registry
+
+
+@patch.dict(os.environ, {
+    "DATASETS": "formulary, interactions",
+    "DATASET_FORMULARY_URL": f"{BASE_URL}/formulary.csv",
+    "DATASET_FORMULARY_TTL_SECONDS": "60",
+    "DATASET_FORMULARY_REFRESH_AHEAD_SECONDS": "5",
+    "DATASET_FORMULARY_ROW_LIMIT": "500",
+    "DATASET_INTERACTIONS_URL": f"{BASE_URL}/interactions.csv",
+    "DATASET_INTERACTIONS_ROUTE": "/interactions",
+})
+def test_dataset_sources_from_environment():
+    """Test that every dataset named in DATASETS is read with its own settings."""
+    get_dataset_sources.cache_clear()
+    try:
+        formulary, interactions = get_dataset_sources()
+    finally:
+        get_dataset_sources.cache_clear()
+
+    assert formulary.name == "formulary"
+    assert formulary.url == f"{BASE_URL}/formulary.csv"
+    assert formulary.route == "/datasets/formulary"
+    assert formulary.row_limit == 500
+    assert formulary.cache.ttl_seconds == 60
+    assert formulary.cache.refresh_ahead_seconds == 5
+    assert interactions.route == "/interactions"
+    assert interactions.cache == CacheSettings()
+
+
+@pytest.mark.parametrize("env", [
+    {"DATASETS": "formulary"},
+    {"DATASETS": "Formulary", "DATASET_FORMULARY_URL": "x"},
+    {"DATASETS": "meds", "DATASET_MEDS_URL": "x"},
+    {"DATASETS": "formulary,formulary", "DATASET_FORMULARY_URL": "x"},
+    {"DATASETS": "a,b", "DATASET_A_URL": "x", "DATASET_B_URL": "y", "DATASET_B_ROUTE": "/datasets/a"},
+    {"DATASETS": "formulary", "DATASET_FORMULARY_URL": "x", "DATASET_FORMULARY_ROUTE": "formulary"},
+    {"DATASETS": "formulary", "DATASET_FORMULARY_URL": "x", "DATASET_FORMULARY_ROW_LIMIT": "0"},
+    {"DATASETS": "formulary", "DATASET_FORMULARY_URL": "x", "DATASET_FORMULARY_TTL_SECONDS": "0"},
+])
+def test_invalid_dataset_sources(env):
+    """Test that invalid dataset configuration fails fast with RuntimeError."""
+    get_dataset_sources.cache_clear()
+    try:
+        with patch.dict(os.environ, env):
+            with pytest.raises(RuntimeError):
+                get_dataset_sources()
+    finally:
+        get_dataset_sources.cache_clear()
+
+
+def test_each_dataset_has_its_own_route_and_cache(repo):
+    """Test that datasets are served from their own files and cached separately."""
+    client, registry = make_client(make_source("formulary"), make_source("interactions"))
+
+    formulary = client.get("/datasets/formulary?tier=2", auth=AUTH)
+    interactions = client.get("/datasets/interactions", auth=AUTH)
+    assert formulary.json() == {"count": 1, "items": [{"name": "Ibuprofen", "tier": "2"}]}
+    assert interactions.json()["items"] == [{"drug": "Warfarin", "interacts_with": "Aspirin"}]
+    assert formulary.headers["etag"] != interactions.headers["etag"]
+
+    # Both are now cached
+    client.get("/datasets/formulary", auth=AUTH)
+    client.get("/datasets/interactions", auth=AUTH)
+    assert sorted(repo.requests) == ["formulary.csv", "interactions.csv"]
+    assert registry.names() == ["formulary", "interactions"]
+
+
+def test_dataset_routes_require_authentication(repo):
+    """Test that dataset routes are protected like /meds."""
+    client, _ = make_client(make_source("formulary"))
+    assert client.get("/datasets/formulary").status_code == 401
+    assert repo.requests == []
+
+
+def test_dataset_row_limit_is_per_source(repo):
+    """Test that each dataset is parsed with its own row limit."""
+    client, _ = make_client(make_source("formulary", row_limit=1), make_source("interactions", row_limit=1))
+    response = client.get("/datasets/formulary", auth=AUTH)
+    assert response.status_code == 500
+    assert "row limit" in response.json()["detail"]
+    assert client.get("/datasets/interactions", auth=AUTH).status_code == 200
+
+
+def test_registry_rejects_duplicate_names():
+    """Test that two datasets cannot share a name."""
+    registry = DatasetRegistry()
+    registry.register(source_dataset_cache(make_source("formulary")))
+    with pytest.raises(ValueError):
+        registry.register(source_dataset_cache(make_source("formulary")))
+
+
+def test_slow_source_does_not_delay_others(repo):
+    """Test that a fast dataset refreshes while a slow one is still downloading."""
+    repo.delays["formulary.csv"] = 0.5
+    slow = source_dataset_cache(make_source("formulary"))
+    fast = source_dataset_cache(make_source("interactions"))
+
+    async def main():
+        slow_refresh = asyncio.create_task(slow.refresh_async())
+        await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        await fast.refresh_async()
+        fast_elapsed = time.perf_counter() - start
+        await slow_refresh
+        return fast_elapsed
+
+    assert asyncio.run(main()) < 0.25
+    assert slow.snapshot is not None and fast.snapshot is not None
+
+
+@pytest.fixture
+def fetch_cap():
+    """Sets GITHUB_MAX_CONCURRENT_FETCHES for one test, with fresh request slots."""
+    def apply(limit):
+        os.environ["GITHUB_MAX_CONCURRENT_FETCHES"] = str(limit)
+        get_github_settings.cache_clear()
+        reset_upstream_policies()
+
+    with patch.dict(os.environ):
+        yield apply
+    get_github_settings.cache_clear()
+    reset_upstream_policies()
+
+
+def test_concurrent_refreshes_are_capped(repo, fetch_cap):
+    """Test that no more than GITHUB_MAX_CONCURRENT_FETCHES requests run at once."""
+    fetch_cap(2)
+    repo.files.update({f"source{i}.csv": f"name\nrow{i}" for i in range(5)})
+    repo.delays.update({f"source{i}.csv": 0.05 for i in range(5)})
+    caches = [source_dataset_cache(make_source(f"source{i}")) for i in range(5)]
+
+    async def main():
+        return await asyncio.gather(*(cache.refresh_async() for cache in caches))
+
+    snapshots = asyncio.run(main())
+
+    assert repo.max_in_flight == 2
+    assert [list(snapshot.data.rows) for snapshot in snapshots] == [
+        [{"name": f"row{i}"}] for i in range(5)
+    ]
+
+
+def test_sync_and_async_refreshes_share_the_cap(repo, fetch_cap):
+    """Test that sync refreshes in threads and async refreshes draw on one cap."""
+    fetch_cap(2)
+    repo.files.update({f"source{i}.csv": f"name\nrow{i}" for i in range(6)})
+    repo.delays.update({f"source{i}.csv": 0.05 for i in range(6)})
+    caches = [source_dataset_cache(make_source(f"source{i}")) for i in range(6)]
+
+    async def main():
+        return await asyncio.gather(
+            *(asyncio.to_thread(cache.refresh) for cache in caches[:3]),
+            *(cache.refresh_async() for cache in caches[3:]),
+        )
+
+    snapshots = asyncio.run(main())
+
+    assert repo.max_in_flight == 2
+    assert [list(snapshot.data.rows) for snapshot in snapshots] == [
+        [{"name": f"row{i}"}] for i in range(6)
+    ]
@@ -0,0 +1,183 @@
+"""
+Tests for Server-Timing and request profiling.
+
+This module tests how time is charged to nested phases, the Server-Timing
+header, profiling requests on demand and downloading the saved profiles.
+"""
+import contextvars
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import DiagnosticsSettings, get_diagnostics_settings
+from app.middleware.diagnostics import DiagnosticsMiddleware
+from app.routes.profiles import router as profiles_router
+from app.services.profiler import list_profiles, save_profile, speedscope_profile
+from app.services.timing import phase, start_request_timings, timed_iter, untimed_context
+
+AUTH = ("testuser", "testpass")
+ENV = {"MEDS_API_USERNAME": "testuser", "MEDS_API_PASSWORD": "testpass"}
+
+
+def server_timing(response):
+    """Parses a Server-Timing header into {name: milliseconds}."""
+    entries = {}
+    for entry in response.headers["server-timing"].split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        entries[name] = float(duration)
+    return entries
+
+
+def make_client(tmp_path, **settings):
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        with phase("work"):
+            time.sleep(0.05)
+        return {"ok": True}
+
+    app.include_router(profiles_router)
+    app.add_middleware(
+        DiagnosticsMiddleware,
+        settings=DiagnosticsSettings(profile_dir=str(tmp_path), profile_interval_ms=1, **settings)
+    )
+    return TestClient(app)
+
+
+@pytest.fixture
+def profile_env(tmp_path):
+    """Points the profile routes at tmp_path."""
+    with patch.dict(os.environ, {**ENV, "PROFILE_DIR": str(tmp_path), "PROFILE_INTERVAL_MS": "1"}):
+        get_diagnostics_settings.cache_clear()
+        yield tmp_path
+    get_diagnostics_settings.cache_clear()
+
+
+def in_own_context(test):
+    """Runs a test in a copy of the context, so its request timings do not leak."""
+    def run():
+        contextvars.copy_context().run(test)
+    run.__name__ = test.__name__
+    run.__doc__ = test.__doc__
+    return run
+
+
+@in_own_context
+def test_nested_phases_are_charged_once():
+    """Test that time in a nested phase is not counted again in the outer one."""
+    timings = start_request_timings()
+    with phase("outer"):
+        time.sleep(0.02)
+        with phase("inner"):
+            time.sleep(0.04)
+    assert 0.02 <= timings.phases["outer"] < timings.phases["inner"]
+    assert timings.phases["inner"] >= 0.04
+    assert "total;dur=" in timings.header()
+
+
+@in_own_context
+def test_phases_outside_a_request_are_not_recorded():
+    """Test that untimed contexts record nothing and timed iterators record waits."""
+    timings = start_request_timings()
+
+    def background():
+        with phase("background"):
+            pass
+
+    untimed_context().run(background)
+    assert list(timed_iter(iter([1, 2]), "wait")) == [1, 2]
+    assert "background" not in timings.phases
+    assert "wait" in timings.phases
+
+
+@patch.dict(os.environ, ENV)
+def test_meds_server_timing_phases(client, fake_github):
+    """Test that a /meds request that fetches reports every phase."""
+    response = client.get("/meds", auth=AUTH)
+    assert {"auth", "cache", "upstream", "parse", "serialize", "total"} <= set(server_timing(response))
+
+    cached = server_timing(client.get("/meds", auth=AUTH))
+    assert "upstream" not in cached
+    assert sum(duration for name, duration in cached.items() if name != "total") <= cached["total"]
+    assert set(server_timing(client.get("/health"))) == {"total"}
+
+
+def test_server_timing_can_be_disabled(tmp_path):
+    """Test that disabled timing and profiling leave responses untouched."""
+    client = make_client(tmp_path, server_timing=False, profile_mode="off")
+    response = client.get("/slow", headers={"X-Profile": "1"})
+    assert "server-timing" not in response.headers
+    assert "x-profile-id" not in response.headers
+
+
+@patch.dict(os.environ, ENV)
+def test_profile_on_request(tmp_path, profile_env):
+    """Test that an authenticated X-Profile request is profiled and downloadable."""
+    client = make_client(tmp_path)
+    response = client.get("/slow", auth=AUTH, headers={"X-Profile": "1"})
+    assert server_timing(response)["work"] >= 50
+    profile_id = response.headers["x-profile-id"]
+    assert client.get("/profiles", auth=AUTH).json() == {"profiles": [profile_id]}
+
+    collapsed = client.get(f"/profiles/{profile_id}", auth=AUTH)
+    assert collapsed.status_code == 200
+    assert "slow (test_diagnostics.py" in collapsed.text
+
+    speedscope = client.get(f"/profiles/{profile_id}?format=speedscope", auth=AUTH).json()
+    assert speedscope["profiles"][0]["type"] == "sampled"
+    assert any(frame["name"].startswith("slow ") for frame in speedscope["shared"]["frames"])
+
+
+@patch.dict(os.environ, ENV)
+def test_profile_requires_credentials(tmp_path, profile_env):
+    """Test that only authenticated requests can ask for, list or download profiles."""
+    client = make_client(tmp_path)
+    assert "x-profile-id" not in client.get("/slow", headers={"X-Profile": "1"}).headers
+    assert "x-profile-id" not in client.get("/slow", auth=("testuser", "wrong"), headers={"X-Profile": "1"}).headers
+    assert "x-profile-id" not in client.get("/slow", auth=AUTH).headers
+    assert list_profiles(str(tmp_path)) == []
+    assert client.get("/profiles").status_code == 401
+    assert client.get("/profiles/../../etc/passwd", auth=AUTH).status_code == 404
+    assert client.get("/profiles/20260101000000-000000000000", auth=AUTH).status_code == 404
+
+
+def test_profile_every_request(tmp_path):
+    """Test that PROFILE_MODE=always profiles requests without a header."""
+    client = make_client(tmp_path, profile_mode="always")
+    assert "x-profile-id" in client.get("/slow").headers
+
+
+def test_saved_profiles_are_bounded(tmp_path):
+    """Test that the oldest profiles are deleted beyond the maximum."""
+    for second in range(5):
+        save_profile(str(tmp_path), f"2026010100000{second}-{second:012x}", "a;b 1\n", max_files=3)
+    assert list_profiles(str(tmp_path)) == [f"2026010100000{second}-{second:012x}" for second in (2, 3, 4)]
+
+
+def test_speedscope_conversion():
+    """Test that collapsed stacks become weighted speedscope samples."""
+    profile = speedscope_profile("main;a 2\nmain;b 1\n", "p", interval_ms=5)
+    assert [frame["name"] for frame in profile["shared"]["frames"]] == ["main", "a", "b"]
+    assert profile["profiles"][0]["samples"] == [[0, 1], [0, 2]]
+    assert profile["profiles"][0]["weights"] == [10, 5]
+
+
+@pytest.mark.parametrize("env", [
+    {"PROFILE_MODE": "sometimes"},
+    {"PROFILE_INTERVAL_MS": "0"},
+    {"PROFILE_MAX_FILES": "0"},
+])
+def test_invalid_diagnostics_settings(env):
+    """Test that invalid profiling settings fail fast with RuntimeError."""
+    get_diagnostics_settings.cache_clear()
+    try:
+        with patch.dict(os.environ, env):
+            with pytest.raises(RuntimeError):
+                get_diagnostics_settings()
+    finally:
+        get_diagnostics_settings.cache_clear()
@@ -0,0 +1,212 @@
+"""
+Tests for the binary and NDJSON inputs and the aggregates of the math operations.
+
+This module tests reading float64 and NDJSON request bodies, the vectorized
+and exact reductions, single-pass aggregates, and the errors for malformed,
+oversized or unsupported bodies. The JSON contract of /math/add and
+/math/multiply is covered in test_basic.
+"""
+import asyncio
+import math
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.services.number_arrays import (
+    aggregate,
+    numbers_from_float64,
+    numbers_from_ndjson,
+    product_of,
+    sum_of,
+)
+
+FLOAT64 = {"Content-Type": "application/octet-stream"}
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def ndjson(*chunks):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    return asyncio.run(numbers_from_ndjson(stream()))
+
+
+def test_float64_body_is_read_in_place():
+    """Test that a little-endian float64 body becomes an array over the same bytes."""
+    body = np.array([1.5, -2.0, 3.25], dtype="<f8").tobytes()
+    values = numbers_from_float64(body)
+    assert values.tolist() == [1.5, -2.0, 3.25]
+    assert not values.flags.owndata
+    with pytest.raises(ValueError):
+        numbers_from_float64(body[:-1])
+
+
+def test_ndjson_lines_split_across_chunks():
+    """Test that NDJSON numbers are parsed even when a line spans two chunks."""
+    assert ndjson(b"1\n2.", b"5\n\n-3e2", b"\n4").tolist() == [1.0, 2.5, -300.0, 4.0]
+    assert ndjson().tolist() == []
+    with pytest.raises(ValueError, match="Line 4"):
+        ndjson(b"1\n2", b"\n\nx\n5")
+
+
+@pytest.mark.parametrize("body", [
+    b"1\nabc\n", b"1\n[2]\n", b"true\n", b"1e400\n", b"1" + b"0" * 400,
+    b'1\n"2"\n3', b'"1e400"', b"1\nnull\n3",
+])
+def test_ndjson_rejects_non_numbers(body):
+    """Test that lines that are not finite JSON numbers are rejected."""
+    with pytest.raises(ValueError):
+        ndjson(body)
+
+
+def test_ndjson_names_the_string_or_null_line():
+    """Test that a string or null line is reported by its line number rather than converted."""
+    for body in (b'1\n"2"\n3\n', b"1\nnull\n3\n"):
+        with pytest.raises(ValueError, match="Line 2 is not a JSON number"):
+            ndjson(body)
+
+
+def test_exact_sum_is_correctly_rounded():
+    """Test that the exact mode cancels terms the fast mode loses."""
+    values = np.array([1e100, 1.0, -1e100])
+    assert sum_of(values) == 0.0
+    assert sum_of(values, "exact") == 1.0
+    assert sum_of(np.array([0.1] * 10), "exact") == 1.0
+    assert product_of(np.array([])) == 0
+    assert product_of(np.array([2.0, 3.0])) == 6.0
+
+
+def test_math_add_float64_body(client):
+    """Test that /math/add sums a raw float64 body."""
+    values = np.arange(1, 100_001, dtype="<f8")
+    response = client.post("/math/add", content=values.tobytes(), headers=FLOAT64)
+    assert response.status_code == 200
+    assert response.json() == {"result": 5000050000.0}
+
+
+def test_math_multiply_ndjson_body(client):
+    """Test that /math/multiply multiplies an NDJSON body."""
+    response = client.post("/math/multiply", content=b"1\n2\n3\n4\n", headers=NDJSON)
+    assert response.json() == {"result": 24}
+    assert client.post("/math/multiply", content=b"", headers=NDJSON).json() == {"result": 0}
+
+
+def test_math_add_exact_precision(client):
+    """Test that precision=exact applies to every input format."""
+    payload = {"numbers": [1e100, 1, -1e100]}
+    assert client.post("/math/add", json=payload).json() == {"result": 0}
+    assert client.post("/math/add?precision=exact", json=payload).json() == {"result": 1}
+    body = b"1e100\n1\n-1e100\n"
+    assert client.post("/math/add?precision=exact", content=body, headers=NDJSON).json() == {"result": 1}
+    assert client.post("/math/add?precision=kahan", json=payload).status_code == 422
+
+
+def test_math_json_contract_is_unchanged(client):
+    """Test that an empty list still sums to the integer 0 and +json media types are read as JSON."""
+    assert client.post("/math/add", json={"numbers": []}).text == '{"result":0}'
+    response = client.post(
+        "/math/add", content=b'{"numbers": [1, 2]}', headers={"Content-Type": "application/vnd.api+json"}
+    )
+    assert response.json() == {"result": 3}
+
+
+@pytest.mark.parametrize("content, headers, expected", [
+    (b"\x00" * 7, FLOAT64, 400),
+    (b"1\nx\n", NDJSON, 400),
+    (b'1\n"2"\n3\n', NDJSON, 400),
+    (b"1\nnull\n3\n", NDJSON, 400),
+    (b"1,2", {"Content-Type": "text/csv"}, 415),
+    (np.array([np.nan]).tobytes(), FLOAT64, 422),
+    (b"1e308\n1e308\n", NDJSON, 422),
+])
+def test_math_rejects_bad_bodies(client, content, headers, expected):
+    """Test that malformed, unsupported and non-finite inputs are client errors."""
+    assert client.post("/math/add", content=content, headers=headers).status_code == expected
+
+
+def test_math_json_errors_are_unchanged(client):
+    """Test that invalid JSON bodies still get FastAPI's validation errors."""
+    response = client.post("/math/add", json={"numbers": ["a"]})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "numbers", 0]
+    assert client.post("/math/add").json()["detail"][0]["type"] == "missing"
+
+
+@pytest.mark.parametrize("headers", [FLOAT64, NDJSON, {}])
+def test_math_body_size_is_limited(client, headers):
+    """Test that bodies over MAX_BODY_BYTES get 413 in every format."""
+    with patch("app.routes.math.MAX_BODY_BYTES", 16):
+        response = client.post("/math/add", content=b"1\n" * 16, headers=headers)
+    assert response.status_code == 413
+
+
+def test_math_documents_every_body_format(client):
+    """Test that the OpenAPI schema lists each accepted request body format."""
+    body = client.get("/openapi.json").json()["paths"]["/math/add"]["post"]["requestBody"]
+    assert set(body["content"]) == {"application/json", "application/octet-stream", "application/x-ndjson"}
+    assert math.isclose(
+        client.post("/math/add", content=np.full(3, 0.1).tobytes(), headers=FLOAT64).json()["result"], 0.3
+    )
+
+
+def test_aggregate_matches_numpy_across_blocks():
+    """Test that blockwise merged statistics agree with NumPy's two-pass results."""
+    # Large offset: a naive sum of squares would lose the variance entirely
+    values = np.random.default_rng(0).normal(1e9, 1.0, 200_003)
+    with patch("app.services.number_arrays.AGGREGATE_BLOCK", 1000):
+        result = aggregate(values, ["sum", "min", "max", "mean", "variance"], ddof=1)
+    assert result["count"] == values.size
+    assert math.isclose(result["sum"], math.fsum(values.tolist()), rel_tol=1e-15)
+    assert (result["min"], result["max"]) == (values.min(), values.max())
+    assert math.isclose(result["mean"], np.mean(values), rel_tol=1e-15)
+    assert math.isclose(result["variance"], np.var(values, ddof=1), rel_tol=1e-9)
+    assert list(result) == ["count", "sum", "min", "max", "mean", "variance"]
+
+
+def test_aggregate_of_nothing():
+    """Test that statistics undefined for an empty array are None."""
+    result = aggregate(np.array([]), ["sum", "product", "min", "mean", "variance", "quantiles"])
+    assert result == {"count": 0, "sum": 0.0, "product": 0, "min": None, "mean": None,
+                      "variance": None, "quantiles": None}
+    assert aggregate(np.array([5.0]), ["variance"], ddof=1)["variance"] is None
+
+
+def test_math_aggregate_several_arrays(client):
+    """Test that /math/aggregate computes each array's statistics in one request."""
+    payload = {
+        "arrays": [[1, 2, 3, 4], [10]],
+        "operations": ["sum", "product", "mean", "variance", "quantiles"],
+        "quantiles": [0, 0.5, 1],
+    }
+    response = client.post("/math/aggregate", json=payload)
+    assert response.status_code == 200
+    assert response.json() == {"results": [
+        {"count": 4, "sum": 10, "product": 24, "mean": 2.5, "variance": 1.25, "quantiles": [1, 2.5, 4]},
+        {"count": 1, "sum": 10, "product": 10, "mean": 10, "variance": 0, "quantiles": [10, 10, 10]},
+    ]}
+
+
+def test_math_aggregate_binary_body(client):
+    """Test that float64 and NDJSON bodies take the operations from the query string."""
+    body = np.array([3.0, 1.0, 2.0]).tobytes()
+    response = client.post("/math/aggregate?operations=min&operations=max", content=body, headers=FLOAT64)
+    assert response.json() == {"results": [{"count": 3, "min": 1, "max": 3}]}
+    response = client.post("/math/aggregate?operations=variance&ddof=1", content=b"1\n3\n", headers=NDJSON)
+    assert response.json() == {"results": [{"count": 2, "variance": 2}]}
+
+
+@pytest.mark.parametrize("request_args", [
+    {"json": {"numbers": [1], "arrays": [[1]], "operations": ["sum"]}},
+    {"json": {"numbers": [1], "operations": []}},
+    {"json": {"numbers": [1], "operations": ["median"]}},
+    {"json": {"numbers": [1], "operations": ["quantiles"], "quantiles": [1.5]}},
+    {"json": {"numbers": [1e308, 1e308], "operations": ["sum"]}},
+    {"content": b"1\n", "headers": NDJSON},
+    {"url": "/math/aggregate?operations=quantiles&quantiles=2", "content": b"1\n", "headers": NDJSON},
+])
+def test_math_aggregate_rejects_bad_requests(client, request_args):
+    """Test that invalid aggregate requests and non-finite results get 422."""
+    url = request_args.pop("url", "/math/aggregate")
+    assert client.post(url, **request_args).status_code == 422
@@ -5,9 +5,9 @@ This module tests the medications endpoint including authentication,
 CSV parsing, caching behavior, and error handling.
 """
 import os
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import pytest
-from fastapi import HTTPException, status
+from fastapi import HTTPException
 
 
 def test_meds_endpoint_requires_auth(client):
@@ -34,17 +34,9 @@ def test_meds_endpoint_with_invalid_credentials(client):
     "GITHUB_PAT": "fake_token",
     "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
 })
-@patch("app.services.github_client.get_http_client")
-def test_meds_endpoint_with_valid_credentials(mock_http_client, client):
+def test_meds_endpoint_with_valid_credentials(client, fake_github):
     """Test that /meds endpoint returns data with valid credentials."""
-    # Mock the HTTP response
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.text = "name,dosage,frequency\nAspirin,100mg,daily\nIbuprofen,200mg,twice daily"
-    
-    mock_client = MagicMock()
-    mock_client.get.return_value = mock_response
-    mock_http_client.return_value = mock_client
+    fake_github.csv_text = "name,dosage,frequency\nAspirin,100mg,daily\nIbuprofen,200mg,twice daily"
     
     response = client.get("/meds", auth=("testuser", "testpass"))
     assert response.status_code == 200
@@ -64,16 +56,9 @@ def test_meds_endpoint_with_valid_credentials(mock_http_client, client):
     "GITHUB_PAT": "fake_token",
     "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
 })
-@patch("app.services.github_client.get_http_client")
-def test_meds_endpoint_github_404(mock_http_client, client):
+def test_meds_endpoint_github_404(client, fake_github):
     """Test that /meds endpoint returns 404 when GitHub file not found."""
-    # Mock the HTTP response
-    mock_response = MagicMock()
-    mock_response.status_code = 404
-    
-    mock_client = MagicMock()
-    mock_client.get.return_value = mock_response
-    mock_http_client.return_value = mock_client
+    fake_github.status_code = 404
     
     response = client.get("/meds", auth=("testuser", "testpass"))
     assert response.status_code == 404
@@ -86,16 +71,9 @@ def test_meds_endpoint_github_404(mock_http_client, client):
     "GITHUB_PAT": "fake_token",
     "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
 })
-@patch("app.services.github_client.get_http_client")
-def test_meds_endpoint_github_401(mock_http_client, client):
+def test_meds_endpoint_github_401(client, fake_github):
     """Test that /meds endpoint returns 500 when GitHub auth fails."""
-    # Mock the HTTP response
-    mock_response = MagicMock()
-    mock_response.status_code = 401
-    
-    mock_client = MagicMock()
-    mock_client.get.return_value = mock_response
-    mock_http_client.return_value = mock_client
+    fake_github.status_code = 401
     
     response = client.get("/meds", auth=("testuser", "testpass"))
     assert response.status_code == 500
@@ -108,13 +86,10 @@ def test_meds_endpoint_github_401(mock_http_client, client):
     "GITHUB_PAT": "fake_token",
     "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
 })
-@patch("app.services.github_client.get_http_client")
-def test_meds_endpoint_connection_error(mock_http_client, client):
+def test_meds_endpoint_connection_error(client, fake_github):
     """Test that /meds endpoint handles connection errors gracefully."""
-    # Mock a connection error
-    mock_client = MagicMock()
-    mock_client.get.side_effect = Exception("Connection failed")
-    mock_http_client.return_value = mock_client
+    import httpx
+    fake_github.error = httpx.ConnectError("Connection failed")
     
     response = client.get("/meds", auth=("testuser", "testpass"))
     assert response.status_code == 502
@@ -129,17 +104,9 @@ def test_meds_endpoint_connection_error(mock_http_client, client):
     "GITHUB_PAT": "fake_token",
     "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
 })
-@patch("app.services.github_client.get_http_client")
-def test_meds_endpoint_empty_csv(mock_http_client, client):
+def test_meds_endpoint_empty_csv(client, fake_github):
     """Test that /meds endpoint handles empty CSV data."""
-    # Mock the HTTP response with empty CSV
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.text = ""
-    
-    mock_client = MagicMock()
-    mock_client.get.return_value = mock_response
-    mock_http_client.return_value = mock_client
+    fake_github.csv_text = ""
     
     response = client.get("/meds", auth=("testuser", "testpass"))
     # Should return error due to CSV validation
@@ -152,18 +119,8 @@ def test_meds_endpoint_empty_csv(mock_http_client, client):
     "GITHUB_PAT": "fake_token",
     "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
 })
-@patch("app.services.github_client.get_http_client")
-def test_meds_endpoint_caching(mock_http_client, client):
+def test_meds_endpoint_caching(client, fake_github):
     """Test that /meds endpoint caches responses."""
-    # Mock the HTTP response
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.text = "name,dosage\nAspirin,100mg"
-    
-    mock_client = MagicMock()
-    mock_client.get.return_value = mock_response
-    mock_http_client.return_value = mock_client
-    
     # First request
     response1 = client.get("/meds", auth=("testuser", "testpass"))
     assert response1.status_code == 200
@@ -173,7 +130,474 @@ def test_meds_endpoint_caching(mock_http_client, client):
     assert response2.status_code == 200
     
     # Should only call GitHub API once due to caching
-    assert mock_client.get.call_count == 1
+    assert len(fake_github.requests) == 1
     
     # Both responses should be identical
     assert response1.json() == response2.json()
+
+
+def test_get_cached_meds_sync_path(client, fake_github):
+    """Test that the sync get_cached_meds path uses the blocking client."""
+    from app.routes.meds import get_cached_meds
+
+    data = get_cached_meds()
+    assert data == [{"name": "Aspirin", "dosage": "100mg"}]
+    assert len(fake_github.requests) == 1
+    assert fake_github.sync_requests == 1
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+    "GITHUB_PAT": "fake_token",
+    "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
+})
+@patch("app.services.github_client.GITHUB_API_URL", "https://api.github.com/test")
+def test_lifespan_manages_async_client(client):
+    """Test that the app lifespan opens and closes the shared AsyncClient."""
+    from app.services import github_client
+
+    with client:
+        http_client = github_client._async_http_client
+        assert http_client is not None
+        assert not http_client.is_closed
+
+    assert github_client._async_http_client is None
+    assert http_client.is_closed
+
+
+@patch("app.services.github_client.GITHUB_API_URL", "https://api.github.com/test")
+def test_lifespan_restores_saved_snapshot(client, fake_github, tmp_path):
+    """Test that a restart serves the saved snapshot even while GitHub is down."""
+    from app.config import get_meds_cache_settings
+    from app.routes import meds
+
+    env = {
+        "MEDS_API_USERNAME": "testuser",
+        "MEDS_API_PASSWORD": "testpass",
+        "GITHUB_PAT": "fake_token",
+        "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv",
+        "MEDS_CACHE_SNAPSHOT_PATH": str(tmp_path / "meds.snapshot"),
+    }
+    with patch.dict(os.environ, env):
+        get_meds_cache_settings.cache_clear()
+        try:
+            before = client.get("/meds", auth=("testuser", "testpass"))
+            assert (tmp_path / "meds.snapshot").exists()
+
+            # Simulate a restart during a GitHub outage
+            meds.meds_cache.clear()
+            fake_github.error = ConnectionError("GitHub is down")
+            with client:
+                assert meds.meds_cache.snapshot is not None
+                after = client.get("/meds", auth=("testuser", "testpass"))
+        finally:
+            get_meds_cache_settings.cache_clear()
+
+    assert after.status_code == 200
+    assert after.content == before.content
+
+
+def test_concurrent_cache_misses_fetch_once(client, fake_github):
+    """Test that concurrent requests on an expired cache share one GitHub fetch."""
+    import asyncio
+    from app.routes import meds
+
+    fake_github.delay = 0.05
+    before = meds.meds_cache.flight.stats()
+
+    async def main():
+        return await asyncio.gather(*(meds.get_cached_meds_async() for _ in range(20)))
+
+    results = asyncio.run(main())
+    assert all(r == [{"name": "Aspirin", "dosage": "100mg"}] for r in results)
+    assert len(fake_github.requests) == 1
+
+    after = meds.meds_cache.flight.stats()
+    assert after["executions"] - before["executions"] == 1
+    assert after["coalesced"] - before["coalesced"] == 19
+
+
+def _expire_meds_cache():
+    """Ages the cached meds snapshot past its TTL so the next read refreshes it."""
+    from dataclasses import replace
+    from app.routes import meds
+
+    snapshot = meds.meds_cache.snapshot
+    meds.meds_cache.snapshot = replace(snapshot, fetched_at=snapshot.fetched_at - 10_000)
+
+
+@patch.dict(os.environ, {"MEDS_CACHE_REFRESH_MODE": "blocking"})
+def test_meds_conditional_refresh_not_modified(client, fake_github):
+    """Test that an unchanged upstream answers 304 and the parsed data is reused."""
+    from app.routes import meds
+    from app.config import get_meds_cache_settings
+    get_meds_cache_settings.cache_clear()
+
+    first = meds.get_cached_meds()
+    snapshot = meds.meds_cache.snapshot
+    assert snapshot.etag == fake_github.etag
+    assert "If-None-Match" not in fake_github.requests[0].headers
+
+    _expire_meds_cache()
+    with patch("app.services.dataset_registry.parse_meds_csv_columnar") as mock_parse:
+        second = meds.get_cached_meds()
+        mock_parse.assert_not_called()
+
+    assert fake_github.requests[1].headers["If-None-Match"] == fake_github.etag
+    # Same parsed object, only its freshness was extended
+    assert second is first
+    assert meds.meds_cache.snapshot.fetched_at > snapshot.fetched_at - 10_000
+    assert meds.meds_cache.stats()["not_modified"] == 1
+
+
+@patch.dict(os.environ, {"MEDS_CACHE_REFRESH_MODE": "blocking"})
+def test_meds_conditional_refresh_modified(client, fake_github):
+    """Test that a changed upstream file is downloaded and reparsed."""
+    import asyncio
+    from app.routes import meds
+    from app.config import get_meds_cache_settings
+    get_meds_cache_settings.cache_clear()
+
+    asyncio.run(meds.get_cached_meds_async())
+    old_etag = fake_github.etag
+
+    fake_github.csv_text = "name,dosage\nIbuprofen,200mg"
+    _expire_meds_cache()
+    data = asyncio.run(meds.get_cached_meds_async())
+
+    assert fake_github.requests[1].headers["If-None-Match"] == old_etag
+    assert data == [{"name": "Ibuprofen", "dosage": "200mg"}]
+    assert meds.meds_cache.snapshot.etag == fake_github.etag
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_response_etag_and_304(client, fake_github):
+    """Test that /meds carries a strong ETag and answers If-None-Match with 304."""
+    response = client.get("/meds", auth=("testuser", "testpass"))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert response.json() == {"count": 1, "items": [{"name": "Aspirin", "dosage": "100mg"}]}
+
+    not_modified = client.get(
+        "/meds", auth=("testuser", "testpass"), headers={"If-None-Match": etag}
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    changed = client.get(
+        "/meds", auth=("testuser", "testpass"), headers={"If-None-Match": '"other"'}
+    )
+    assert changed.status_code == 200
+    assert changed.content == response.content
+
+
+def test_meds_body_is_serialized_once_per_dataset(client, fake_github):
+    """Test that the response body is built at refresh time and reused afterwards."""
+    from app.routes import meds
+
+    first = meds.get_meds_dataset()
+    with patch("app.services.meds_dataset.orjson.dumps") as mock_dumps:
+        second = meds.get_meds_dataset()
+        mock_dumps.assert_not_called()
+    assert second.body is first.body
+
+
+def test_meds_declares_response_model(client):
+    """Test that /meds documents its response schema in OpenAPI."""
+    schema = client.get("/openapi.json").json()
+    response_schema = schema["paths"]["/meds"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert response_schema == {"$ref": "#/components/schemas/MedsResponse"}
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+])
+def test_etag_matches(header, expected):
+    """Test If-None-Match parsing for lists, wildcards and weak validators."""
+    from app.services.http_caching import etag_matches
+    assert etag_matches(header, '"abc"') is expected
+
+
+MEDS_CSV = (
+    "name,dosage,frequency\n"
+    "Aspirin,100mg,daily\n"
+    "Amoxicillin,500mg,twice daily\n"
+    "Ibuprofen,200mg,daily\n"
+    "aspirin,81mg,daily\n"
+)
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_pagination(client, fake_github):
+    """Test offset/limit pagination reports the total count and the next offset."""
+    fake_github.csv_text = MEDS_CSV
+    response = client.get("/meds?limit=2", auth=("testuser", "testpass"))
+    data = response.json()
+    assert data["count"] == 4
+    assert [item["name"] for item in data["items"]] == ["Aspirin", "Amoxicillin"]
+    assert data["next_offset"] == 2
+
+    response = client.get("/meds?limit=2&offset=2", auth=("testuser", "testpass"))
+    data = response.json()
+    assert [item["name"] for item in data["items"]] == ["Ibuprofen", "aspirin"]
+    assert "next_offset" not in data
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_field_projection(client, fake_github):
+    """Test that fields= limits each item to the requested columns."""
+    fake_github.csv_text = MEDS_CSV
+    response = client.get("/meds?fields=name,dosage&limit=1", auth=("testuser", "testpass"))
+    assert response.json()["items"] == [{"name": "Aspirin", "dosage": "100mg"}]
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_equality_and_prefix_filters(client, fake_github):
+    """Test exact and case-insensitive prefix filters, alone and combined."""
+    fake_github.csv_text = MEDS_CSV
+    auth = ("testuser", "testpass")
+
+    data = client.get("/meds?name=Aspirin", auth=auth).json()
+    assert data["count"] == 1
+    assert data["items"][0]["dosage"] == "100mg"
+
+    data = client.get("/meds?name__prefix=a", auth=auth).json()
+    assert [item["name"] for item in data["items"]] == ["Aspirin", "Amoxicillin", "aspirin"]
+
+    data = client.get("/meds?name__prefix=asp&frequency=daily&fields=dosage", auth=auth).json()
+    assert data == {"count": 2, "items": [{"dosage": "100mg"}, {"dosage": "81mg"}]}
+
+    data = client.get("/meds?name=Unknown", auth=auth).json()
+    assert data == {"count": 0, "items": []}
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_query_validation(client, fake_github):
+    """Test that unknown columns are rejected and page size is bounded."""
+    auth = ("testuser", "testpass")
+    assert client.get("/meds?color=red", auth=auth).status_code == 400
+    assert client.get("/meds?fields=name,color", auth=auth).status_code == 400
+    assert client.get("/meds?limit=0", auth=auth).status_code == 422
+    assert client.get("/meds?limit=100000", auth=auth).status_code == 422
+
+
+@patch.dict(os.environ, {"MEDS_CACHE_REFRESH_MODE": "blocking"})
+def test_meds_indexes_follow_dataset_swap(client, fake_github):
+    """Test that the indexes are rebuilt with each new dataset version."""
+    from app.routes import meds
+    from app.config import get_meds_cache_settings
+    get_meds_cache_settings.cache_clear()
+
+    old = meds.get_meds_dataset()
+    fake_github.csv_text = "name,dosage\nNaproxen,250mg"
+    _expire_meds_cache()
+    new = meds.get_meds_dataset()
+
+    assert new.index is not old.index
+    assert new.index.column("name").equal("Naproxen") == [0]
+    assert old.index.column("name").equal("Aspirin") == [0]
+
+
+def _large_csv(rows):
+    return "name,dosage\n" + "".join(f"Med-{i:06d},{i}mg\n" for i in range(rows))
+
+
+def test_meds_stream_parses_chunked_download(client, fake_github):
+    """Test that a chunked download is parsed incrementally into the full dataset."""
+    import asyncio
+    from app.routes import meds
+
+    fake_github.csv_text = _large_csv(500)
+    fake_github.chunk_size = 97
+
+    rows = asyncio.run(meds.get_cached_meds_async())
+    assert len(rows) == 500
+    assert rows[499]["name"] == "Med-000499"
+    assert fake_github.chunks_sent > 50
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_meds_stream_row_limit_stops_download(client, fake_github, async_path):
+    """Test that exceeding the row limit aborts the download instead of finishing it."""
+    import asyncio
+    from app.routes import meds
+
+    fake_github.csv_text = _large_csv(20_000)
+    fake_github.chunk_size = 1024
+    total_chunks = -(-len(fake_github.csv_text) // 1024)
+
+    with pytest.raises(HTTPException) as exc:
+        if async_path:
+            asyncio.run(meds.get_cached_meds_async())
+        else:
+            meds.get_cached_meds()
+
+    assert exc.value.status_code == 500
+    assert "row limit" in exc.value.detail
+    assert fake_github.chunks_sent < total_chunks
+
+
+@patch.dict(os.environ, {"MEDS_MAX_CSV_BYTES": "4096"})
+def test_meds_stream_byte_limit_stops_download(client, fake_github):
+    """Test that a body larger than MEDS_MAX_CSV_BYTES is rejected while streaming."""
+    import asyncio
+    from app.routes import meds
+
+    fake_github.csv_text = _large_csv(1_000)
+    fake_github.chunk_size = 1024
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(meds.get_cached_meds_async())
+
+    assert "byte limit" in exc.value.detail
+    assert fake_github.chunks_sent <= 6
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_ndjson_stream(client, fake_github):
+    """Test that Accept: application/x-ndjson streams one JSON object per line."""
+    import json
+    fake_github.csv_text = MEDS_CSV
+    auth = ("testuser", "testpass")
+
+    response = client.get("/meds", auth=auth, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["x-total-count"] == "4"
+    assert response.headers["vary"] == "Accept, Accept-Encoding"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["Aspirin", "Amoxicillin", "Ibuprofen", "aspirin"]
+
+    # The NDJSON representation has its own validator
+    etag = response.headers["etag"]
+    json_etag = client.get("/meds", auth=auth).headers["etag"]
+    assert etag != json_etag
+    not_modified = client.get(
+        "/meds", auth=auth,
+        headers={"Accept": "application/x-ndjson", "If-None-Match": etag}
+    )
+    assert not_modified.status_code == 304
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_csv_passthrough_and_filtered(client, fake_github):
+    """Test that unfiltered text/csv is the upstream body and filtered CSV is re-encoded."""
+    fake_github.csv_text = MEDS_CSV
+    auth = ("testuser", "testpass")
+    headers = {"Accept": "text/csv"}
+
+    response = client.get("/meds", auth=auth, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text == MEDS_CSV
+
+    response = client.get("/meds?name__prefix=a&fields=name&limit=2", auth=auth, headers=headers)
+    assert response.text.splitlines() == ["name", "Aspirin", "Amoxicillin"]
+    assert response.headers["x-total-count"] == "3"
+    assert response.headers["x-next-offset"] == "2"
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_content_negotiation(client, fake_github):
+    """Test that JSON stays the default and unsupported media types get 406."""
+    auth = ("testuser", "testpass")
+    response = client.get("/meds", auth=auth, headers={"Accept": "*/*"})
+    assert response.headers["content-type"] == "application/json"
+
+    response = client.get("/meds", auth=auth, headers={"Accept": "application/xml"})
+    assert response.status_code == 406
+
+    response = client.get("/meds?color=red", auth=auth, headers={"Accept": "text/csv"})
+    assert response.status_code == 400
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_msgpack(client, fake_github):
+    """Test that Accept: application/msgpack returns the JSON document as MessagePack, encoded once."""
+    import msgpack
+    from app.routes import meds
+    fake_github.csv_text = MEDS_CSV
+    auth = ("testuser", "testpass")
+    headers = {"Accept": "application/msgpack"}
+
+    response = client.get("/meds", auth=auth, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert response.headers["x-total-count"] == "4"
+    assert msgpack.unpackb(response.content) == client.get("/meds", auth=auth).json()
+    assert meds.meds_cache.snapshot.data.is_encoded("application/msgpack")
+
+    etag = response.headers["etag"]
+    assert etag != client.get("/meds", auth=auth).headers["etag"]
+    not_modified = client.get("/meds", auth=auth, headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+
+    response = client.get("/meds?name__prefix=a&limit=1", auth=auth, headers=headers)
+    assert msgpack.unpackb(response.content) == {
+        "count": 3,
+        "items": [{"name": "Aspirin", "dosage": "100mg", "frequency": "daily"}],
+        "next_offset": 1,
+    }
+
+
+@patch.dict(os.environ, {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+})
+def test_meds_arrow_stream(client, fake_github):
+    """Test that Accept: application/vnd.apache.arrow.stream returns the rows as an Arrow table."""
+    import pyarrow
+    import pyarrow.ipc
+    fake_github.csv_text = MEDS_CSV
+    auth = ("testuser", "testpass")
+    headers = {"Accept": "application/vnd.apache.arrow.stream"}
+
+    response = client.get("/meds", auth=auth, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    assert table.column_names == ["name", "dosage", "frequency"]
+    assert table.schema.field("name").type == pyarrow.string()
+    assert table.column("name").to_pylist() == ["Aspirin", "Amoxicillin", "Ibuprofen", "aspirin"]
+
+    response = client.get("/meds?frequency=daily&fields=name,dosage&limit=2", auth=auth, headers=headers)
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    assert table.to_pylist() == [{"name": "Aspirin", "dosage": "100mg"}, {"name": "Ibuprofen", "dosage": "200mg"}]
+    assert response.headers["x-total-count"] == "3"
+    assert response.headers["x-next-offset"] == "2"
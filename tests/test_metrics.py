@@ -0,0 +1,181 @@
+"""
+Tests for the Prometheus metrics registry and the /metrics endpoint.
+
+This module tests metric rendering, request metrics recorded by the
+middleware, and the cache, GitHub fetch and CSV parse metrics.
+"""
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import get_github_settings
+from app.middleware.metrics import MetricsMiddleware
+from app.routes.meds import meds_cache
+from app.services.csv_parser import parse_meds_csv_columnar
+from app.services.metrics import (
+    CSV_LAST_PARSE_ROWS,
+    CSV_PARSES,
+    GITHUB_FETCHES,
+    GITHUB_RETRIES,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    REGISTRY,
+    Counter,
+    Histogram,
+    Registry,
+)
+
+TEST_ENV = {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+    "GITHUB_PAT": "fake_token",
+    "MEDS_FILE_URL": "https://api.github.com/repos/test/test/contents/meds.csv"
+}
+
+
+def test_counter_renders_labels_and_escapes_values():
+    """Test that counters render one sample per label set with escaped values."""
+    counter = Counter("jobs_total", "Jobs run.", ("kind",))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    counter.inc('say "hi"\n')
+
+    lines = counter.render()
+    assert lines[:2] == ["# HELP jobs_total Jobs run.", "# TYPE jobs_total counter"]
+    assert 'jobs_total{kind="a"} 3' in lines
+    assert 'jobs_total{kind="say \\"hi\\"\\n"} 1' in lines
+
+
+def test_counter_rejects_wrong_label_count():
+    """Test that rendering fails loudly when a sample has the wrong labels."""
+    counter = Counter("jobs_total", "Jobs run.", ("kind",))
+    counter.inc()
+    with pytest.raises(ValueError):
+        counter.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test that histogram buckets, sum and count follow the exposition format."""
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 3.65" in lines
+    assert "latency_seconds_count 4" in lines
+
+
+def test_registry_renders_every_metric():
+    """Test that the registry output ends with a newline and includes each metric."""
+    registry = Registry()
+    registry.counter("a_total", "A.").inc()
+    registry.gauge("b", "B.").set(2.5)
+
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "a_total 1" in text
+    assert "b 2.5" in text
+
+
+def test_metrics_endpoint(client):
+    """Test that /metrics is public and uses the Prometheus content type."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+
+
+def test_request_metrics_use_route_templates():
+    """Test that request metrics are labelled by route template, not raw path."""
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    before = HTTP_REQUESTS.value("/items/{item_id}", "GET", "200")
+    client.get("/items/1")
+    client.get("/items/2")
+    assert HTTP_REQUESTS.value("/items/{item_id}", "GET", "200") == before + 2
+    assert HTTP_REQUEST_DURATION.count("/items/{item_id}", "GET") >= 2
+
+    invalid = HTTP_REQUESTS.value("/items/{item_id}", "GET", "422")
+    client.get("/items/abc")
+    assert HTTP_REQUESTS.value("/items/{item_id}", "GET", "422") == invalid + 1
+
+    unmatched = HTTP_REQUESTS.value("unmatched", "GET", "404")
+    client.get("/no-such-path")
+    assert HTTP_REQUESTS.value("unmatched", "GET", "404") == unmatched + 1
+
+    # Made-up methods share one label value
+    other = HTTP_REQUESTS.value("unmatched", "other", "404")
+    client.request("FOOBAR", "/no-such-path")
+    client.request("BAZ", "/no-such-path")
+    assert HTTP_REQUESTS.value("unmatched", "other", "404") == other + 2
+    assert "FOOBAR" not in REGISTRY.render()
+
+
+def test_app_records_request_metrics(client):
+    """Test that the application records metrics for its own routes."""
+    before = HTTP_REQUESTS.value("/health", "GET", "200")
+    client.get("/health")
+    assert HTTP_REQUESTS.value("/health", "GET", "200") == before + 1
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_meds_metrics_cover_cache_and_github(client, fake_github):
+    """Test that /meds reads show up as cache hits/misses and GitHub fetches."""
+    fake_github.csv_text = "name,dosage\nAspirin,100mg\nIbuprofen,200mg"
+    fetches = GITHUB_FETCHES.value("200")
+    hits, misses = meds_cache.hits, meds_cache.misses
+
+    client.get("/meds", auth=("testuser", "testpass"))
+    client.get("/meds", auth=("testuser", "testpass"))
+
+    assert GITHUB_FETCHES.value("200") == fetches + 1
+    text = client.get("/metrics").text
+    assert f'dataset_cache_misses_total{{dataset="meds"}} {misses + 1}' in text
+    assert f'dataset_cache_hits_total{{dataset="meds"}} {hits + 1}' in text
+    assert 'dataset_cache_age_seconds{dataset="meds"}' in text
+    assert CSV_LAST_PARSE_ROWS.value() == 2
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_github_errors_are_counted_by_status(client, fake_github):
+    """Test that failed GitHub fetches are counted with their status."""
+    fake_github.status_code = 404
+    not_found = GITHUB_FETCHES.value("404")
+    client.get("/meds", auth=("testuser", "testpass"))
+    assert GITHUB_FETCHES.value("404") == not_found + 1
+
+    # Every attempt is counted: the first request and its retries
+    fake_github.status_code = 200
+    fake_github.error = ConnectionError("boom")
+    errors = GITHUB_FETCHES.value("error")
+    retries = GITHUB_RETRIES.value("error")
+    client.get("/meds", auth=("testuser", "testpass"))
+    attempts = 1 + get_github_settings().max_retries
+    assert GITHUB_FETCHES.value("error") == errors + attempts
+    assert GITHUB_RETRIES.value("error") == retries + attempts - 1
+
+
+def test_csv_parse_outcomes_are_counted():
+    """Test that parses are counted by outcome and successful ones record rows."""
+    ok = CSV_PARSES.value("ok")
+    errors = CSV_PARSES.value("error")
+
+    parse_meds_csv_columnar("name\nA\nB\nC")
+    with pytest.raises(ValueError):
+        parse_meds_csv_columnar("")
+
+    assert CSV_PARSES.value("ok") == ok + 1
+    assert CSV_PARSES.value("error") == errors + 1
+    assert CSV_LAST_PARSE_ROWS.value() == 3
@@ -0,0 +1,235 @@
+"""
+Tests for the per-client rate limiting middleware.
+
+This module tests token bucket accounting, route rule selection, bounded
+bucket storage and the 429 responses produced by the middleware.
+"""
+import base64
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import (
+    DEFAULT_RATE_LIMIT_RULES,
+    RateLimitRule,
+    RateLimitSettings,
+    get_rate_limit_settings,
+    parse_rate_limit_rules,
+)
+from app.middleware.rate_limit import RateLimiter, RateLimitMiddleware, client_key
+from app.security import auth
+from app.security.auth import AUTHENTICATED_USER
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter(clock, **settings):
+    settings = {
+        "rules": (
+            RateLimitRule("/meds", rate=1, burst=2),
+            RateLimitRule("/", rate=10, burst=10),
+        ),
+        **settings
+    }
+    return RateLimiter(RateLimitSettings(**settings), clock=clock)
+
+
+def test_bucket_allows_burst_then_refills():
+    """Test that a client can spend its burst and then waits for refill."""
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+
+    assert limiter.acquire("ip:1", "/meds") == (True, 0.0)
+    assert limiter.acquire("ip:1", "/meds") == (True, 0.0)
+    allowed, retry_after = limiter.acquire("ip:1", "/meds")
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert limiter.acquire("ip:1", "/meds")[0]
+    assert limiter.rejected == 1
+
+
+def test_clients_and_routes_have_separate_buckets():
+    """Test that limits apply per client and per route rule."""
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    for _ in range(2):
+        limiter.acquire("ip:1", "/meds")
+
+    assert not limiter.acquire("ip:1", "/meds/changes")[0]
+    assert limiter.acquire("ip:2", "/meds")[0]
+    assert limiter.acquire("ip:1", "/health")[0]
+    assert limiter.acquire("ip:1", "/medsx")[0]
+
+
+def test_rule_for_uses_longest_prefix():
+    """Test that the most specific path prefix wins."""
+    limiter = make_limiter(FakeClock())
+    assert limiter.rule_for("/meds").path_prefix == "/meds"
+    assert limiter.rule_for("/meds/search").path_prefix == "/meds"
+    assert limiter.rule_for("/math/add").path_prefix == "/"
+    assert RateLimiter(RateLimitSettings(rules=())).rule_for("/meds") is None
+
+
+def test_default_rules_give_search_its_own_limit():
+    """Test that the default rules limit type-ahead search apart from, and more loosely than, /meds."""
+    limiter = RateLimiter(RateLimitSettings(rules=parse_rate_limit_rules(DEFAULT_RATE_LIMIT_RULES)))
+    search = limiter.rule_for("/meds/search")
+    meds = limiter.rule_for("/meds")
+    assert search == RateLimitRule("/meds/search", 10.0, 40.0)
+    assert limiter.rule_for("/meds/changes") == meds
+    assert search.rate > meds.rate and search.burst > meds.burst
+
+
+def test_buckets_are_bounded_and_idle_ones_evicted():
+    """Test that bucket storage is capped and idle buckets are dropped."""
+    clock = FakeClock()
+    limiter = make_limiter(clock, max_clients=3, idle_seconds=60)
+    for i in range(5):
+        limiter.acquire(f"ip:{i}", "/health")
+    assert len(limiter) == 3
+
+    clock.now += 61
+    limiter.acquire("ip:new", "/health")
+    assert len(limiter) == 1
+
+
+def test_parse_rate_limit_rules():
+    """Test parsing of RATE_LIMIT_RULES and rejection of malformed entries."""
+    assert parse_rate_limit_rules("/meds=2:10, /=5") == (
+        RateLimitRule("/meds", 2.0, 10.0),
+        RateLimitRule("/", 5.0, 5.0),
+    )
+    for value in ["meds=1:1", "/meds=fast", "/meds=0:1", "/meds=1:0.5"]:
+        with pytest.raises(RuntimeError):
+            parse_rate_limit_rules(value)
+
+
+@patch.dict(os.environ, {"RATE_LIMIT_RULES": "/meds=1:3", "RATE_LIMIT_ENABLED": "false"})
+def test_rate_limit_settings_from_environment():
+    """Test that RATE_LIMIT_* environment variables configure the limiter."""
+    get_rate_limit_settings.cache_clear()
+    try:
+        settings = get_rate_limit_settings()
+        assert settings.enabled is False
+        assert settings.rules == (RateLimitRule("/meds", 1.0, 3.0),)
+    finally:
+        get_rate_limit_settings.cache_clear()
+
+
+@pytest.mark.parametrize("env", [
+    {"RATE_LIMIT_MAX_CLIENTS": "0"},
+    {"RATE_LIMIT_MAX_CLIENTS": "-5"},
+    {"RATE_LIMIT_IDLE_SECONDS": "0"},
+    {"RATE_LIMIT_IDLE_SECONDS": "-1"},
+])
+def test_invalid_rate_limit_settings(env):
+    """Test that bucket limits which would disable or break eviction fail fast with RuntimeError."""
+    get_rate_limit_settings.cache_clear()
+    try:
+        with patch.dict(os.environ, env):
+            with pytest.raises(RuntimeError):
+                get_rate_limit_settings()
+    finally:
+        get_rate_limit_settings.cache_clear()
+
+
+def make_app(limiter):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+
+    @app.get("/meds")
+    def meds():
+        return {"ok": True}
+
+    return app
+
+
+@patch.dict(os.environ, {"MEDS_API_USERNAME": "alice", "MEDS_API_PASSWORD": "secret"})
+def test_middleware_returns_429_with_retry_after():
+    """Test that an exhausted client gets 429 with a Retry-After header."""
+    client = TestClient(make_app(make_limiter(FakeClock())))
+
+    assert client.get("/meds").status_code == 200
+    assert client.get("/meds").status_code == 200
+    response = client.get("/meds")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+    # Authenticated users get a bucket of their own, apart from anonymous calls
+    assert client.get("/meds", auth=("alice", "secret")).status_code == 200
+
+
+@patch.dict(os.environ, {"MEDS_API_USERNAME": "alice", "MEDS_API_PASSWORD": "secret"})
+def test_middleware_ignores_invalid_credentials_for_keying():
+    """Test that made-up usernames share the caller's IP bucket."""
+    client = TestClient(make_app(make_limiter(FakeClock())))
+    statuses = [
+        client.get("/meds", auth=(f"user{i}", "guess")).status_code
+        for i in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+
+@patch.dict(os.environ, {"MEDS_API_USERNAME": "alice", "MEDS_API_PASSWORD": "secret"})
+def test_clients_sharing_credentials_are_keyed_by_ip():
+    """Test that clients sending the same valid credentials from different IPs get separate keys."""
+    authorization = b"Basic " + base64.b64encode(b"alice:secret")
+
+    def scope(ip):
+        return {"type": "http", "client": (ip, 1234), "headers": [(b"authorization", authorization)]}
+
+    first, second = scope("10.0.0.1"), scope("10.0.0.2")
+    assert client_key(first) == "user:alice@10.0.0.1"
+    assert client_key(second) == "user:alice@10.0.0.2"
+    assert first[AUTHENTICATED_USER] == "alice"
+
+
+@patch.dict(os.environ, {"MEDS_API_USERNAME": "alice", "MEDS_API_PASSWORD": "secret"})
+def test_credentials_are_checked_once_per_request():
+    """Test that the middleware's credential check is reused by the route's auth dependency."""
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=make_limiter(FakeClock()))
+
+    @app.get("/meds", dependencies=[Depends(auth.verify_credentials)])
+    def meds():
+        return {"ok": True}
+
+    # One username and one password comparison
+    with patch.object(auth.secrets, "compare_digest", wraps=auth.secrets.compare_digest) as spy:
+        response = TestClient(app).get("/meds", auth=("alice", "secret"))
+    assert response.status_code == 200
+    assert spy.call_count == 2
+
+
+def test_middleware_disabled():
+    """Test that RATE_LIMIT_ENABLED=false lets every request through."""
+    limiter = make_limiter(FakeClock(), enabled=False)
+    client = TestClient(make_app(limiter))
+    assert all(client.get("/meds").status_code == 200 for _ in range(5))
+
+
+def test_app_rate_limits_meds_by_ip(client):
+    """Test that the application limits /meds more strictly than /health."""
+    statuses = [client.get("/meds").status_code for _ in range(12)]
+    assert statuses[:10] == [401] * 10
+    assert statuses[10:] == [429, 429]
+    assert client.get("/health").status_code == 200
+
+
+def test_app_allows_type_ahead_search(client):
+    """Test that a burst of keystroke searches is not cut off by the /meds limit."""
+    statuses = [client.get("/meds/search", params={"q": "ibuprofen"[:n]}).status_code for n in range(1, 10)]
+    statuses += [client.get("/meds/search?q=ibu").status_code for _ in range(11)]
+    assert 429 not in statuses
+    assert client.get("/meds").status_code == 401
@@ -0,0 +1,348 @@
+"""
+Tests for the failure handling of GitHub requests.
+
+This module tests the circuit breaker, jittered backoff and latency window
+on their own, then retries, hedged requests, timeouts and failing fast
+(or serving stale data) through the GitHub client against a fake GitHub.
+"""
+import asyncio
+import os
+import threading
+import time
+from dataclasses import replace
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.config import get_github_settings
+from app.services.github_client import _pool_limits, _timeout, upstream_policy
+from app.services.metrics import GITHUB_HEDGES, GITHUB_RETRIES
+from app.services.resilience import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    ConcurrencyLimit,
+    LatencyWindow,
+    backoff_delay,
+)
+
+AUTH = ("testuser", "testpass")
+TEST_ENV = {
+    "MEDS_API_USERNAME": "testuser",
+    "MEDS_API_PASSWORD": "testpass",
+    "GITHUB_PAT": "fake_token",
+    "MEDS_CACHE_REFRESH_MODE": "blocking",
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def github_env():
+    """Applies GITHUB_* settings for one test, on top of the fake_github ones."""
+    def apply(**env):
+        patcher = patch.dict(os.environ, {f"GITHUB_{name.upper()}": str(value) for name, value in env.items()})
+        patcher.start()
+        patchers.append(patcher)
+        get_github_settings.cache_clear()
+
+    patchers = []
+    yield apply
+    for patcher in reversed(patchers):
+        patcher.stop()
+    get_github_settings.cache_clear()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    """Test that the circuit opens after the threshold and refuses calls until reset."""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10, clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.stats()["consecutive_failures"] == 0
+
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert not breaker.allow()
+    clock.now = 4
+    assert breaker.retry_after() == 6
+    assert breaker.stats() == {"state": CIRCUIT_OPEN, "consecutive_failures": 3, "opened": 1, "rejected": 1}
+
+
+def test_breaker_half_open_lets_one_trial_through():
+    """Test that one trial call decides whether an open circuit closes."""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=clock)
+    breaker.allow()
+    breaker.record_failure()
+
+    clock.now = 10
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN and breaker.opened == 2
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+def test_backoff_is_exponential_with_full_jitter():
+    """Test that the backoff bound doubles up to the cap and is scaled by the jitter."""
+    assert [backoff_delay(n, 0.1, 1.0, random=lambda: 1.0) for n in range(5)] == [0.1, 0.2, 0.4, 0.8, 1.0]
+    assert backoff_delay(3, 0.1, 1.0, random=lambda: 0.5) == 0.4
+    assert backoff_delay(3, 0.1, 1.0, random=lambda: 0.0) == 0.0
+
+
+def test_latency_percentile():
+    """Test that percentiles need enough samples and only use the recent ones."""
+    window = LatencyWindow(size=100)
+    assert window.percentile(95) is None
+    for ms in range(1, 201):
+        window.observe(ms / 1000)
+    assert len(window) == 100
+    assert window.percentile(50) == 0.151
+    assert window.percentile(95) == 0.196
+    assert window.percentile(95, min_samples=101) is None
+
+
+def test_concurrency_limit_is_shared_by_threads_and_loops():
+    """Test that a slot held by a thread makes a coroutine wait, and a freed slot goes to the waiter."""
+    limit = ConcurrencyLimit(1)
+    limit.acquire()
+
+    async def main():
+        waiter = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        threading.Thread(target=limit.release).start()
+        await asyncio.wait_for(waiter, 1)
+        assert limit.active == 1
+
+    asyncio.run(main())
+    limit.release()
+    assert limit.active == 0
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    """Test that cancelling a waiter, before or right after it is handed a slot, leaks nothing."""
+    limit = ConcurrencyLimit(1)
+
+    async def main():
+        await limit.acquire_async()
+        queued = asyncio.ensure_future(limit.acquire_async())
+        handed = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.sleep(0)
+        # The slot is scheduled for handed, which is cancelled before it runs
+        limit.release()
+        handed.cancel()
+        await asyncio.gather(queued, handed, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert limit.active == 0
+        async with limit:
+            assert limit.active == 1
+
+    asyncio.run(main())
+    assert limit.active == 0
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_transient_failures_are_retried(client, fake_github):
+    """Test that connection errors and 5xx answers are retried until GitHub answers."""
+    retries = GITHUB_RETRIES.value("503")
+    fake_github.script = [httpx.ConnectError("reset"), 503]
+    response = client.get("/meds", auth=AUTH)
+    assert response.status_code == 200
+    assert len(fake_github.requests) == 3
+    assert GITHUB_RETRIES.value("503") == retries + 1
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_retries_are_bounded(client, fake_github, github_env):
+    """Test that a failure outlasting the retries reaches the caller as a 502."""
+    github_env(max_retries=1)
+    fake_github.status_code = 500
+    response = client.get("/meds", auth=AUTH)
+    assert response.status_code == 502
+    assert len(fake_github.requests) == 2
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_client_errors_and_long_retry_after_are_not_retried(client, fake_github):
+    """Test that 404s, and 429s asking for a longer wait than allowed, fail at once."""
+    fake_github.status_code = 404
+    assert client.get("/meds", auth=AUTH).status_code == 404
+    assert len(fake_github.requests) == 1
+
+    fake_github.script = [httpx.Response(429, headers={"Retry-After": "60"})]
+    assert client.get("/meds", auth=AUTH).status_code == 502
+    assert len(fake_github.requests) == 2
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_only_http_errors_become_502(client, fake_github, caplog):
+    """Test that HTTP errors are logged and answered with 502, while bugs propagate unchanged."""
+    fake_github.script = [httpx.DecodingError("bad gzip")]
+    assert client.get("/meds", auth=AUTH).status_code == 502
+    assert "Request to https://api.github.com/test failed." in caplog.text
+    assert "DecodingError" in caplog.text
+
+    fake_github.script = [KeyError("etag")]
+    with pytest.raises(KeyError):
+        client.get("/meds", auth=AUTH)
+    assert upstream_policy("https://api.github.com/test").breaker.state == CIRCUIT_CLOSED
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_open_circuit_fails_fast(client, fake_github, github_env):
+    """Test that repeated failures open the circuit, which refuses requests without calling GitHub."""
+    github_env(max_retries=0, breaker_failures=2)
+    fake_github.status_code = 503
+    assert client.get("/meds", auth=AUTH).status_code == 502
+    assert client.get("/meds", auth=AUTH).status_code == 502
+
+    response = client.get("/meds", auth=AUTH)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) == 30
+    assert len(fake_github.requests) == 2
+    metrics = client.get("/metrics").text
+    assert 'github_circuit_state{host="api.github.com"} 2' in metrics
+    assert 'github_circuit_rejected_total{host="api.github.com"} 1' in metrics
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_open_circuit_serves_cached_data(client, fake_github, github_env):
+    """Test that an expired snapshot within its grace window is served while the circuit is open."""
+    from app.routes import meds
+
+    github_env(breaker_failures=1)
+    before = client.get("/meds", auth=AUTH)
+    snapshot = meds.meds_cache.snapshot
+    meds.meds_cache.snapshot = replace(snapshot, fetched_at=snapshot.fetched_at - 400)
+    policy = upstream_policy("https://api.github.com/test")
+    policy.breaker.allow()
+    policy.breaker.record_failure()
+
+    after = client.get("/meds", auth=AUTH)
+    assert after.status_code == 200
+    assert after.content == before.content
+    assert len(fake_github.requests) == 1
+    assert meds.meds_cache.stats()["stale_served"] == 1
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_circuit_closes_after_a_successful_trial(client, fake_github, github_env):
+    """Test that after the reset time one trial request goes through and closes the circuit."""
+    github_env(max_retries=0, breaker_failures=1, breaker_reset_seconds=0.05)
+    fake_github.status_code = 503
+    client.get("/meds", auth=AUTH)
+    assert client.get("/meds", auth=AUTH).status_code == 503
+
+    fake_github.status_code = 200
+    time.sleep(0.06)
+    assert client.get("/meds", auth=AUTH).status_code == 200
+    assert upstream_policy("https://api.github.com/test").breaker.state == CIRCUIT_CLOSED
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_slow_request_is_hedged(client, fake_github, github_env):
+    """Test that a request slower than the latency percentile is raced by a second one."""
+    github_env(hedge_enabled="true", hedge_min_samples=5)
+    policy = upstream_policy("https://api.github.com/test")
+    for _ in range(5):
+        policy.latencies.observe(0.01)
+
+    async def handler(request):
+        # The first request hangs, the hedge answers at once
+        if len(fake_github.requests) == 0:
+            fake_github.requests.append(request)
+            await asyncio.sleep(5)
+        return fake_github.respond(request)
+
+    sent, won = GITHUB_HEDGES.value("sent"), GITHUB_HEDGES.value("won")
+    async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.github_client.get_async_http_client", return_value=async_client):
+        start = time.perf_counter()
+        response = client.get("/meds", auth=AUTH)
+        elapsed = time.perf_counter() - start
+    assert response.status_code == 200
+    assert elapsed < 1
+    assert len(fake_github.requests) == 2
+    assert (GITHUB_HEDGES.value("sent"), GITHUB_HEDGES.value("won")) == (sent + 1, won + 1)
+
+
+@patch.dict(os.environ, TEST_ENV)
+def test_fast_request_is_not_hedged(client, fake_github, github_env):
+    """Test that requests answering within the percentile, or before enough samples, are sent once."""
+    from app.routes import meds
+
+    github_env(hedge_enabled="true", hedge_min_samples=5)
+    sent = GITHUB_HEDGES.value("sent")
+    fake_github.delay = 0.02
+    client.get("/meds", auth=AUTH)
+    assert len(fake_github.requests) == 1
+
+    policy = upstream_policy("https://api.github.com/test")
+    for _ in range(5):
+        policy.latencies.observe(1.0)
+    meds.meds_cache.clear()
+    client.get("/meds", auth=AUTH)
+    assert len(fake_github.requests) == 2
+    assert GITHUB_HEDGES.value("sent") == sent
+
+
+def test_connect_and_read_timeouts(github_env):
+    """Test that connecting and reading have their own timeouts."""
+    github_env(connect_timeout_seconds=1.5, read_timeout_seconds=20)
+    timeout = _timeout()
+    assert (timeout.connect, timeout.pool) == (1.5, 1.5)
+    assert (timeout.read, timeout.write) == (20, 20)
+
+
+def test_pool_limits(github_env):
+    """Test that the connection pool limits come from the GitHub settings."""
+    github_env(max_connections=3, max_keepalive=1, keepalive_expiry=5)
+    limits = _pool_limits()
+    assert (limits.max_connections, limits.max_keepalive_connections, limits.keepalive_expiry) == (3, 1, 5)
+
+
+@pytest.mark.parametrize("env", [
+    {"GITHUB_CONNECT_TIMEOUT_SECONDS": "0"},
+    {"GITHUB_MAX_RETRIES": "-1"},
+    {"GITHUB_RETRY_BASE_SECONDS": "5", "GITHUB_RETRY_MAX_SECONDS": "1"},
+    {"GITHUB_HEDGE_PERCENTILE": "100"},
+    {"GITHUB_BREAKER_FAILURES": "0"},
+    {"GITHUB_MAX_CONNECTIONS": "0"},
+    {"GITHUB_MAX_CONNECTIONS": "abc"},
+    {"GITHUB_KEEPALIVE_EXPIRY": "-1"},
+    {"MEDS_MAX_CSV_BYTES": "abc"},
+    {"MEDS_MAX_CSV_BYTES": "0"},
+])
+def test_invalid_github_settings(env):
+    """Test that invalid GitHub request policies fail fast with RuntimeError."""
+    get_github_settings.cache_clear()
+    try:
+        with patch.dict(os.environ, env):
+            with pytest.raises(RuntimeError):
+                get_github_settings()
+    finally:
+        get_github_settings.cache_clear()
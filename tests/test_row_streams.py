@@ -0,0 +1,47 @@
+"""
+Tests for the chunked NDJSON and CSV row encoders.
+
+This module tests that the streaming encoders produce complete output in
+bounded-size chunks.
+"""
+import asyncio
+import json
+
+from app.services.row_streams import iter_bytes_chunks, iter_csv_chunks, iter_ndjson_chunks
+
+ROWS = [{"name": f"Med-{i}", "dosage": f"{i}mg"} for i in range(100)]
+
+
+def collect(chunks):
+    async def main():
+        return [chunk async for chunk in chunks]
+    return asyncio.run(main())
+
+
+def test_ndjson_chunks_are_bounded_and_complete():
+    """Test that NDJSON output is split into chunks near the target size."""
+    chunks = collect(iter_ndjson_chunks(ROWS, chunk_size=256))
+    assert len(chunks) > 5
+    assert all(len(chunk) < 256 + 64 for chunk in chunks)
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+
+
+def test_csv_chunks_include_header_and_quote_values():
+    """Test that CSV output has a header and escapes values that need quoting."""
+    rows = ROWS + [{"name": 'Quote "and", comma', "dosage": None}]
+    chunks = collect(iter_csv_chunks(rows, ["name", "dosage"], chunk_size=256))
+    assert len(chunks) >= 5
+    text = b"".join(chunks).decode()
+    lines = text.splitlines()
+    assert lines[0] == "name,dosage"
+    assert lines[1] == "Med-0,0mg"
+    assert lines[-1] == '"Quote ""and"", comma",'
+
+
+def test_bytes_chunks():
+    """Test that a pre-encoded body is sliced without loss."""
+    body = bytes(range(256)) * 10
+    chunks = collect(iter_bytes_chunks(body, chunk_size=1000))
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 560]
+    assert b"".join(chunks) == body
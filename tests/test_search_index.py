@@ -0,0 +1,127 @@
+"""
+Tests for medication search.
+
+This module tests how the search index ranks prefix, word, substring and
+typo-tolerant matches, that it is built with each dataset version, and the
+/meds/search endpoint.
+"""
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app.services.csv_parser import parse_meds_csv_columnar
+from app.services.meds_dataset import build_meds_dataset, decode_meds_dataset, encode_meds_dataset
+from app.services.search_index import SearchIndex, trigrams
+
+AUTH = ("testuser", "testpass")
+ENV = {"MEDS_API_USERNAME": "testuser", "MEDS_API_PASSWORD": "testpass"}
+
+NAMES = [
+    "Ibuprofen",
+    "Ibuprofen Lysine",
+    "Aspirin",
+    "Children's Aspirin",
+    "Paracetamol",
+    "Naproxen Sodium",
+    "Dexibuprofen",
+    "Metformin",
+]
+CSV_TEXT = "name,dosage\n" + "\n".join(f'"{name}",{i}mg' for i, name in enumerate(NAMES))
+
+
+def search(query, limit=10, names=NAMES):
+    return [names[position] for position in SearchIndex(names).search(query, limit)]
+
+
+def test_trigrams_pad_the_ends():
+    """Test that trigrams mark the start and end of a value."""
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+
+
+def test_exact_then_prefix_matches():
+    """Test that an exact match ranks before longer names with the same prefix."""
+    assert search("ibuprofen") == ["Ibuprofen", "Ibuprofen Lysine", "Dexibuprofen"]
+    assert search("IBU", limit=2) == ["Ibuprofen", "Ibuprofen Lysine"]
+
+
+def test_word_then_substring_matches():
+    """Test that later words rank after prefixes and before substrings."""
+    assert search("aspirin") == ["Aspirin", "Children's Aspirin"]
+    assert search("sodium") == ["Naproxen Sodium"]
+    assert search("profen") == ["Dexibuprofen", "Ibuprofen", "Ibuprofen Lysine"]
+
+
+def test_typos_are_tolerated():
+    """Test that misspelled queries still find similar names."""
+    assert search("ibuprofin")[0] == "Ibuprofen"
+    assert search("metfromin") == ["Metformin"]
+    assert search("paracetamal") == ["Paracetamol"]
+    assert search("zzzz") == []
+
+
+def test_limit_counts_rows():
+    """Test that the limit applies to rows, including rows with the same name."""
+    names = ["Aspirin", "aspirin", "Aspirin Plus"]
+    assert search("asp", limit=2, names=names) == ["Aspirin", "aspirin"]
+    assert search("asp", limit=1, names=names) == ["Aspirin"]
+    assert search("asp", limit=0, names=names) == []
+    assert search("  ", names=names) == []
+
+
+def test_index_skips_empty_values():
+    """Test that missing names are not indexed."""
+    index = SearchIndex(["Aspirin", None, ""])
+    assert len(index) == 1
+    assert index.search("a") == [0]
+
+
+def test_search_index_is_built_with_the_dataset():
+    """Test that the index is built during the refresh and rebuilt lazily from snapshots."""
+    dataset = build_meds_dataset(parse_meds_csv_columnar(CSV_TEXT), CSV_TEXT)
+    assert dataset.is_searchable
+    assert dataset.evolve(version=2).is_searchable
+
+    decoded = decode_meds_dataset(encode_meds_dataset(dataset))
+    assert not decoded.is_searchable
+    assert decoded.search_body("aspirin") == dataset.search_body("aspirin")
+
+
+@patch.dict(os.environ, ENV)
+def test_meds_search_endpoint(client, fake_github):
+    """Test that /meds/search returns whole rows, best match first."""
+    fake_github.csv_text = CSV_TEXT
+    response = client.get("/meds/search?q=aspirin", auth=AUTH)
+    assert response.status_code == 200
+    assert response.json() == {
+        "query": "aspirin",
+        "count": 2,
+        "items": [{"name": "Aspirin", "dosage": "2mg"}, {"name": "Children's Aspirin", "dosage": "3mg"}],
+    }
+    assert "x-dataset-version" in response.headers
+
+    limited = client.get("/meds/search?q=ibu&limit=1", auth=AUTH)
+    assert [item["name"] for item in limited.json()["items"]] == ["Ibuprofen"]
+
+    cached = client.get("/meds/search?q=aspirin", auth=AUTH, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+
+@patch.dict(os.environ, ENV)
+def test_meds_search_without_name_column(client, fake_github):
+    """Test that a dataset without a name column has no results rather than an error."""
+    fake_github.csv_text = "drug,dosage\nAspirin,100mg"
+    assert client.get("/meds/search?q=asp", auth=AUTH).json() == {"query": "asp", "count": 0, "items": []}
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("", 422),
+    ("?q=", 422),
+    ("?q=a&limit=0", 422),
+    ("?q=a&limit=101", 422),
+])
+@patch.dict(os.environ, ENV)
+def test_meds_search_validation(client, query, expected):
+    """Test that a query is required and the limit is bounded."""
+    assert client.get(f"/meds/search{query}", auth=AUTH).status_code == expected
+    assert client.get("/meds/search?q=a").status_code == 401
@@ -0,0 +1,195 @@
+"""
+Tests for the snapshot shared between worker processes.
+
+This module tests publishing and mapping snapshot files, sharing one upstream
+fetch among several workers, and the shared mode of the /meds cache.
+"""
+import os
+import threading
+import time
+from unittest.mock import patch
+
+from app.config import CacheSettings, get_meds_cache_settings
+from app.services.csv_parser import parse_meds_csv_columnar
+from app.services.github_client import FetchResult
+from app.services.meds_dataset import build_meds_dataset, decode_meds_dataset, encode_meds_dataset
+from app.services.shared_snapshot import SharedFetch, SharedSnapshotStore
+
+
+class FakeUpstream:
+    """Upstream stand-in that serves text with an ETag and honours If-None-Match."""
+
+    def __init__(self, text="name\nAspirin", etag='"v1"', delay=0.0):
+        self.text = text
+        self.etag = etag
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, etag=None, last_modified=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if etag == self.etag:
+            return FetchResult(etag=self.etag, not_modified=True)
+        return FetchResult(text=self.text, etag=self.etag)
+
+    async def fetch_async(self, etag=None, last_modified=None):
+        return self.fetch(etag, last_modified)
+
+
+def make_worker(upstream, path, **settings):
+    """A SharedFetch as one worker process would build it."""
+    settings = CacheSettings(shared_path=str(path), **settings)
+    return SharedFetch(
+        fetch=upstream.fetch,
+        fetch_async=upstream.fetch_async,
+        parse=lambda text: text.encode(),
+        encode=lambda data: {"data": data},
+        decode=lambda sections: bytes(sections["data"]),
+        settings=lambda: settings
+    )
+
+
+def test_store_publish_and_read(tmp_path):
+    """Test that published sections read back with versions and validators."""
+    store = SharedSnapshotStore(str(tmp_path / "snapshot"))
+    assert store.read() is None
+
+    first = store.publish({"a": b"hello", "b": b""}, 100.0, '"e1"', "Mon")
+    assert first.version == 1
+    assert bytes(first.sections["a"]) == b"hello"
+    assert bytes(first.sections["b"]) == b""
+    assert (first.fetched_at, first.etag, first.last_modified) == (100.0, '"e1"', "Mon")
+
+    second = store.publish({"a": b"world"}, 200.0)
+    assert second.version == 2
+    assert bytes(second.sections["a"]) == b"world"
+    # The old mapping stays valid after the file is replaced
+    assert bytes(first.sections["a"]) == b"hello"
+
+
+def test_store_reuses_mapping_until_file_changes(tmp_path):
+    """Test that reading an unchanged file returns the same mapped snapshot."""
+    store = SharedSnapshotStore(str(tmp_path / "snapshot"))
+    store.publish({"a": b"x"}, 1.0)
+    assert store.read() is store.read()
+
+    other = SharedSnapshotStore(str(tmp_path / "snapshot"))
+    other.publish({"a": b"y"}, 2.0)
+    assert bytes(store.read().sections["a"]) == b"y"
+
+
+def test_store_ignores_corrupt_file(tmp_path):
+    """Test that an unreadable snapshot file is treated as missing."""
+    path = tmp_path / "snapshot"
+    path.write_bytes(b"garbage")
+    assert SharedSnapshotStore(str(path)).read() is None
+
+
+def test_workers_share_one_upstream_fetch(tmp_path):
+    """Test that a second worker adopts the snapshot published by the first."""
+    upstream = FakeUpstream()
+    first = make_worker(upstream, tmp_path / "snapshot")
+    second = make_worker(upstream, tmp_path / "snapshot")
+
+    result = first.fetch()
+    assert result.data == b"name\nAspirin"
+    adopted = second.fetch()
+    assert adopted.data == b"name\nAspirin"
+    assert adopted.etag == '"v1"'
+    assert adopted.fetched_at == result.fetched_at
+    assert upstream.calls == 1
+
+    # A worker that already holds the shared version only revalidates
+    assert second.fetch(etag='"v1"').not_modified
+
+
+def test_concurrent_workers_fetch_once(tmp_path):
+    """Test that workers refreshing at the same time make one upstream call."""
+    upstream = FakeUpstream(delay=0.05)
+    workers = [make_worker(upstream, tmp_path / "snapshot") for _ in range(8)]
+    results = []
+
+    threads = [threading.Thread(target=lambda w=w: results.append(w.fetch())) for w in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert upstream.calls == 1
+    assert [result.data for result in results] == [b"name\nAspirin"] * 8
+
+
+def test_expired_snapshot_is_revalidated_and_renewed(tmp_path):
+    """Test that an expired snapshot is revalidated with the shared validators."""
+    upstream = FakeUpstream()
+    worker = make_worker(upstream, tmp_path / "snapshot", ttl_seconds=10, refresh_ahead_seconds=0)
+    worker.fetch()
+    store = worker.store()
+    first = store.read()
+
+    with patch("app.services.shared_snapshot.time.time", return_value=time.time() + 60):
+        result = worker.fetch(etag='"v1"')
+
+    assert upstream.calls == 2
+    assert result.not_modified
+    renewed = store.read()
+    assert renewed.version == first.version + 1
+    assert renewed.fetched_at > first.fetched_at
+    assert bytes(renewed.sections["data"]) == b"name\nAspirin"
+
+
+def test_without_shared_path_calls_upstream_directly(tmp_path):
+    """Test that shared mode is off when no path is configured."""
+    upstream = FakeUpstream()
+    worker = make_worker(upstream, "")
+    assert worker.store() is None
+    assert worker.fetch().text == "name\nAspirin"
+    assert worker.fetch().text == "name\nAspirin"
+    assert upstream.calls == 2
+
+
+def test_meds_dataset_round_trip(tmp_path):
+    """Test that a decoded dataset serves mapped bodies and parses rows lazily."""
+    csv_text = "name,dosage\nAspirin,100mg\nIbuprofen,200mg"
+    dataset = build_meds_dataset(parse_meds_csv_columnar(csv_text), csv_text)
+    store = SharedSnapshotStore(str(tmp_path / "snapshot"))
+    snapshot = store.publish(encode_meds_dataset(dataset), 1.0)
+
+    decoded = decode_meds_dataset(snapshot.sections)
+    assert isinstance(decoded.body, memoryview)
+    assert bytes(decoded.body) == dataset.body
+    assert decoded.etag == dataset.etag
+    assert bytes(decoded.csv_body) == dataset.csv_body
+    assert decoded.columns == ["name", "dosage"]
+    assert not decoded.is_loaded
+    assert decoded.rows == dataset.rows
+    assert decoded.index.column("name").equal("Ibuprofen") == [1]
+    assert decoded.is_loaded
+
+
+def test_meds_shared_mode(client, fake_github, tmp_path):
+    """Test that /meds publishes a shared snapshot and other workers reuse it."""
+    fake_github.csv_text = "name,dosage\nAspirin,100mg\nIbuprofen,200mg"
+    env = {
+        "MEDS_API_USERNAME": "testuser",
+        "MEDS_API_PASSWORD": "testpass",
+        "MEDS_CACHE_SHARED_PATH": str(tmp_path / "meds.snapshot"),
+    }
+    with patch.dict(os.environ, env):
+        get_meds_cache_settings.cache_clear()
+        first = client.get("/meds", auth=("testuser", "testpass"))
+        assert os.path.exists(tmp_path / "meds.snapshot")
+
+        # A worker with an empty cache maps the snapshot instead of fetching
+        from app.routes import meds
+        meds.meds_cache.clear()
+        second = client.get("/meds", auth=("testuser", "testpass"))
+        filtered = client.get("/meds?name=Ibuprofen", auth=("testuser", "testpass"))
+    get_meds_cache_settings.cache_clear()
+
+    assert len(fake_github.requests) == 1
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert filtered.json()["items"] == [{"name": "Ibuprofen", "dosage": "200mg"}]
@@ -0,0 +1,162 @@
+"""
+Tests for the single-flight request coalescing helper.
+
+This module tests that concurrent thread-based and asyncio callers share
+one execution per key, including a failed execution.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def test_threads_share_one_execution():
+    """Test that concurrent threads for the same key run the function once."""
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "value"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait()
+
+    followers = [
+        threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+        for _ in range(5)
+    ]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["value"] * 6
+    assert flight.stats() == {"executions": 1, "coalesced": 5, "in_flight": 0}
+
+
+def test_threads_share_failure():
+    """Test that a failed execution is raised to every waiting thread."""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join()
+
+    assert errors == ["upstream down"] * 4
+    assert flight.stats()["executions"] == 1
+
+
+def test_async_callers_share_one_execution():
+    """Test that concurrent coroutines for the same key await one execution."""
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("k", slow) for _ in range(10)))
+
+    assert asyncio.run(main()) == [42] * 10
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 9
+
+
+def test_async_callers_share_failure():
+    """Test that a failed async execution is raised to every waiting coroutine."""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.do_async("k", failing) for _ in range(3)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.stats()["executions"] == 1
+
+
+def test_async_caller_joins_thread_execution():
+    """Test that an asyncio caller can wait on an execution led by a thread."""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.1)
+        return "shared"
+
+    leader = threading.Thread(target=lambda: flight.do("k", slow))
+    leader.start()
+    started.wait()
+
+    async def unused():
+        raise AssertionError("should have joined the thread execution")
+
+    assert asyncio.run(flight.do_async("k", unused)) == "shared"
+    leader.join()
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    """Test that cancelling the caller that started a refresh does not cancel it."""
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async("k", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async("k", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_sequential_calls_run_separately():
+    """Test that calls after an execution completes start a new one."""
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+    assert flight.stats() == {"executions": 2, "coalesced": 0, "in_flight": 0}